@@ -8,21 +8,37 @@
  * Communication Protocol:
  * - GUI to ESP32:
  *   - "START,<duration_sec>" -> Begins the depassivation test.
+ *   - "PROFILE_BEGIN,<steps>,<id>" -> Starts downloading a load profile (stored in flash).
+ *   - "PROFILE_STEP,<index>,<on_ms>,<off_ms>,<count>" -> One step: load on/off for on_ms/off_ms, count times.
+ *   - "PROFILE_END" -> Completes the download.
+ *   - "PROFILE_QUERY" -> Asks which profile is stored.
+ *   - "START_PROFILE" -> Runs the stored profile as a depassivation test.
  *   - "ABORT" -> Stops the current test.
  *   - "SET_MODE,<IDLE|TEST|LIVE>" -> Sets the device's operational mode.
  *   - "SET_MOSFET,<1|0>" -> Manually controls the MOSFET in LIVE mode.
+ *   - "BURST,<window_ms>" -> Captures <window_ms> of back-to-back samples when a test connects the load (0 = off).
  * - ESP32 to GUI:
- *   - "DATA,<time_ms>,<voltage_V>,<current_mA>" -> Sends a data point during a test.
- *   - "LIVE_DATA,<voltage_V>,<current_mA>,<power_mW>,<resistance_Ohm>" -> Sends live data points.
+ *   - "DATA,<time_ms>,<voltage_V>,<current_mA>,<power_mW>,<resistance_Ohm>|<seq>*<crc>" -> Sends a data point during a test.
+ *   - "LIVE_DATA,<voltage_V>,<current_mA>,<power_mW>,<resistance_Ohm>|<seq>*<crc>" -> Sends live data points.
+ *     <seq> numbers samples from 0 at PROCESS_START and on entering LIVE mode; <crc> is the
+ *     CRC-16/CCITT-FALSE of everything before the '*', as 4 hex digits (omitted if SEND_CHECKSUM is false).
+ *   - "BURST_BEGIN,<samples>,<start_ms>" -> A burst was captured at <start_ms>; its samples follow.
+ *   - "BURST_DATA,<first_index>,<t_us>:<voltage_V>:<current_mA>,...|<chunk>*<crc>" -> Up to 8 burst samples,
+ *     t_us counted from the moment the load closed.
+ *   - "BURST_END,<samples>" -> The burst upload is complete (always before PROCESS_END).
  *   - "BTN_PRESS,<START|ABORT|MEASURE>" -> Notifies GUI of a physical button press.
+ *   - "STEP,<time_ms>,<index>" -> A profile step has begun.
+ *   - "PROFILE_OK,<id>,<total_ms>" / "PROFILE_ERROR,<reason>" -> Result of a profile download.
+ *   - "PROFILE_LOADED,<id|NONE>" -> Reply to PROFILE_QUERY.
  *   - "PROCESS_START" -> Acknowledges the start of the test.
- *   - "PROCESS_END: [message]" -> Signals the end of the test.
+ *   - "PROCESS_END: [message]|<count>*<crc>" -> Signals the end of the test and how many samples were sent.
  *   - "FATAL: [message]" -> Reports a critical error.
  */
 
 #include <Arduino.h>
 #include <Wire.h>
 #include <Adafruit_INA219.h>
+#include <Preferences.h>
 
 // --- Pin Definitions ---
 // High-Power Control
@@ -41,6 +57,7 @@ const int BTN_MEASURE_PIN = 34;
 
 // --- Global Objects ---
 Adafruit_INA219 ina219;
+Preferences preferences;
 
 // --- State Machine ---
 enum State { IDLE, TEST_RUNNING, FINISHING, LIVE_VIEW, SUCCESS, FAILED };
@@ -51,8 +68,44 @@ unsigned long processStartTime = 0;
 unsigned long depassivationDurationMs = 0;
 unsigned long lastMeasurementTime = 0;
 const long measurementIntervalMs = 100;
+unsigned long sampleSequence = 0;   // Number of the next DATA/LIVE_DATA line
+const bool SEND_CHECKSUM = true;
+
+// --- Burst Capture ---
+// The load-connect transient is over in a few hundred ms, so it is sampled back to back
+// into RAM and uploaded afterwards, a line per loop pass between the regular samples.
+struct BurstSample {
+    uint32_t tUs;
+    float voltage_V;
+    float current_mA;
+};
+const int BURST_MAX_SAMPLES = 4000;       // 48 KB
+const int BURST_SAMPLES_PER_LINE = 8;
+BurstSample burstBuffer[BURST_MAX_SAMPLES];
+unsigned long burstWindowMs = 0;          // 0 = off
+int burstCount = 0;
+int burstSent = -1;                       // Next sample to upload, -1 when nothing is pending
 unsigned long stateChangeTime = 0; // For timed states like SUCCESS/FAILED
 
+// --- Load Profiles ---
+// Each step connects the load for onMs, then disconnects it for offMs, count times.
+struct ProfileStep {
+    unsigned long onMs;
+    unsigned long offMs;
+    unsigned long count;
+};
+const int MAX_PROFILE_STEPS = 32;
+ProfileStep profileSteps[MAX_PROFILE_STEPS];
+int profileStepCount = 0;          // Steps of the stored profile, 0 if none
+String profileId = "NONE";
+ProfileStep pendingSteps[MAX_PROFILE_STEPS];
+int pendingStepCount = -1;         // Steps expected by the download in progress, -1 if none
+String pendingId;
+bool pendingReceived[MAX_PROFILE_STEPS];
+bool profileRunning = false;
+int currentStep = 0;
+unsigned long stepStartTime = 0;
+
 // --- Button Debouncing ---
 const int DEBOUNCE_DELAY_MS = 50;
 bool lastStartState = LOW, lastAbortState = LOW, lastMeasureState = LOW;
@@ -64,6 +117,17 @@ void handleButtons();
 void startDepassivationProcess(unsigned long duration);
 void stopDepassivationProcess(String message);
 void measureAndLogTestData();
+void logTestSample();
+void handleProfileCommand(String command);
+void loadStoredProfile();
+void startProfile();
+void runProfile();
+void announceStep();
+void setLoad(bool on);
+void captureBurst(unsigned long windowMs);
+void uploadBurstLine();
+void sendFramed(const String &payload, unsigned long sequence);
+void sendSample(const String &payload);
 void measureAndLogLiveData();
 void setRgbColor(int r, int g, int b);
 void updateLed();
@@ -73,6 +137,7 @@ void setState(State newState);
 //  SETUP
 // =================================================================
 void setup() {
+    Serial.setRxBufferSize(1024); // A profile download arrives as a quick burst of short lines
     Serial.begin(115200);
     Serial.println("ESP32 Battery Analyzer Initialized.");
 
@@ -98,8 +163,10 @@ void setup() {
         setState(FAILED); // Enter permanent FAILED state
         while (1) { updateLed(); delay(10); } // Loop forever with error signal
     }
+    Wire.setClock(400000); // Fast-mode I2C, so burst reads are limited by the INA219 conversion time
 
     Serial.println("INA219 sensor found. Ready.");
+    loadStoredProfile();
     setState(IDLE);
 }
 
@@ -110,9 +177,14 @@ void loop() {
     handleSerialCommands();
     handleButtons();
     updateLed();
+    uploadBurstLine();
 
     switch (currentState) {
         case TEST_RUNNING:
+            if (profileRunning) {
+                runProfile();
+                break;
+            }
             // If the test duration has passed, move to the FINISHING state
             if (millis() - processStartTime >= depassivationDurationMs) {
                 setState(FINISHING);
@@ -171,6 +243,7 @@ void setState(State newState) {
             break;
         case LIVE_VIEW:
             setRgbColor(255, 255, 255); // White
+            sampleSequence = 0;
             break;
         case SUCCESS:
             // Flashing Green will be handled by updateLed
@@ -191,7 +264,11 @@ void handleSerialCommands() {
         String command = Serial.readStringUntil('\n');
         command.trim();
 
-        if (command.startsWith("START")) {
+        if (command.startsWith("PROFILE_")) {
+            handleProfileCommand(command);
+        } else if (command.equalsIgnoreCase("START_PROFILE")) {
+            startProfile();
+        } else if (command.startsWith("START")) {
             int firstComma = command.indexOf(',');
             String durationStr = command.substring(firstComma + 1);
             startDepassivationProcess(durationStr.toInt() * 1000);
@@ -207,6 +284,9 @@ void handleSerialCommands() {
             } else if (modeStr.equalsIgnoreCase("IDLE")) {
                 setState(IDLE);
             }
+        } else if (command.startsWith("BURST,")) {
+            long windowMs = command.substring(command.indexOf(',') + 1).toInt();
+            burstWindowMs = windowMs > 0 ? windowMs : 0;
         } else if (command.startsWith("SET_MOSFET") && currentState == LIVE_VIEW) {
             String stateStr = command.substring(command.indexOf(',') + 1);
             bool is_on = stateStr.toInt() == 1;
@@ -260,16 +340,23 @@ void startDepassivationProcess(unsigned long duration) {
         setState(TEST_RUNNING);
         processStartTime = millis();
         lastMeasurementTime = 0; // Ensure first measurement happens immediately
+        sampleSequence = 0;
         depassivationDurationMs = duration;
+        if (burstWindowMs > 0) {
+            captureBurst(burstWindowMs);
+        }
         Serial.println("Starting measurements...");
     }
 }
 
 void stopDepassivationProcess(String message) {
-    digitalWrite(MOSFET_GATE_PIN, LOW);
-    digitalWrite(MOSFET_LED_PIN, LOW);
+    profileRunning = false;
+    setLoad(false);
     Serial.println("Load disconnected.");
-    Serial.println("PROCESS_END: " + message);
+    while (burstSent >= 0) {
+        uploadBurstLine();
+    }
+    sendFramed("PROCESS_END: " + message, sampleSequence);
 }
 
 void measureAndLogTestData() {
@@ -278,6 +365,14 @@ void measureAndLogTestData() {
     digitalWrite(MOSFET_LED_PIN, HIGH);
     delay(50); // Short delay to stabilize voltage after load is applied
 
+    logTestSample();
+
+    // Turn off load after sending data
+    digitalWrite(MOSFET_GATE_PIN, LOW);
+    digitalWrite(MOSFET_LED_PIN, LOW);
+}
+
+void logTestSample() {
     float busVoltage_V = ina219.getBusVoltage_V();
     float shuntVoltage_mV = ina219.getShuntVoltage_mV();
     float current_mA = ina219.getCurrent_mA();
@@ -288,20 +383,8 @@ void measureAndLogTestData() {
         resistance_Ohm = (loadVoltage_V * 1000) / current_mA;
     }
 
-    Serial.print("DATA,");
-    Serial.print(millis() - processStartTime);
-    Serial.print(",");
-    Serial.print(loadVoltage_V, 3);
-    Serial.print(",");
-    Serial.print(current_mA, 2);
-    Serial.print(",");
-    Serial.print(power_mW, 2);
-    Serial.print(",");
-    Serial.println(resistance_Ohm, 2);
-
-    // Turn off load after sending data
-    digitalWrite(MOSFET_GATE_PIN, LOW);
-    digitalWrite(MOSFET_LED_PIN, LOW);
+    sendSample("DATA," + String(millis() - processStartTime) + "," + String(loadVoltage_V, 3) + "," +
+               String(current_mA, 2) + "," + String(power_mW, 2) + "," + String(resistance_Ohm, 2));
 }
 
 void measureAndLogLiveData() {
@@ -317,14 +400,210 @@ void measureAndLogLiveData() {
         resistance_Ohm = (loadVoltage_V * 1000) / current_mA;
     }
 
-    Serial.print("LIVE_DATA,");
-    Serial.print(loadVoltage_V, 3);
-    Serial.print(",");
-    Serial.print(current_mA, 2);
-    Serial.print(",");
-    Serial.print(power_mW, 2);
+    sendSample("LIVE_DATA," + String(loadVoltage_V, 3) + "," + String(current_mA, 2) + "," +
+               String(power_mW, 2) + "," + String(resistance_Ohm, 2));
+}
+
+// CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF), the same as Python's binascii.crc_hqx(data, 0xFFFF)
+uint16_t crc16(const String &text) {
+    uint16_t crc = 0xFFFF;
+    for (unsigned int i = 0; i < text.length(); i++) {
+        crc ^= (uint16_t)(uint8_t)text[i] << 8;
+        for (int bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+// Appends the "|<sequence>*<crc>" trailer the GUI uses to detect lost and corrupted lines
+void sendFramed(const String &payload, unsigned long sequence) {
+    String line = payload + "|" + String(sequence);
+    if (SEND_CHECKSUM) {
+        char crc[6];
+        snprintf(crc, sizeof(crc), "*%04X", crc16(line));
+        line += crc;
+    }
+    Serial.println(line);
+}
+
+void sendSample(const String &payload) {
+    sendFramed(payload, sampleSequence++);
+}
+
+// Connects the load and samples as fast as the INA219 allows for windowMs. Blocks for the window.
+void captureBurst(unsigned long windowMs) {
+    setLoad(true);
+    unsigned long startUs = micros();
+    unsigned long startMs = millis() - processStartTime;
+    burstCount = 0;
+    while (burstCount < BURST_MAX_SAMPLES && micros() - startUs < windowMs * 1000UL) {
+        float shuntVoltage_mV = ina219.getShuntVoltage_mV();
+        float busVoltage_V = ina219.getBusVoltage_V();
+        float current_mA = ina219.getCurrent_mA();
+        burstBuffer[burstCount].tUs = micros() - startUs;
+        burstBuffer[burstCount].voltage_V = busVoltage_V + (shuntVoltage_mV / 1000.0);
+        burstBuffer[burstCount].current_mA = current_mA;
+        burstCount++;
+    }
+    Serial.println("BURST_BEGIN," + String(burstCount) + "," + String(startMs));
+    burstSent = 0;
+}
+
+// Sends the next BURST_DATA line of a captured burst, or BURST_END after the last one
+void uploadBurstLine() {
+    if (burstSent < 0) return;
+    if (burstSent >= burstCount) {
+        Serial.println("BURST_END," + String(burstCount));
+        burstSent = -1;
+        return;
+    }
+    int chunk = burstSent / BURST_SAMPLES_PER_LINE;
+    String line = "BURST_DATA," + String(burstSent);
+    for (int k = 0; k < BURST_SAMPLES_PER_LINE && burstSent < burstCount; k++, burstSent++) {
+        const BurstSample &sample = burstBuffer[burstSent];
+        line += "," + String(sample.tUs) + ":" + String(sample.voltage_V, 3) + ":" + String(sample.current_mA, 2);
+    }
+    sendFramed(line, chunk);
+}
+
+// =================================================================
+//  Load Profiles
+// =================================================================
+void handleProfileCommand(String command) {
+    if (currentState == TEST_RUNNING || currentState == FINISHING) {
+        Serial.println("PROFILE_ERROR,Busy");
+        return;
+    }
+    if (command.equalsIgnoreCase("PROFILE_QUERY")) {
+        Serial.println("PROFILE_LOADED," + profileId);
+    } else if (command.startsWith("PROFILE_BEGIN")) {
+        int firstComma = command.indexOf(',');
+        int secondComma = command.indexOf(',', firstComma + 1);
+        int steps = command.substring(firstComma + 1, secondComma).toInt();
+        if (firstComma < 0 || secondComma < 0 || steps < 1 || steps > MAX_PROFILE_STEPS) {
+            pendingStepCount = -1;
+            Serial.println("PROFILE_ERROR,Invalid step count");
+            return;
+        }
+        pendingStepCount = steps;
+        pendingId = command.substring(secondComma + 1);
+        for (int i = 0; i < MAX_PROFILE_STEPS; i++) pendingReceived[i] = false;
+    } else if (command.startsWith("PROFILE_STEP")) {
+        // PROFILE_STEP,<index>,<on_ms>,<off_ms>,<count>
+        long fields[4];
+        int start = command.indexOf(',') + 1;
+        for (int f = 0; f < 4; f++) {
+            int comma = command.indexOf(',', start);
+            fields[f] = (comma < 0 ? command.substring(start) : command.substring(start, comma)).toInt();
+            start = comma + 1;
+        }
+        int index = fields[0];
+        if (pendingStepCount < 0 || index < 0 || index >= pendingStepCount
+                || fields[1] < 0 || fields[2] < 0 || fields[1] + fields[2] == 0 || fields[3] < 1) {
+            pendingStepCount = -1;
+            Serial.println("PROFILE_ERROR,Invalid step");
+            return;
+        }
+        pendingSteps[index] = { (unsigned long)fields[1], (unsigned long)fields[2], (unsigned long)fields[3] };
+        pendingReceived[index] = true;
+    } else if (command.equalsIgnoreCase("PROFILE_END")) {
+        if (pendingStepCount < 0) {
+            Serial.println("PROFILE_ERROR,No download in progress");
+            return;
+        }
+        unsigned long totalMs = 0;
+        for (int i = 0; i < pendingStepCount; i++) {
+            if (!pendingReceived[i]) {
+                pendingStepCount = -1;
+                Serial.println("PROFILE_ERROR,Missing step " + String(i));
+                return;
+            }
+            totalMs += (pendingSteps[i].onMs + pendingSteps[i].offMs) * pendingSteps[i].count;
+        }
+        memcpy(profileSteps, pendingSteps, sizeof(ProfileStep) * pendingStepCount);
+        profileStepCount = pendingStepCount;
+        profileId = pendingId;
+        pendingStepCount = -1;
+
+        // Kept in flash so the GUI only downloads a profile again when it changes
+        preferences.begin("profile", false);
+        preferences.putBytes("steps", profileSteps, sizeof(ProfileStep) * profileStepCount);
+        preferences.putInt("count", profileStepCount);
+        preferences.putString("id", profileId);
+        preferences.end();
+        Serial.println("PROFILE_OK," + profileId + "," + String(totalMs));
+    }
+}
+
+void loadStoredProfile() {
+    preferences.begin("profile", true);
+    int count = preferences.getInt("count", 0);
+    if (count > 0 && count <= MAX_PROFILE_STEPS
+            && preferences.getBytes("steps", profileSteps, sizeof(ProfileStep) * count) == sizeof(ProfileStep) * count) {
+        profileStepCount = count;
+        profileId = preferences.getString("id", "NONE");
+    }
+    preferences.end();
+}
+
+void startProfile() {
+    if (currentState != IDLE) return;
+    if (profileStepCount == 0) {
+        Serial.println("PROCESS_END: No profile loaded.");
+        return;
+    }
+    Serial.println("PROCESS_START");
+    setState(TEST_RUNNING);
+    processStartTime = millis();
+    lastMeasurementTime = 0;
+    sampleSequence = 0;
+    profileRunning = true;
+    currentStep = 0;
+    stepStartTime = processStartTime;
+    announceStep();
+    // Only the first on-phase is captured, so the burst never changes the profile's timing
+    unsigned long firstOnMs = profileSteps[0].onMs;
+    if (burstWindowMs > 0 && firstOnMs > 0) {
+        captureBurst(min(burstWindowMs, firstOnMs));
+    }
+}
+
+// Called on every loop pass; edges are derived from millis() so they do not drift
+void runProfile() {
+    unsigned long now = millis();
+    unsigned long period = profileSteps[currentStep].onMs + profileSteps[currentStep].offMs;
+    unsigned long stepDuration = period * profileSteps[currentStep].count;
+    if (now - stepStartTime >= stepDuration) {
+        stepStartTime += stepDuration;
+        currentStep++;
+        if (currentStep >= profileStepCount) {
+            stopDepassivationProcess("Process completed successfully.");
+            setState(SUCCESS);
+            return;
+        }
+        announceStep();
+        period = profileSteps[currentStep].onMs + profileSteps[currentStep].offMs;
+    }
+    setLoad((now - stepStartTime) % period < profileSteps[currentStep].onMs);
+
+    // Samples are taken under whatever load the profile applies at that moment
+    if (now - lastMeasurementTime >= measurementIntervalMs) {
+        lastMeasurementTime = now;
+        logTestSample();
+    }
+}
+
+void announceStep() {
+    Serial.print("STEP,");
+    Serial.print(stepStartTime - processStartTime);
     Serial.print(",");
-    Serial.println(resistance_Ohm, 2);
+    Serial.println(currentStep);
+}
+
+void setLoad(bool on) {
+    digitalWrite(MOSFET_GATE_PIN, on ? HIGH : LOW);
+    digitalWrite(MOSFET_LED_PIN, on ? HIGH : LOW);
 }
 
 // =================================================================
@@ -0,0 +1,394 @@
+"""
+Acquisition in a separate process.
+
+A child process owns the serial port and the database writer (an
+IngestJournal), so a slow redraw or History query in the GUI can delay what is
+shown but never what is stored. It publishes to the GUI through:
+
+  - SampleRing: a multiprocessing.shared_memory ring of fixed-size records
+    holding every parsed DATA and LIVE_DATA sample, plus a few counters. There
+    is one writer (the child) and one reader (the Tk thread). The writer never
+    waits: a reader that falls more than RING_CAPACITY samples behind loses
+    the oldest ones from the display, and they are counted as overruns. Storage
+    does not depend on the reader.
+  - Two queues: commands from the GUI (lines to send, the cycle samples belong
+    to, stop) and events from the child. Events are every other line, each
+    tagged with the ring position at the time, so the GUI handles it after
+    exactly the samples that preceded it on the wire.
+
+The child stores a DATA sample only while a cycle is set, drops duplicates
+with its own StreamMonitor, and flushes the journal before it forwards
+PROCESS_END, so a cycle's readings are committed before the GUI finalizes it.
+
+AcquisitionClient has the SerialHandler interface, except that connect()
+returns at once and reports through app.handle_connected() when the child is
+ready, so the window never waits on the port. Enable with
+"acquisition_process": true in config.json or
+`python main.py --acquisition-process`.
+"""
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import serial
+from serial.tools import list_ports
+
+from ingest_journal import JOURNAL_FILE, IngestJournal
+from stream_integrity import StreamMonitor, unframe
+
+RING_CAPACITY = 1 << 16   # samples; about 1.8 h of 10 Hz data before a stalled GUI loses display points
+POLL_INTERVAL_MS = 20
+READ_TIMEOUT_S = 0.02
+CONNECT_TIMEOUT_S = 10.0
+
+KIND_DATA = 1
+KIND_LIVE = 2
+RECORD_DTYPE = np.dtype([
+    ("kind", "u1"),
+    ("sequence", "i8"),     # -1 without a sequence number
+    ("cycle_id", "i8"),     # -1 outside a cycle
+    ("time_ms", "i8"),
+    ("voltage", "f8"),
+    ("current", "f8"),
+    ("power", "f8"),
+    ("resistance", "f8"),
+    ("read_time", "f8"),    # perf_counter() at read; system-wide, so comparable across processes
+])
+# Header slots (uint64), written by the child only; OLDEST_UNAPPLIED is the lowest cycle id
+# with samples not yet committed, 0 if none. SAMPLES_STORED and DB_WRITE_ERRORS are bumped as
+# journal batches commit or fail
+WRITE_COUNT, LINES_RECEIVED, READ_ERRORS, SAMPLES_STORED, OLDEST_UNAPPLIED, DB_WRITE_ERRORS = range(6)
+HEADER_SLOTS = 8
+
+
+class SampleRing:
+    """Single-writer, single-reader ring of RECORD_DTYPE records in shared memory."""
+    def __init__(self, shm, capacity):
+        self.shm = shm
+        self.capacity = capacity
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.uint64, buffer=shm.buf)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE, buffer=shm.buf, offset=self.header.nbytes)
+        self.read_count = 0
+        self.overruns = 0
+
+    @classmethod
+    def create(cls, capacity=RING_CAPACITY):
+        size = HEADER_SLOTS * 8 + capacity * RECORD_DTYPE.itemsize
+        ring = cls(shared_memory.SharedMemory(create=True, size=size), capacity)
+        ring.header[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, capacity):
+        return cls(shared_memory.SharedMemory(name=name), capacity)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_count(self):
+        return int(self.header[WRITE_COUNT])
+
+    def write(self, kind, sequence, cycle_id, time_ms, voltage, current, power, resistance, read_time):
+        count = int(self.header[WRITE_COUNT])
+        self.records[count % self.capacity] = (kind, sequence, cycle_id, time_ms, voltage, current, power, resistance, read_time)
+        # Published only once the record is complete
+        self.header[WRITE_COUNT] = count + 1
+
+    def read(self, until=None):
+        """Copies out the records written since the last read (up to write position `until`)."""
+        end = self.write_count if until is None else min(until, self.write_count)
+        start = self.read_count
+        if end - start > self.capacity:
+            self.overruns += end - start - self.capacity
+            start = end - self.capacity
+        if end <= start:
+            return self.records[:0].copy()
+        first, last = start % self.capacity, end % self.capacity
+        if first < last:
+            batch = self.records[first:last].copy()
+        else:
+            batch = np.concatenate((self.records[first:], self.records[:last]))
+        # Records the writer reused while we copied are stale
+        lapped = self.write_count - self.capacity - start
+        if lapped > 0:
+            self.overruns += lapped
+            batch = batch[lapped:]
+        self.read_count = end
+        return batch
+
+    def close(self, unlink=False):
+        del self.header, self.records
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _parse_sample(payload):
+    """(kind, time_ms, voltage, current, power, resistance) of a DATA/LIVE_DATA payload, or None for other lines."""
+    parts = payload.split(',')
+    try:
+        if parts[0] == "DATA":
+            return KIND_DATA, int(parts[1]), float(parts[2]), float(parts[3]), 0.0, 0.0
+        if parts[0] == "LIVE_DATA":
+            voltage, current, power, resistance = (float(p) for p in parts[1:5])
+            return KIND_LIVE, 0, voltage, current, power, resistance
+    except (IndexError, ValueError):
+        pass  # Forwarded as a line, so the GUI reports it as malformed
+    return None
+
+
+def _publish_unapplied(ring, journal):
+    """Lets the GUI tell finished cycles whose samples are all in the database (see AcquisitionClient.has_unapplied_samples)."""
+    ring.header[OLDEST_UNAPPLIED] = min(journal.unapplied_cycles(), default=0)
+
+
+def run_acquisition(port, baudrate, db_file, journal_path, ring_name, capacity, commands, events):
+    """Child process entry point: reads the port until told to stop or the device disappears."""
+    ring = SampleRing.attach(ring_name, capacity)
+    try:
+        connection = serial.Serial(port, baudrate, timeout=READ_TIMEOUT_S)
+    except serial.SerialException as e:
+        events.put(("error", 0, str(e)))
+        ring.close()
+        return
+    def applied(samples, seconds, ok):
+        if ok:
+            ring.header[SAMPLES_STORED] += samples
+        else:
+            ring.header[DB_WRITE_ERRORS] += 1
+
+    journal = IngestJournal(db_file, journal_path, log=lambda message: events.put(("log", ring.write_count, message)),
+                            on_apply=applied)
+    try:
+        summary = journal.open()
+    except Exception as e:
+        events.put(("error", 0, f"Could not open the ingestion journal: {e}"))
+        connection.close()
+        ring.close()
+        return
+    events.put(("ready", 0, summary))
+
+    cycle_id = None
+    monitor = StreamMonitor()
+    pending = b""
+    try:
+        while True:
+            while True:
+                try:
+                    command, argument = commands.get_nowait()
+                except queue.Empty:
+                    break
+                if command == "stop":
+                    return
+                if command == "send":
+                    connection.write(argument.encode("utf-8"))
+                elif command == "cycle":
+                    cycle_id = argument
+                    monitor.reset()
+
+            _publish_unapplied(ring, journal)
+            try:
+                chunk = connection.read(max(1, connection.in_waiting))
+            except serial.SerialException as e:
+                events.put(("disconnected", ring.write_count, str(e)))
+                return
+            if not chunk:
+                continue
+            read_time = time.perf_counter()
+            *lines, pending = (pending + chunk).split(b"\n")
+            for raw in lines:
+                line = raw.decode("utf-8", errors="replace").strip()
+                if not line:
+                    continue
+                ring.header[LINES_RECEIVED] += 1
+                payload, sequence, intact = unframe(line)
+                sample = _parse_sample(payload) if intact else None
+                if sample is None:
+                    if payload.startswith("PROCESS_END"):
+                        # The GUI finalizes the cycle on this line, even a corrupt one, so its samples must be committed first
+                        journal.flush()
+                        _publish_unapplied(ring, journal)
+                        cycle_id = None
+                    events.put(("line", ring.write_count, line))
+                    continue
+                kind, time_ms, voltage, current, power, resistance = sample
+                owner = cycle_id if kind == KIND_DATA and cycle_id is not None else -1
+                if owner != -1 and monitor.accept(sequence, time_ms / 1000.0) is not None:
+                    journal.append(owner, time_ms, voltage, current)
+                ring.write(kind, -1 if sequence is None else sequence, owner, time_ms,
+                           voltage, current, power, resistance, read_time)
+    except Exception as e:
+        ring.header[READ_ERRORS] += 1
+        events.put(("disconnected", ring.write_count, f"Acquisition process failed: {e}"))
+    finally:
+        journal.close()
+        connection.close()
+        ring.close()
+
+
+class AcquisitionClient:
+    """
+    Drop-in replacement for SerialHandler that runs acquisition in a child
+    process. Samples are handed to app.handle_ring_samples(records) in batches
+    and every other line to app.handle_serial_data(line), both in the Tk thread.
+    """
+    def __init__(self, app, capacity=RING_CAPACITY):
+        self.app = app
+        self.capacity = capacity
+        self.context = multiprocessing.get_context("spawn")   # forking a process with Tk and threads is unsafe
+        self.process = None
+        self.ring = None
+        self.commands = None
+        self.events = None
+        self.poll_id = None
+        self.counted = None
+        self.overruns_reported = 0
+        self.ready = False          # set once the child has opened the port and the journal
+        self.oldest_unapplied = 0   # OLDEST_UNAPPLIED copied by the Tk thread; kept after a disconnect until the next replay
+        self.port = None
+        self.connect_deadline = None
+
+    def get_ports(self):
+        return list_ports.comports()
+
+    def connect(self, port, baudrate=115200):
+        """
+        Starts the child and returns None right away: opening the port and replaying the
+        journal can take seconds, so readiness is polled and reported through
+        app.handle_connected(), or app.handle_disconnect() if the child could not start.
+        """
+        import data_handler
+        self.ring = SampleRing.create(self.capacity)
+        self.counted = np.zeros(HEADER_SLOTS, dtype=np.uint64)
+        self.overruns_reported = 0
+        self.ready = False
+        self.port = port
+        self.commands = self.context.Queue()
+        self.events = self.context.Queue()
+        self.process = self.context.Process(
+            target=run_acquisition, daemon=True, name="acquisition",
+            args=(port, baudrate, data_handler.DB_FILE, JOURNAL_FILE, self.ring.name, self.capacity, self.commands, self.events))
+        self.process.start()
+        self.connect_deadline = time.monotonic() + CONNECT_TIMEOUT_S
+        self.poll_id = self.app.root.after(POLL_INTERVAL_MS, self._await_ready)
+        return None
+
+    def _await_ready(self):
+        self.poll_id = None
+        try:
+            kind, _, detail = self.events.get_nowait()
+        except queue.Empty:
+            if self.process.is_alive() and time.monotonic() < self.connect_deadline:
+                self.poll_id = self.app.root.after(POLL_INTERVAL_MS, self._await_ready)
+                return
+            kind, detail = "error", "the acquisition process did not start"
+        if kind != "ready":
+            from tkinter import messagebox
+            self._shutdown()
+            messagebox.showerror("Erro de Conexão", f"Não foi possível abrir a porta {self.port}.\n{detail}")
+            self.app.log_message(f"ERROR: {detail}")
+            self.app.handle_disconnect()
+            return
+        self.ready = True
+        # The child replayed whatever the previous one left in the journal
+        self.oldest_unapplied = 0
+        if detail["records"]:
+            self.app.log_message(f"INFO: Acquisition process replayed {detail['records']} journal sample(s).")
+        self.app.log_message(f"INFO: Conexão com ESP32 em {self.port} estabelecida (acquisition process {self.process.pid}).")
+        self.poll_id = self.app.root.after(POLL_INTERVAL_MS, self._poll)
+        self.app.handle_connected()
+
+    def disconnect(self):
+        if self.process is None:
+            return
+        self.commands.put(("stop", None))
+        self._shutdown()
+        self.app.log_message("INFO: Conexão terminada.")
+
+    def _shutdown(self):
+        """Waits for the child to exit, hands over what it published last and releases the ring."""
+        if self.poll_id is not None:
+            self.app.root.after_cancel(self.poll_id)
+            self.poll_id = None
+        self.process.join(timeout=3.0)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+        self.ready = False
+        self._drain()
+        self.ring.close(unlink=True)
+        self.ring = None
+
+    def send(self, data):
+        if not self.is_connected():
+            return False
+        self.commands.put(("send", data))
+        return True
+
+    def set_cycle(self, cycle_id):
+        """Samples are stored for cycle_id from now on (None stops storing)."""
+        if self.is_connected():
+            self.commands.put(("cycle", cycle_id))
+
+    def is_connected(self):
+        return self.process is not None and self.ready and self.process.is_alive()
+
+    def has_unapplied_samples(self, cycle_id):
+        """True while samples of cycle_id may still be in the child's journal; safe from any thread."""
+        oldest = self.oldest_unapplied
+        return oldest != 0 and cycle_id >= oldest
+
+    def _poll(self):
+        self.poll_id = None
+        disconnected = self._drain()
+        if disconnected is not None:
+            self.app.log_message(f"ERROR: Ligação perdida: {disconnected}")
+            self._shutdown()
+            self.app.handle_disconnect()
+        elif self.process is not None:
+            self.poll_id = self.app.root.after(POLL_INTERVAL_MS, self._poll)
+
+    def _drain(self):
+        """Dispatches events in wire order with the samples around them. Returns a disconnect reason, if any."""
+        ring = self.ring
+        disconnected = None
+        while True:
+            try:
+                kind, position, detail = self.events.get_nowait()
+            except queue.Empty:
+                break
+            self._dispatch_samples(ring.read(until=position))
+            if kind == "line":
+                # The child publishes it before the line, so it is current when the GUI finalizes a cycle on PROCESS_END
+                self.oldest_unapplied = int(ring.header[OLDEST_UNAPPLIED])
+                self.app.handle_serial_data(detail)
+            elif kind == "log":
+                self.app.log_message(detail)
+            elif kind in ("disconnected", "error"):
+                disconnected = detail
+        self._dispatch_samples(ring.read())
+        self.oldest_unapplied = int(ring.header[OLDEST_UNAPPLIED])
+        if ring.overruns > self.overruns_reported:
+            self.app.log_message(f"WARN: The display fell behind the acquisition process and skipped "
+                                 f"{ring.overruns - self.overruns_reported} sample(s); they were still stored.")
+            self.overruns_reported = ring.overruns
+        self._sync_telemetry()
+        return disconnected
+
+    def _sync_telemetry(self):
+        """Adds what the child counted since the last poll; the GUI keeps counting its own writes too."""
+        header = self.ring.header[:HEADER_SLOTS].copy()
+        telemetry = self.app.telemetry
+        telemetry.lines_received += int(header[LINES_RECEIVED] - self.counted[LINES_RECEIVED])
+        telemetry.read_errors += int(header[READ_ERRORS] - self.counted[READ_ERRORS])
+        telemetry.samples_stored += int(header[SAMPLES_STORED] - self.counted[SAMPLES_STORED])
+        telemetry.db_write_errors += int(header[DB_WRITE_ERRORS] - self.counted[DB_WRITE_ERRORS])
+        self.counted = header
+
+    def _dispatch_samples(self, records):
+        if len(records):
+            self.app.handle_ring_samples(records)
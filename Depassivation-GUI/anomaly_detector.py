@@ -0,0 +1,132 @@
+"""
+Streaming anomaly detection for the DATA stream.
+
+Every check costs a bounded amount of work per sample (the Hampel window is a
+small fixed size), so the detector can run inline with ingestion at 1 kHz:
+  - outlier:      Hampel filter, the sample is more than n_sigmas scaled MADs
+                  away from the median of the preceding window (voltage and current)
+  - jump:         voltage step larger than jump_v between consecutive samples
+  - zero_current: current below zero_current_ma for zero_current_samples in a row
+                  while the load should be connected (open contact / disconnect)
+  - stalled:      device timestamp not advancing, or going backwards
+  - gap:          device timestamps further apart than max_gap_ms
+Runs of the same condition are reported once, when they start. Under a pulsed
+load profile the load is switched on purpose, so with load_switching=True only
+the timestamp checks (stalled, gap) run.
+"""
+from bisect import bisect_left, insort
+from collections import deque
+
+# Scale factor turning the median absolute deviation into a standard deviation estimate
+MAD_SCALE = 1.4826
+
+SEVERITY_WARNING = "warning"
+SEVERITY_CRITICAL = "critical"
+
+
+class HampelFilter:
+    """Causal Hampel identifier over the last `window` samples, kept sorted for the median."""
+    def __init__(self, window=7, n_sigmas=3.0, min_deviation=0.0, min_relative=0.0):
+        self.window = window
+        self.n_sigmas = n_sigmas
+        # Floors on the threshold, so measurement noise on a flat signal is not flagged
+        self.min_deviation = min_deviation
+        self.min_relative = min_relative
+        self.values = deque()
+        self.sorted = []
+
+    def _median(self, values):
+        n = len(values)
+        mid = n // 2
+        return values[mid] if n % 2 else (values[mid - 1] + values[mid]) / 2.0
+
+    def check(self, value):
+        """Returns (is_outlier, median) for `value`, then adds it to the window."""
+        outlier = False
+        median = None
+        if len(self.values) == self.window:
+            median = self._median(self.sorted)
+            deviations = sorted(abs(v - median) for v in self.sorted)
+            threshold = max(self.n_sigmas * MAD_SCALE * self._median(deviations),
+                            self.min_deviation, self.min_relative * abs(median))
+            outlier = abs(value - median) > threshold
+        self.values.append(value)
+        insort(self.sorted, value)
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            del self.sorted[bisect_left(self.sorted, old)]
+        return outlier, median
+
+
+class AnomalyDetector:
+    """Per-cycle detector; feed it every DATA sample with update()."""
+    def __init__(self, hampel_window=7, n_sigmas=4.0, jump_v=0.25, zero_current_ma=1.0,
+                 zero_current_samples=3, max_gap_ms=2500, load_switching=False):
+        self.voltage_filter = HampelFilter(hampel_window, n_sigmas, min_deviation=0.05, min_relative=0.02)
+        self.current_filter = HampelFilter(hampel_window, n_sigmas, min_deviation=10.0, min_relative=0.1)
+        self.jump_v = jump_v
+        self.zero_current_ma = zero_current_ma
+        self.zero_current_samples = zero_current_samples
+        self.max_gap_ms = max_gap_ms
+        self.load_switching = load_switching
+        self.last_time_ms = None
+        self.last_voltage = None
+        self.zero_run = 0
+        self.stalled = False
+        self.voltage_outlier_run = False
+        self.current_outlier_run = False
+        self.event_counts = {}
+
+    def _event(self, events, time_ms, kind, severity, value, detail):
+        events.append({'timestamp_ms': time_ms, 'event_type': kind, 'severity': severity,
+                       'value': value, 'detail': detail})
+        self.event_counts[kind] = self.event_counts.get(kind, 0) + 1
+
+    def update(self, time_ms, voltage, current):
+        """Checks one sample. Returns a (usually empty) list of event dicts."""
+        events = []
+
+        if self.last_time_ms is not None:
+            step_ms = time_ms - self.last_time_ms
+            if step_ms <= 0:
+                if not self.stalled:
+                    detail = "Timestamp did not advance" if step_ms == 0 else f"Timestamp went back {-step_ms} ms"
+                    self._event(events, time_ms, "stalled", SEVERITY_CRITICAL, step_ms, detail)
+                self.stalled = True
+            else:
+                self.stalled = False
+                if step_ms > self.max_gap_ms:
+                    self._event(events, time_ms, "gap", SEVERITY_WARNING, step_ms, f"No data for {step_ms} ms")
+        self.last_time_ms = time_ms
+        if self.load_switching:
+            return events
+
+        if self.last_voltage is not None and abs(voltage - self.last_voltage) > self.jump_v:
+            self._event(events, time_ms, "jump", SEVERITY_WARNING, voltage - self.last_voltage,
+                        f"Voltage jumped {voltage - self.last_voltage:+.3f} V")
+
+        outlier, median = self.voltage_filter.check(voltage)
+        if outlier and not self.voltage_outlier_run:
+            self._event(events, time_ms, "outlier", SEVERITY_WARNING, voltage,
+                        f"Voltage {voltage:.3f} V vs median {median:.3f} V")
+        self.voltage_outlier_run = outlier
+        outlier, median = self.current_filter.check(current)
+        if outlier and not self.current_outlier_run:
+            self._event(events, time_ms, "outlier", SEVERITY_WARNING, current,
+                        f"Current {current:.1f} mA vs median {median:.1f} mA")
+        self.current_outlier_run = outlier
+
+        if abs(current) < self.zero_current_ma:
+            self.zero_run += 1
+            if self.zero_run == self.zero_current_samples:
+                self._event(events, time_ms, "zero_current", SEVERITY_CRITICAL, current,
+                            f"No load current for {self.zero_run} samples")
+        else:
+            self.zero_run = 0
+
+        self.last_voltage = voltage
+        return events
+
+    def summary(self):
+        """Short text such as '2 outlier, 1 jump'."""
+        return ", ".join(f"{count} {kind}" for kind, count in sorted(self.event_counts.items()))
@@ -0,0 +1,198 @@
+"""
+Batch renderer for cycle graphs.
+
+Builds each figure straight from the readings stored in the database using the
+Agg backend, so it never touches Tk and can run in a pool of worker processes.
+Can be used from the History tab or from the command line:
+
+    python batch_export.py --out exports --battery "Bateria 1" --from 2025-09-01 --format png pdf
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from data_handler import DB_FILE
+import sample_files
+
+MANIFEST_FILE = "export_manifest.json"
+
+_worker_conn = None
+
+
+def _init_worker(db_file):
+    """Opens one read-only connection per worker process."""
+    global _worker_conn
+    _worker_conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+
+def _render_job(job):
+    """Renders one cycle to every requested format. Runs inside a worker process."""
+    # Imported here so the parent process never needs the Agg canvas
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    timestamps, voltages, currents = sample_files.read_samples(_worker_conn, job['cycle_id'])
+    if not len(timestamps):
+        return job['cycle_id'], []
+
+    times = timestamps / 1000.0
+
+    fig = Figure(figsize=(8, 4.5), dpi=job['dpi'])
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.plot(times, voltages, marker='.', linestyle='-', color='tab:blue', label="Voltage")
+    if job['pass_fail_voltage'] is not None:
+        ax.axhline(job['pass_fail_voltage'], color='red', linestyle='--', linewidth=1, label="Pass/Fail Voltage")
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Voltage (V)")
+    ax.grid(True)
+    ax_current = ax.twinx()
+    ax_current.plot(times, currents, color='tab:orange', alpha=0.5, linewidth=1, label="Current")
+    ax_current.set_ylabel("Current (mA)")
+    ax.set_title(f"{job['battery_name']} - {job['cycle_type']} (Cycle ID: {job['cycle_id']})")
+    ax.legend(loc='lower left')
+    fig.text(0.01, 0.01, f"{job['timestamp']} | Result: {job['result'] or 'N/A'}", fontsize=8, color='grey')
+    fig.tight_layout()
+
+    written = []
+    for path in job['paths']:
+        fig.savefig(path)
+        written.append(path)
+    return job['cycle_id'], written
+
+
+def _safe_name(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(text)).strip("_") or "unnamed"
+
+
+def select_cycles(db_file, battery_name=None, start_date=None, end_date=None):
+    """
+    Returns the cycles to export plus a fingerprint of their stored data.
+    Dates are inclusive 'YYYY-MM-DD' strings.
+    """
+    clauses = []
+    params = []
+    if battery_name:
+        clauses.append("b.name = ?")
+        params.append(battery_name)
+    if start_date:
+        clauses.append("substr(c.timestamp, 1, 10) >= ?")
+        params.append(start_date)
+    if end_date:
+        clauses.append("substr(c.timestamp, 1, 10) <= ?")
+        params.append(end_date)
+    sql = """SELECT c.id, c.test_id, c.cycle_type, c.timestamp, c.pass_fail_voltage, c.result,
+                    COALESCE(b.name, 'Uncategorized') AS battery_name,
+                    COALESCE(f.record_count, (SELECT COUNT(*) FROM readings r WHERE r.cycle_id = c.id)) AS reading_count,
+                    COALESCE(f.last_ms, (SELECT MAX(timestamp_ms) FROM readings r WHERE r.cycle_id = c.id)) AS last_ms
+             FROM cycles c
+             JOIN tests t ON t.id = c.test_id
+             LEFT JOIN batteries b ON b.id = t.battery_id
+             LEFT JOIN cycle_sample_files f ON f.cycle_id = c.id"""
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY c.id ASC"
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        sample_files.ensure_table(conn)
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def _fingerprint(cycle, fmt, dpi):
+    """Identifies what a file was rendered from: the cycle's stored data and the render settings."""
+    return f"{cycle['reading_count']}:{cycle['last_ms']}:{cycle['result']}:{cycle['pass_fail_voltage']}:{fmt}:{dpi}"
+
+
+def export_cycles(db_file, out_dir, battery_name=None, start_date=None, end_date=None,
+                  formats=("png",), dpi=150, workers=None, force=False, progress=None):
+    """
+    Renders every matching cycle to out_dir in parallel.
+    Outputs whose stored data has not changed since the last export are skipped.
+    Returns a dict with 'written', 'skipped' and 'failed' counts.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    manifest = {}
+    if os.path.exists(manifest_path) and not force:
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            manifest = {}
+
+    jobs = []
+    skipped = 0
+    for cycle in select_cycles(db_file, battery_name, start_date, end_date):
+        if not cycle['reading_count']:
+            continue
+        base = f"{_safe_name(cycle['battery_name'])}_test{cycle['test_id']}_cycle{cycle['id']}_{_safe_name(cycle['cycle_type'])}"
+        fingerprints = {os.path.join(out_dir, f"{base}.{fmt}"): _fingerprint(cycle, fmt, dpi) for fmt in formats}
+        if all(manifest.get(os.path.basename(p)) == fp and os.path.exists(p) for p, fp in fingerprints.items()):
+            skipped += 1
+            continue
+        jobs.append({
+            'cycle_id': cycle['id'], 'cycle_type': cycle['cycle_type'], 'timestamp': cycle['timestamp'],
+            'battery_name': cycle['battery_name'], 'pass_fail_voltage': cycle['pass_fail_voltage'],
+            'result': cycle['result'], 'dpi': dpi, 'paths': list(fingerprints), 'fingerprints': fingerprints,
+        })
+
+    written = 0
+    failed = 0
+    if jobs:
+        fingerprints = {path: fp for job in jobs for path, fp in job['fingerprints'].items()}
+        # 'spawn' keeps workers independent of the parent's Tk state and threads
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(db_file,)) as pool:
+            futures = [pool.submit(_render_job, job) for job in jobs]
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    _, paths = future.result()
+                    for path in paths:
+                        manifest[os.path.basename(path)] = fingerprints[path]
+                    written += len(paths)
+                except Exception:
+                    failed += 1
+                if progress:
+                    progress(done, len(jobs))
+
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=4)
+
+    return {'written': written, 'skipped': skipped, 'failed': failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch export cycle graphs from the history database.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--out", required=True, help="Output directory.")
+    parser.add_argument("--battery", help="Only export cycles of this battery name.")
+    parser.add_argument("--from", dest="start_date", help="First date to include (YYYY-MM-DD).")
+    parser.add_argument("--to", dest="end_date", help="Last date to include (YYYY-MM-DD).")
+    parser.add_argument("--format", nargs="+", default=["png"], choices=["png", "pdf", "svg"], help="Output format(s).")
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--force", action="store_true", help="Re-render even if outputs are up to date.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+
+    def report(done, total):
+        print(f"\rRendering {done}/{total}...", end="", flush=True)
+
+    counts = export_cycles(args.db, args.out, args.battery, args.start_date, args.end_date,
+                           formats=args.format, dpi=args.dpi, workers=args.jobs, force=args.force, progress=report)
+    print(f"\nINFO: {counts['written']} file(s) written, {counts['skipped']} cycle(s) up to date, {counts['failed']} failed.")
+
+
+if __name__ == "__main__":
+    main()
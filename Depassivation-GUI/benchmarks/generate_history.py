@@ -0,0 +1,224 @@
+"""
+Synthetic history database generator.
+
+Builds a database in the current schema (created by DataHandler) filled with
+Baseline -> Depassivation -> Check sequences for many batteries, so scaling can
+be measured without months of real acquisitions. Samples come from the
+simulator's cell model (SimulationHandler.cell_dip, loaded_response and
+depassivated): the voltage dips under load and recovers towards the plateau,
+the dip and recovery time scale with the passivation, and time under load
+removes passivation. Cells also re-passivate while stored between tests. Cycle
+results come from cycle_analytics, as the GUI stores them.
+
+Distributions (all configurable):
+  - tests are spread uniformly over --days, each on a random battery
+  - initial passivation per battery: uniform 0.6-1.0, as in the simulator
+  - plateau voltage per battery: normal around the simulator's, sd --plateau-sd
+  - depassivation duration: its mean, scaled by a uniform factor 1 +- --depassivation-jitter
+  - re-passivation between tests: 1 - exp(-gap / --repassivation-days)
+
+The output is deterministic for a given --seed. Rows are written with
+executemany in large batches on one connection with journaling off, and the
+readings index is rebuilt once at the end, so 100M readings take minutes:
+
+    python benchmarks/generate_history.py big.db --batteries 1000 --tests 100000
+    python benchmarks/generate_history.py small.db --batteries 5 --tests 200 --no-analytics
+
+From Python (benchmarks, migration checks):
+
+    from generate_history import generate
+    summary = generate("fixture.db", batteries=10, tests=500, seed=3)
+"""
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+GUI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GUI_DIR)
+
+import data_handler
+from data_handler import DataHandler
+from cycle_analytics import ANALYTICS_VERSION, METRIC_NAMES, compute_cycle_extremes, compute_cycle_metrics, cycle_result
+from simulation_handler import SimulationHandler
+
+SEQUENCE = ("Baseline", "Depassivation", "Check")
+DEFAULT_PROFILES = ("Bateria de Teste 1", "Pulsado 1 Hz", None)
+REST_BETWEEN_CYCLES_S = 60
+READINGS_BATCH = 500000
+
+
+class _SchemaApp:
+    """DataHandler only needs log_message() to create the schema."""
+    def log_message(self, message):
+        if message.startswith("ERROR"):
+            print(message, file=sys.stderr)
+
+
+def create_schema(db_file):
+    """Creates the current schema exactly as the GUI does on startup."""
+    previous = data_handler.DB_FILE
+    data_handler.DB_FILE = db_file
+    try:
+        DataHandler(_SchemaApp())._init_database()
+    finally:
+        data_handler.DB_FILE = previous
+
+
+def cell_response(rng, passivation, plateau, duration_s, interval_ms):
+    """Samples of one cycle under continuous load, rounded like the firmware's DATA lines."""
+    t_ms = np.arange(0, int(duration_s * 1000) + 1, interval_ms, dtype=np.int64)
+    dip, recovery_tau_s = SimulationHandler.cell_dip(passivation)
+    voltage, current = SimulationHandler.loaded_response(t_ms / 1000.0, dip, recovery_tau_s, rng, plateau)
+    return t_ms, np.round(voltage, 3), np.round(current, 1)
+
+
+def cycle_results(voltage, current, pass_fail_voltage):
+    """min_voltage, max_current, power, resistance and result of a cycle that ran to completion."""
+    extremes = compute_cycle_extremes(voltage, current)
+    return (*extremes, cycle_result(extremes[0], pass_fail_voltage))
+
+
+def _local_text(epoch):
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generate(db_file, batteries=1000, tests=100000, days=365, baseline_s=30, depassivation_s=900,
+             depassivation_jitter=0.5, check_s=30, interval_ms=1000, pass_fail_voltage=3.2,
+             plateau_sd=0.02, repassivation_days=30.0, profiles=DEFAULT_PROFILES,
+             readings=True, analytics=True, seed=1, now=None, progress=None):
+    """
+    Appends `tests` synthetic sequences for `batteries` new batteries to db_file
+    (created if missing). progress(done, total) is called after each batch of tests.
+    Returns a summary dict with row counts and timing.
+    """
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    now = time.time() if now is None else now
+    create_schema(db_file)
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -200000")
+    # One index build at the end is much cheaper than maintaining it row by row
+    conn.execute("DROP INDEX IF EXISTS idx_readings_cycle")
+
+    first_battery = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM batteries").fetchone()[0]
+    next_test = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM tests").fetchone()[0]
+    next_cycle = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM cycles").fetchone()[0]
+    start_epoch = now - days * 86400
+    conn.executemany("INSERT INTO batteries (id, name, created_at) VALUES (?, ?, ?)",
+                     [(first_battery + b, f"SYN-{seed}-{b + 1:05d}", _local_text(start_epoch)) for b in range(batteries)])
+
+    passivation = rng.uniform(0.6, 1.0, batteries)
+    plateau = rng.normal(SimulationHandler.PLATEAU_VOLTAGE, plateau_sd, batteries)
+    last_test_epoch = np.full(batteries, start_epoch)
+    test_epochs = np.sort(rng.uniform(start_epoch, now, tests))
+    test_batteries = rng.integers(0, batteries, tests)
+    test_profiles = [profiles[k] for k in rng.integers(0, len(profiles), tests)]
+    jitter = rng.uniform(1.0 - depassivation_jitter, 1.0 + depassivation_jitter, tests)
+
+    assignments = ", ".join(METRIC_NAMES)
+    metric_slots = ", ".join("?" * len(METRIC_NAMES))
+    cycle_sql = f"""INSERT INTO cycles (id, test_id, cycle_type, timestamp, timestamp_epoch, duration, pass_fail_voltage,
+                                        min_voltage, max_current, power, resistance, result, end_reason, completed_early,
+                                        {assignments}, analytics_version)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, {metric_slots}, ?)"""
+    test_rows, cycle_rows, reading_rows = [], [], []
+    totals = {"batteries": batteries, "first_battery_id": first_battery, "tests": 0, "cycles": 0, "readings": 0}
+
+    def flush():
+        conn.executemany("INSERT INTO tests (id, battery_id, timestamp, timestamp_epoch, profile_name) VALUES (?, ?, ?, ?, ?)", test_rows)
+        conn.executemany(cycle_sql, cycle_rows)
+        conn.executemany("INSERT INTO readings (cycle_id, timestamp_ms, voltage, current) VALUES (?, ?, ?, ?)", reading_rows)
+        conn.commit()
+        totals["tests"] += len(test_rows)
+        totals["cycles"] += len(cycle_rows)
+        totals["readings"] += len(reading_rows)
+        test_rows.clear()
+        cycle_rows.clear()
+        reading_rows.clear()
+
+    try:
+        for k in range(tests):
+            b = int(test_batteries[k])
+            epoch = float(test_epochs[k])
+            # Stored cells re-passivate towards 1.0 between tests
+            gap_days = (epoch - last_test_epoch[b]) / 86400
+            passivation[b] = 1.0 - (1.0 - passivation[b]) * math.exp(-gap_days / repassivation_days)
+            last_test_epoch[b] = epoch
+            test_rows.append((next_test, first_battery + b, _local_text(epoch), int(epoch), test_profiles[k]))
+
+            cycle_epoch = epoch
+            durations = (baseline_s, max(1, round(depassivation_s * jitter[k])), check_s)
+            for cycle_type, duration in zip(SEQUENCE, durations):
+                t_ms, voltage, current = cell_response(rng, passivation[b], plateau[b], duration, interval_ms)
+                metrics = compute_cycle_metrics(t_ms / 1000.0, voltage, current, pass_fail_voltage) if analytics else {}
+                cycle_rows.append((next_cycle, next_test, cycle_type, _local_text(cycle_epoch), int(cycle_epoch), duration,
+                                   pass_fail_voltage, *cycle_results(voltage, current, pass_fail_voltage), "completed",
+                                   *[metrics.get(name) for name in METRIC_NAMES], ANALYTICS_VERSION if analytics else None))
+                if readings:
+                    reading_rows.extend(zip([next_cycle] * t_ms.size, t_ms.tolist(), voltage.tolist(), current.tolist()))
+                passivation[b] = SimulationHandler.depassivated(passivation[b], duration)
+                cycle_epoch += duration + REST_BETWEEN_CYCLES_S
+                next_cycle += 1
+            next_test += 1
+
+            if len(reading_rows) >= READINGS_BATCH or len(test_rows) >= 10000:
+                flush()
+                if progress:
+                    progress(k + 1, tests)
+        flush()
+        if progress:
+            progress(tests, tests)
+    finally:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_cycle ON readings (cycle_id, timestamp_ms)")
+        conn.execute("ANALYZE")
+        conn.close()
+
+    totals["seconds"] = time.perf_counter() - started
+    totals["db_size_bytes"] = os.path.getsize(db_file)
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic history database for scaling tests.")
+    parser.add_argument("db", help="Database file to create or append to.")
+    parser.add_argument("--batteries", type=int, default=1000)
+    parser.add_argument("--tests", type=int, default=100000, help="Number of Baseline -> Depassivation -> Check sequences.")
+    parser.add_argument("--days", type=float, default=365, help="Spread the tests over this many days up to now.")
+    parser.add_argument("--baseline-s", type=int, default=30)
+    parser.add_argument("--depassivation-s", type=int, default=900, help="Mean depassivation duration.")
+    parser.add_argument("--depassivation-jitter", type=float, default=0.5, help="Relative +- spread of the depassivation duration.")
+    parser.add_argument("--check-s", type=int, default=30)
+    parser.add_argument("--interval-ms", type=int, default=1000, help="Sample interval.")
+    parser.add_argument("--pass-fail-voltage", type=float, default=3.2)
+    parser.add_argument("--plateau-sd", type=float, default=0.02, help="Spread of the plateau voltage between batteries (V).")
+    parser.add_argument("--repassivation-days", type=float, default=30.0, help="Time constant of re-passivation in storage.")
+    parser.add_argument("--no-readings", action="store_true", help="Only write batteries, tests and cycles.")
+    parser.add_argument("--no-analytics", action="store_true", help="Leave cycle analytics to be computed later.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    def report(done, total):
+        print(f"\rGenerated {done}/{total} tests...", end="", flush=True)
+
+    summary = generate(args.db, batteries=args.batteries, tests=args.tests, days=args.days,
+                       baseline_s=args.baseline_s, depassivation_s=args.depassivation_s,
+                       depassivation_jitter=args.depassivation_jitter, check_s=args.check_s,
+                       interval_ms=args.interval_ms, pass_fail_voltage=args.pass_fail_voltage,
+                       plateau_sd=args.plateau_sd, repassivation_days=args.repassivation_days,
+                       readings=not args.no_readings, analytics=not args.no_analytics,
+                       seed=args.seed, progress=report)
+    print(f"\nINFO: Wrote {summary['batteries']} batteries, {summary['tests']} tests, {summary['cycles']} cycles and "
+          f"{summary['readings']} readings in {summary['seconds']:.1f} s ({summary['db_size_bytes'] / 1e6:.1f} MB).")
+
+
+if __name__ == "__main__":
+    main()
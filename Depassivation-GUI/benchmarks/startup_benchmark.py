@@ -0,0 +1,139 @@
+"""
+Startup-time benchmark for the Depassivation GUI.
+
+Launches the application repeatedly in fresh processes and records, for each run:
+  - import_s:      time to import tkinter and the gui module
+  - first_paint_s: time until the main window is mapped
+  - interactive_s: time until deferred startup (DB init, graphs, history lists) has finished
+All times are measured from process launch. Runs under a virtual X display: when
+DISPLAY is not set, Xvfb is started for the duration of the benchmark.
+
+    python benchmarks/startup_benchmark.py --runs 5 --output startup.json
+    python benchmarks/startup_benchmark.py --db depassivation_history.db   # with a populated history
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+GUI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(simulate):
+    """Runs inside the child process: starts the app and reports its startup milestones."""
+    launch_time = float(os.environ["STARTUP_BENCH_LAUNCH"])
+    sys.path.insert(0, GUI_DIR)
+    import tkinter as tk
+    from gui import DepassivationApp
+    from data_handler import DB_FILE
+    timings = {'import_s': time.time() - launch_time}
+
+    root = tk.Tk()
+    def on_map(event):
+        if event.widget is root and 'first_paint_s' not in timings:
+            timings['first_paint_s'] = time.time() - launch_time
+    root.bind("<Map>", on_map, add="+")
+    app = DepassivationApp(root, simulate=simulate)
+    timings['constructed_s'] = time.time() - launch_time
+
+    def poll():
+        if app.startup_complete:
+            timings['interactive_s'] = time.time() - launch_time
+            timings['db_size_bytes'] = os.path.getsize(DB_FILE) if os.path.exists(DB_FILE) else 0
+            print(json.dumps(timings))
+            root.destroy()
+        else:
+            root.after(5, poll)
+    root.after(5, poll)
+    root.mainloop()
+
+
+def start_virtual_display():
+    """Starts Xvfb on a free display number. Returns the process, or None if a display already exists."""
+    if os.environ.get("DISPLAY"):
+        return None
+    xvfb = shutil.which("Xvfb")
+    if not xvfb:
+        sys.exit("ERROR: DISPLAY is not set and Xvfb was not found. Install Xvfb or run under xvfb-run.")
+    for display in range(99, 120):
+        if os.path.exists(f"/tmp/.X11-unix/X{display}"):
+            continue
+        proc = subprocess.Popen([xvfb, f":{display}", "-screen", "0", "1920x1080x24", "-nolisten", "tcp"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            if os.path.exists(f"/tmp/.X11-unix/X{display}"):
+                os.environ["DISPLAY"] = f":{display}"
+                return proc
+            if proc.poll() is not None:
+                break
+            time.sleep(0.05)
+        proc.kill()
+    sys.exit("ERROR: Could not start Xvfb.")
+
+
+def run_benchmark(runs, db_path, simulate):
+    results = []
+    for i in range(runs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            if db_path:
+                shutil.copy(db_path, os.path.join(work_dir, "depassivation_history.db"))
+            env = dict(os.environ, STARTUP_BENCH_LAUNCH=repr(time.time()))
+            args = [sys.executable, os.path.abspath(__file__), "--child"]
+            if not simulate:
+                args.append("--hardware")
+            proc = subprocess.run(args, cwd=work_dir, env=env, capture_output=True, text=True, timeout=120)
+            if proc.returncode != 0:
+                sys.exit(f"ERROR: Startup run {i + 1} failed:\n{proc.stderr}")
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(timings)
+            print(f"Run {i + 1}/{runs}: first paint {timings['first_paint_s']:.3f} s, interactive {timings['interactive_s']:.3f} s")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure GUI time-to-interactive under a virtual display.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db", help="History database to start with (copied, never modified).")
+    parser.add_argument("--hardware", action="store_true", help="Start in hardware mode instead of simulation mode.")
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(simulate=not args.hardware)
+        return
+
+    xvfb = start_virtual_display()
+    try:
+        results = run_benchmark(args.runs, args.db, simulate=not args.hardware)
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+    keys = ('import_s', 'constructed_s', 'first_paint_s', 'interactive_s')
+    report = {
+        'benchmark': 'startup',
+        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'mode': 'hardware' if args.hardware else 'simulation',
+        'db': args.db,
+        'runs': results,
+        'median': {k: statistics.median(r[k] for r in results) for k in keys},
+    }
+    print(f"Median time-to-interactive: {report['median']['interactive_s']:.3f} s")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"INFO: Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
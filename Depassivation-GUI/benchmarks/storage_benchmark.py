@@ -0,0 +1,337 @@
+"""
+Ingestion, storage and history benchmarks for the Depassivation GUI.
+
+Runs headless (no display needed) against throwaway databases in a temporary
+directory and records, per benchmark:
+  parse          - DATA line parse rate (lines/s), same parsing as the GUI
+  serial_ingest  - end-to-end serial -> DB rate through SerialHandler, over a
+                   pyserial loop:// port or a pseudo-terminal (--transport pty)
+  log_reading    - per-sample DataHandler.log_reading rate (one commit each)
+  bulk_insert    - executemany into readings in one transaction
+  cycle_data     - get_cycle_data latency for cycles of increasing size
+  cycle_series   - get_cycle_series latency (whole cycle and a 1% window) for
+                   cycles stored in readings vs. memory-mapped sample files
+  history_list   - time to load a battery's test list with its cycles, as the
+                   History tab does, for increasing numbers of tests (fixtures
+                   from generate_history.py)
+  csv_export     - get_cycle_data + CSV writing rate (samples/s)
+
+    python benchmarks/storage_benchmark.py --output storage.json
+    python benchmarks/storage_benchmark.py --only parse log_reading --quick
+"""
+import argparse
+import csv
+import json
+import os
+import platform
+import queue
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+GUI_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GUI_DIR)
+
+import serial
+
+import data_handler
+import sample_files
+from data_handler import DataHandler
+from instrumentation import Instrumentation
+from telemetry import StationMetrics
+from serial_handler import SerialHandler
+from stream_integrity import frame, unframe
+from generate_history import generate
+
+
+class BenchApp:
+    """
+    Stands in for DepassivationApp. DataHandler and SerialHandler only need
+    log_message() and root.after(); callbacks are queued and run by drain().
+    """
+    def __init__(self):
+        self.root = self
+        self.instrumentation = Instrumentation(self)
+        self.telemetry = StationMetrics("benchmark")
+        self.pending = queue.Queue()
+        self.data_handler = DataHandler(self)
+        self.cycle_id = None
+        self.samples = 0
+
+    def log_message(self, message):
+        if message.startswith("ERROR"):
+            print(message, file=sys.stderr)
+
+    def after(self, delay_ms, callback, *args):
+        self.pending.put((callback, args))
+
+    def drain(self, timeout=0.1):
+        """Runs queued callbacks, like the Tk main loop. Returns False once nothing arrived within `timeout`."""
+        try:
+            callback, args = self.pending.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        callback(*args)
+        return True
+
+    def handle_serial_data(self, line, read_time=None):
+        if line.startswith("DATA,"):
+            sample = parse_data_line(line)
+            if sample:
+                self.data_handler.log_reading(self.cycle_id, *sample)
+                self.samples += 1
+
+    def handle_disconnect(self):
+        pass
+
+
+def parse_data_line(line):
+    """Checks the trailer and parses 'DATA,<time_ms>,<voltage>,<current>' like DepassivationApp does."""
+    line, _, intact = unframe(line)
+    if not intact:
+        return None
+    parts = line.split(',')
+    try:
+        return int(parts[1]), float(parts[2]), float(parts[3])
+    except (IndexError, ValueError):
+        return None
+
+
+def data_lines(count, interval_ms=1000):
+    return [frame(f"DATA,{i * interval_ms},{3.3 - (i % 50) * 0.001:.3f},{150.0 + (i % 7) * 0.1:.1f}", i) for i in range(count)]
+
+
+def new_cycle(app, battery_name="Bench"):
+    """Creates a battery (once), a test and a cycle. Returns the cycle id."""
+    handler = app.data_handler
+    battery = next((b for b in handler.get_all_batteries() if b['name'] == battery_name), None)
+    battery_id = battery['id'] if battery else handler.create_battery(battery_name)
+    test_id = handler.create_new_test(battery_id, "Benchmark")
+    return handler.create_new_cycle(test_id, "Depassivation", 60, 3.2)
+
+
+def bulk_readings(cycle_id, count):
+    conn = sqlite3.connect(data_handler.DB_FILE)
+    with conn:
+        conn.executemany("INSERT INTO readings (cycle_id, timestamp_ms, voltage, current) VALUES (?, ?, ?, ?)",
+                         ((cycle_id, i * 100, 3.3 - (i % 50) * 0.001, 150.0) for i in range(count)))
+    conn.close()
+
+
+def bulk_sample_file(cycle_id, count):
+    """Fills the sample file of a cycle created with sample_storage = "files"."""
+    conn = sqlite3.connect(data_handler.DB_FILE)
+    with conn:
+        sample_files.store(conn, [(cycle_id, i * 100, 3.3 - (i % 50) * 0.001, 150.0) for i in range(count)])
+    conn.close()
+
+
+def timed(func, repeats):
+    """Returns the median wall time of `repeats` calls of func()."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def bench_parse(app, scale):
+    lines = data_lines(200000 // scale)
+    start = time.perf_counter()
+    for line in lines:
+        parse_data_line(line)
+    elapsed = time.perf_counter() - start
+    return {'lines': len(lines), 'seconds': elapsed, 'lines_per_s': len(lines) / elapsed}
+
+
+def open_transport(transport):
+    """Returns (port the handler reads, port the 'device' writes, cleanup)."""
+    if transport == "loop":
+        port = serial.serial_for_url("loop://", timeout=1)
+        return port, port, port.close
+    device_fd, host_fd = os.openpty()
+    host = serial.Serial(os.ttyname(host_fd), 115200, timeout=1)
+    def cleanup():
+        host.close()
+        os.close(device_fd)
+        os.close(host_fd)
+    return host, os.fdopen(os.dup(device_fd), "wb", buffering=0), cleanup
+
+
+def bench_serial_ingest(app, scale, transport="loop"):
+    count = 2000 // scale
+    app.cycle_id = new_cycle(app)
+    app.samples = 0
+    reader, writer, cleanup = open_transport(transport)
+    handler = SerialHandler(app)
+    handler.serial_connection = reader
+    handler.is_running = True
+    try:
+        payload = "".join(line + "\n" for line in data_lines(count)).encode("ascii")
+        start = time.perf_counter()
+        handler.read_thread = threading.Thread(target=handler.read_from_serial, daemon=True)
+        handler.read_thread.start()
+        threading.Thread(target=writer.write, args=(payload,), daemon=True).start()
+        deadline = start + 60 + count * 0.05
+        while app.samples < count and time.perf_counter() < deadline:
+            app.drain()
+        elapsed = time.perf_counter() - start
+    finally:
+        handler.is_running = False
+        if handler.read_thread:
+            handler.read_thread.join(timeout=2.0)
+        cleanup()
+    return {'transport': transport, 'lines': count, 'stored': app.samples,
+            'seconds': elapsed, 'lines_per_s': app.samples / elapsed}
+
+
+def bench_log_reading(app, scale):
+    count = 2000 // scale
+    cycle_id = new_cycle(app)
+    start = time.perf_counter()
+    for i in range(count):
+        app.data_handler.log_reading(cycle_id, i * 100, 3.3, 150.0)
+    elapsed = time.perf_counter() - start
+    return {'samples': count, 'seconds': elapsed, 'samples_per_s': count / elapsed}
+
+
+def bench_bulk_insert(app, scale):
+    count = 500000 // scale
+    cycle_id = new_cycle(app)
+    start = time.perf_counter()
+    bulk_readings(cycle_id, count)
+    elapsed = time.perf_counter() - start
+    return {'samples': count, 'seconds': elapsed, 'samples_per_s': count / elapsed}
+
+
+def bench_cycle_data(app, scale):
+    results = []
+    for size in [n for n in (100, 1000, 10000, 100000, 1000000) if n <= 1000000 // scale]:
+        cycle_id = new_cycle(app)
+        bulk_readings(cycle_id, size)
+        latency = timed(lambda: app.data_handler.get_cycle_data(cycle_id), 5)
+        results.append({'samples': size, 'latency_s': latency})
+    return {'sizes': results}
+
+
+def bench_cycle_series(app, scale):
+    results = []
+    handler = app.data_handler
+    for storage in ("sqlite", "files"):
+        handler.sample_storage = storage
+        for size in [n for n in (1000, 100000, 1000000) if n <= 1000000 // scale]:
+            cycle_id = new_cycle(app)
+            (bulk_sample_file if storage == "files" else bulk_readings)(cycle_id, size)
+            # min() makes the memmap actually read the samples
+            span_s = size * 0.1
+            full = timed(lambda: handler.get_cycle_series(cycle_id)[1].min(), 5)
+            window = timed(lambda: handler.get_cycle_series(cycle_id, span_s * 0.5, span_s * 0.51)[1].min(), 5)
+            results.append({'storage': storage, 'samples': size, 'latency_s': full, 'window_latency_s': window})
+    return {'sizes': results}
+
+
+def load_history_list(handler, battery_id):
+    """The queries DepassivationApp.on_history_battery_selected runs for one battery."""
+    for test in handler.get_tests_for_battery(battery_id):
+        handler.get_cycles_for_test(test['id'])
+
+
+def bench_history_list(app, scale):
+    handler = app.data_handler
+    results = []
+    for tests in [n for n in (10, 100, 1000, 10000) if n <= 10000 // scale]:
+        fixture = generate(data_handler.DB_FILE, batteries=1, tests=tests, readings=False, seed=tests)
+        battery_id = fixture['first_battery_id']
+        results.append({'tests': tests, 'latency_s': timed(lambda: load_history_list(handler, battery_id), 3)})
+    return {'sizes': results}
+
+
+def bench_csv_export(app, scale):
+    count = 200000 // scale
+    cycle_id = new_cycle(app)
+    bulk_readings(cycle_id, count)
+    path = os.path.join(os.getcwd(), "export.csv")
+    start = time.perf_counter()
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Timestamp_s', 'Voltage_V', 'Current_mA'])
+        writer.writerows(app.data_handler.get_cycle_data(cycle_id))
+    elapsed = time.perf_counter() - start
+    return {'samples': count, 'bytes': os.path.getsize(path), 'seconds': elapsed, 'samples_per_s': count / elapsed}
+
+
+BENCHMARKS = {
+    'parse': bench_parse,
+    'serial_ingest': bench_serial_ingest,
+    'log_reading': bench_log_reading,
+    'bulk_insert': bench_bulk_insert,
+    'cycle_data': bench_cycle_data,
+    'cycle_series': bench_cycle_series,
+    'history_list': bench_history_list,
+    'csv_export': bench_csv_export,
+}
+
+
+def run_benchmarks(names, scale, transport):
+    """Runs each benchmark in a fresh temporary directory. Returns {name: result}."""
+    results = {}
+    cwd = os.getcwd()
+    for name in names:
+        with tempfile.TemporaryDirectory() as work_dir:
+            os.chdir(work_dir)
+            try:
+                app = BenchApp()
+                app.data_handler._init_database()
+                if name == 'serial_ingest':
+                    result = bench_serial_ingest(app, scale, transport)
+                else:
+                    result = BENCHMARKS[name](app, scale)
+            finally:
+                os.chdir(cwd)
+        results[name] = result
+        print(f"{name}: {summarize(result)}")
+    return results
+
+
+def summarize(result):
+    if 'sizes' in result:
+        key = 'samples' if 'samples' in result['sizes'][0] else 'tests'
+        return ", ".join(f"{r['storage'] + ' ' if 'storage' in r else ''}{r[key]} {key}: {r['latency_s'] * 1000:.2f} ms"
+                         for r in result['sizes'])
+    rate_key = next(k for k in result if k.endswith('_per_s'))
+    return f"{result[rate_key]:,.0f} {rate_key.replace('_per_s', '')}/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, ingestion, storage and history queries.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Run only these benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="Use 10x smaller workloads (for a smoke run).")
+    parser.add_argument("--transport", choices=("loop", "pty"), default="loop", help="Serial stand-in for serial_ingest.")
+    parser.add_argument("--output", help="Write results to this JSON file.")
+    args = parser.parse_args()
+
+    names = args.only or list(BENCHMARKS)
+    scale = 10 if args.quick else 1
+    results = run_benchmarks(names, scale, args.transport)
+
+    report = {
+        'benchmark': 'storage',
+        'timestamp': time.strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"INFO: Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
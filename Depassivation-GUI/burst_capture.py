@@ -0,0 +1,94 @@
+"""
+High-rate capture of the first moments under load.
+
+With a window set ("BURST,<window_ms>", 0 turns it off), the firmware keeps the
+load connected when a test starts and samples the INA219 back to back into RAM
+for that long. Then it uploads the buffer a few samples per line, in between
+its regular samples:
+
+    BURST_BEGIN,<samples>,<start_ms>
+    BURST_DATA,<first_index>,<t_us>:<voltage_V>:<current_mA>,...|<chunk>*<crc>
+    BURST_END,<samples>
+
+t_us counts from the moment the load closed; start_ms is that moment on the
+cycle's clock. BURST_DATA lines carry the stream_integrity trailer, so corrupt
+chunks are dropped and the segment records how many samples arrived.
+
+BurstReceiver fills preallocated arrays as chunks arrive, which costs the Tk
+thread a few microseconds per line. The segment is stored with its cycle as
+one cycle_bursts row of packed arrays (BURST_DTYPES), so a burst of thousands
+of samples is a single small insert instead of as many readings rows.
+"""
+import numpy as np
+
+BURST_DTYPES = {"time_us": "<u4", "voltage": "<f4", "current": "<f4"}
+MAX_BURST_SAMPLES = 20000   # a BURST_BEGIN asking for more is treated as corrupt
+DEFAULT_WINDOW_MS = 300
+
+
+def burst_metrics(time_us, voltage):
+    """Lowest voltage of a burst, when it happened and the achieved sample rate."""
+    if len(voltage) == 0:
+        return {"min_voltage": None, "time_to_min_ms": None, "sample_rate_hz": None}
+    k = int(np.argmin(voltage))
+    span_s = (int(time_us[-1]) - int(time_us[0])) / 1e6
+    return {
+        "min_voltage": float(voltage[k]),
+        "time_to_min_ms": float(time_us[k]) / 1000.0,
+        "sample_rate_hz": (len(time_us) - 1) / span_s if span_s > 0 else None,
+    }
+
+
+class BurstReceiver:
+    """Collects one uploaded burst; every method runs in the Tk thread."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.expected = None
+        self.start_ms = None
+        self.complete = False
+        self.time_us = self.voltage = self.current = self.filled = None
+
+    @property
+    def active(self):
+        return self.expected is not None
+
+    def begin(self, payload):
+        """Handles 'BURST_BEGIN,<samples>,<start_ms>'. Raises ValueError if malformed."""
+        parts = payload.split(',')
+        count, start_ms = int(parts[1]), int(parts[2])
+        if not 0 <= count <= MAX_BURST_SAMPLES:
+            raise ValueError(f"burst of {count} samples")
+        self.reset()
+        self.expected = count
+        self.start_ms = start_ms
+        self.time_us = np.zeros(count, dtype=BURST_DTYPES["time_us"])
+        self.voltage = np.zeros(count, dtype=BURST_DTYPES["voltage"])
+        self.current = np.zeros(count, dtype=BURST_DTYPES["current"])
+        self.filled = np.zeros(count, dtype=bool)
+
+    def add(self, payload):
+        """Handles one 'BURST_DATA,...' line. Returns the samples it held. Raises ValueError if malformed."""
+        if not self.active:
+            return 0
+        parts = payload.split(',')
+        index = int(parts[1])
+        samples = [field.split(':') for field in parts[2:]]
+        if index < 0 or index + len(samples) > self.expected:
+            raise ValueError(f"samples {index}..{index + len(samples)} outside a burst of {self.expected}")
+        end = index + len(samples)
+        self.time_us[index:end], self.voltage[index:end], self.current[index:end] = zip(*((int(t), float(v), float(i)) for t, v, i in samples))
+        self.filled[index:end] = True
+        return len(samples)
+
+    def end(self, payload):
+        self.complete = True
+
+    @property
+    def received(self):
+        return int(self.filled.sum()) if self.active else 0
+
+    def segment(self):
+        """The samples that arrived, as (time_us, voltage, current) arrays in capture order."""
+        return self.time_us[self.filled], self.voltage[self.filled], self.current[self.filled]
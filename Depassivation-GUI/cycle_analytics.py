@@ -0,0 +1,311 @@
+"""
+Depassivation-specific metrics computed from a cycle's stored arrays.
+
+All metrics for one cycle are computed in a single vectorized NumPy pass.
+CycleAccumulator produces the same metrics online, one sample at a time.
+Historical cycles can be recomputed in bulk in a process pool:
+
+    python cycle_analytics.py --recompute [--jobs 4] [--force]
+"""
+import argparse
+import multiprocessing
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from data_handler import DB_FILE, CYCLE_ANALYTICS_COLUMNS, RETENTION_COLUMNS, ensure_columns
+import sample_files
+
+# Bump when the metric definitions change so stored results get recomputed
+ANALYTICS_VERSION = 2
+
+# Smallest current step (mA) treated as a load connect/disconnect for the ΔV/ΔI resistance
+MIN_LOAD_STEP_MA = 20.0
+
+METRIC_NAMES = [name for name in CYCLE_ANALYTICS_COLUMNS if name != "analytics_version"]
+
+
+def compute_cycle_metrics(times_s, voltages, currents_ma, pass_fail_voltage=None):
+    """
+    Computes the voltage-delay and delivery metrics of one cycle:
+      dip_depth       - drop from the first reading to the minimum voltage (V)
+      time_to_min     - time from the first reading to the minimum voltage (s)
+      recovery_time   - time from the minimum until voltage is back at/above pass_fail_voltage (s),
+                        0 if it never dipped below, None if it never recovered
+      charge_mah      - delivered charge, trapezoidal integral of current (mAh)
+      energy_mwh      - delivered energy, trapezoidal integral of V*I (mWh)
+      step_resistance - ΔV/ΔI across the largest current step (Ω), None without a clear load step
+      time_below      - time spent below pass_fail_voltage (s), each interval counted by its starting sample
+    """
+    t = np.asarray(times_s, dtype=float)
+    v = np.asarray(voltages, dtype=float)
+    i = np.asarray(currents_ma, dtype=float)
+    if t.size == 0:
+        return {}
+
+    i_min = int(np.argmin(v))
+    metrics = {
+        'dip_depth': float(v[0] - v[i_min]),
+        'time_to_min': float(t[i_min] - t[0]),
+        'recovery_time': None,
+        'charge_mah': 0.0,
+        'energy_mwh': 0.0,
+        'step_resistance': None,
+        'time_below': None,
+    }
+
+    if pass_fail_voltage is not None:
+        metrics['time_below'] = 0.0
+        if v[i_min] >= pass_fail_voltage:
+            metrics['recovery_time'] = 0.0
+        else:
+            recovered = np.flatnonzero(v[i_min:] >= pass_fail_voltage)
+            if recovered.size:
+                metrics['recovery_time'] = float(t[i_min + recovered[0]] - t[i_min])
+
+    if t.size > 1:
+        dt = np.diff(t)
+        power = v * i
+        metrics['charge_mah'] = float(np.sum(dt * (i[1:] + i[:-1])) / 2.0 / 3600.0)
+        metrics['energy_mwh'] = float(np.sum(dt * (power[1:] + power[:-1])) / 2.0 / 3600.0)
+        if pass_fail_voltage is not None:
+            metrics['time_below'] = float(np.sum(dt[v[:-1] < pass_fail_voltage]))
+
+        d_i = np.diff(i)
+        step = int(np.argmax(np.abs(d_i)))
+        if abs(d_i[step]) >= MIN_LOAD_STEP_MA:
+            # Voltage falls as current rises, so R = -ΔV/ΔI (ΔI in mA)
+            metrics['step_resistance'] = float(-(v[step + 1] - v[step]) / d_i[step] * 1000.0)
+
+    return metrics
+
+
+def compute_cycle_extremes(voltages, currents_ma):
+    """
+    (min_voltage, max_current, power, resistance) of a cycle, the vectorized counterpart of
+    CycleAccumulator's: power and resistance are taken at the first reading of maximum current.
+    All None without samples.
+    """
+    v = np.asarray(voltages, dtype=float)
+    i = np.asarray(currents_ma, dtype=float)
+    if v.size == 0:
+        return None, None, None, None
+    k = int(np.argmax(i))
+    v_at, i_at = float(v[k]), float(i[k])
+    return float(v.min()), i_at, v_at * i_at, (v_at * 1000) / i_at if i_at > 0.1 else 0.0
+
+
+def cycle_result(min_voltage, pass_fail_voltage, aborted=False):
+    """The result stored with a cycle; min_voltage is None when no sample arrived."""
+    if min_voltage is None:
+        return "NO DATA"
+    if aborted:
+        return "ABORTED"
+    return "PASS" if min_voltage >= pass_fail_voltage else "FAIL"
+
+
+class CycleAccumulator:
+    """
+    Online counterpart of compute_cycle_metrics, fed one DATA sample at a time.
+    Each add() and finalize() is O(1); also keeps Welford mean/variance of the voltage
+    and the reading at maximum current used for the cycle's power/resistance.
+    """
+    def __init__(self, pass_fail_voltage=None):
+        self.pass_fail_voltage = pass_fail_voltage
+        self.count = 0
+        self.first_t = None
+        self.first_v = None
+        self.last_t = None
+        self.last_v = None
+        self.last_i = None
+        self.min_voltage = None
+        self.min_t = None
+        self.max_voltage = None
+        self.max_current = None
+        self.power = None
+        self.resistance = None
+        self.mean_voltage = 0.0
+        self._m2 = 0.0
+        self.charge_mas = 0.0   # mA·s
+        self.energy_mws = 0.0   # mW·s
+        self.time_below = 0.0
+        self.recovered_t = None
+        self._max_step = 0.0
+        self.step_resistance = None
+
+    def add(self, t, v, i):
+        if self.count == 0:
+            self.first_t = t
+            self.first_v = v
+        else:
+            dt = t - self.last_t
+            self.charge_mas += dt * (i + self.last_i) / 2.0
+            self.energy_mws += dt * (v * i + self.last_v * self.last_i) / 2.0
+            if self.pass_fail_voltage is not None and self.last_v < self.pass_fail_voltage:
+                self.time_below += dt
+            d_i = i - self.last_i
+            if abs(d_i) > self._max_step:
+                self._max_step = abs(d_i)
+                self.step_resistance = -(v - self.last_v) / d_i * 1000.0 if abs(d_i) >= MIN_LOAD_STEP_MA else None
+
+        if self.min_voltage is None or v < self.min_voltage:
+            self.min_voltage = v
+            self.min_t = t
+            self.recovered_t = None
+        elif (self.recovered_t is None and self.pass_fail_voltage is not None
+              and self.min_voltage < self.pass_fail_voltage <= v):
+            self.recovered_t = t
+        if self.max_voltage is None or v > self.max_voltage:
+            self.max_voltage = v
+        if self.max_current is None or i > self.max_current:
+            self.max_current = i
+            self.power = v * i
+            self.resistance = (v * 1000) / i if i > 0.1 else 0.0
+
+        # Welford's update for the running mean/variance of the voltage
+        self.count += 1
+        delta = v - self.mean_voltage
+        self.mean_voltage += delta / self.count
+        self._m2 += delta * (v - self.mean_voltage)
+
+        self.last_t = t
+        self.last_v = v
+        self.last_i = i
+
+    @property
+    def voltage_std(self):
+        return (self._m2 / (self.count - 1)) ** 0.5 if self.count > 1 else None
+
+    def finalize(self):
+        """Returns the same metrics dict as compute_cycle_metrics for the samples seen so far."""
+        if self.count == 0:
+            return {}
+        metrics = {
+            'dip_depth': self.first_v - self.min_voltage,
+            'time_to_min': self.min_t - self.first_t,
+            'recovery_time': None,
+            'charge_mah': self.charge_mas / 3600.0,
+            'energy_mwh': self.energy_mws / 3600.0,
+            'step_resistance': self.step_resistance,
+            'time_below': None,
+        }
+        if self.pass_fail_voltage is not None:
+            metrics['time_below'] = self.time_below
+            if self.min_voltage >= self.pass_fail_voltage:
+                metrics['recovery_time'] = 0.0
+            elif self.recovered_t is not None:
+                metrics['recovery_time'] = self.recovered_t - self.min_t
+        return metrics
+
+
+# --- Bulk recompute ---
+_worker_conn = None
+
+
+def _init_worker(db_file):
+    global _worker_conn
+    _worker_conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+
+def _analyze_chunk(chunk):
+    """Computes metrics for a list of (cycle_id, pass_fail_voltage). Runs inside a worker process."""
+    thresholds = dict(chunk)
+    in_files = sample_files.file_backed(_worker_conn, thresholds)
+    results = []
+    for cycle_id in in_files:
+        timestamps, voltages, currents = sample_files.read_samples(_worker_conn, cycle_id)
+        if len(timestamps):
+            results.append((cycle_id, compute_cycle_metrics(timestamps / 1000.0, voltages, currents, thresholds[cycle_id])))
+    ids = [cycle_id for cycle_id, _ in chunk if cycle_id not in in_files]
+    placeholders = ",".join("?" * len(ids))
+    rows = _worker_conn.execute(
+        f"""SELECT cycle_id, timestamp_ms, voltage, current FROM readings
+            WHERE cycle_id IN ({placeholders}) ORDER BY cycle_id ASC, timestamp_ms ASC""",
+        ids
+    ).fetchall() if ids else []
+    if rows:
+        table = np.array(rows, dtype=float)
+        starts = np.flatnonzero(np.diff(table[:, 0])) + 1
+        for block in np.split(table, starts):
+            cycle_id = int(block[0, 0])
+            metrics = compute_cycle_metrics(block[:, 1] / 1000.0, block[:, 2], block[:, 3], thresholds[cycle_id])
+            results.append((cycle_id, metrics))
+    return results
+
+
+def recompute_all(db_file=DB_FILE, workers=None, force=False, chunk_size=50, progress=None):
+    """
+    Recomputes the metrics of every cycle whose stored results are missing or out of date
+    (all cycles with force=True) and writes them back in a single transaction.
+    Cycles compacted by retention are skipped; their metrics came from the raw samples.
+    Returns the number of cycles updated.
+    """
+    conn = sqlite3.connect(db_file)
+    try:
+        with conn:
+            ensure_columns(conn.cursor(), "cycles", CYCLE_ANALYTICS_COLUMNS)
+            ensure_columns(conn.cursor(), "cycles", RETENTION_COLUMNS)
+        sql = "SELECT id, pass_fail_voltage FROM cycles WHERE retention_level = 0"
+        if not force:
+            sql += " AND (analytics_version IS NULL OR analytics_version < ?)"
+            todo = conn.execute(sql, (ANALYTICS_VERSION,)).fetchall()
+        else:
+            todo = conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+    if not todo:
+        return 0
+
+    chunks = [todo[k:k + chunk_size] for k in range(0, len(todo), chunk_size)]
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(db_file,)) as pool:
+        for done, chunk_results in enumerate(pool.map(_analyze_chunk, chunks), 1):
+            results.extend(chunk_results)
+            if progress:
+                progress(done, len(chunks))
+
+    # Cycles without readings are stamped too, so they are not picked up again on every run
+    analyzed = {cycle_id for cycle_id, _ in results}
+    results.extend((cycle_id, {}) for cycle_id, _ in todo if cycle_id not in analyzed)
+
+    assignments = ", ".join(f"{name} = ?" for name in METRIC_NAMES)
+    sql = f"UPDATE cycles SET {assignments}, analytics_version = ? WHERE id = ?"
+    params = [[metrics.get(name) for name in METRIC_NAMES] + [ANALYTICS_VERSION, cycle_id]
+              for cycle_id, metrics in results]
+    conn = sqlite3.connect(db_file)
+    try:
+        with conn:
+            conn.executemany(sql, params)
+    finally:
+        conn.close()
+    return len(params)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute depassivation analytics for stored cycles.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--recompute", action="store_true", help="Recompute missing or outdated cycle metrics.")
+    parser.add_argument("--force", action="store_true", help="Recompute every cycle, even if up to date.")
+    parser.add_argument("--jobs", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+    if not args.recompute:
+        parser.print_help()
+        return
+
+    def report(done, total):
+        print(f"\rAnalyzing chunk {done}/{total}...", end="", flush=True)
+
+    updated = recompute_all(args.db, workers=args.jobs, force=args.force, progress=report)
+    print(f"\nINFO: Updated analytics for {updated} cycle(s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import numpy as np
+
+ALIGN_MODES = ("Start", "Min Voltage")
+
+
+def resample_cycles(series, num_points=500, align="Start", t_max=None):
+    """
+    Resamples a list of (times_s, voltages) arrays onto one common time grid.
+    Returns (grid, matrix) where matrix has one row per cycle and is NaN
+    wherever a cycle has no data (before its first or after its last sample).
+    """
+    series = [(np.asarray(t, dtype=float), np.asarray(v, dtype=float)) for t, v in series if len(t) > 0]
+    if not series:
+        return np.empty(0), np.empty((0, 0))
+
+    if align == "Min Voltage":
+        # Shift each cycle so its voltage minimum sits at t = 0
+        series = [(t - t[np.argmin(v)], v) for t, v in series]
+
+    t_lo = min(t[0] for t, _ in series)
+    t_hi = max(t[-1] for t, _ in series)
+    if t_max is not None:
+        t_hi = min(t_hi, t_max)
+    if t_hi <= t_lo:
+        t_hi = t_lo + 1.0
+    grid = np.linspace(t_lo, t_hi, num_points)
+
+    matrix = np.full((len(series), num_points), np.nan)
+    for row, (t, v) in enumerate(series):
+        inside = (grid >= t[0]) & (grid <= t[-1])
+        matrix[row, inside] = np.interp(grid[inside], t, v)
+    return grid, matrix
+
+
+def compute_bands(matrix, percentiles=(10, 50, 90)):
+    """Computes mean and percentile bands over all cycles in one pass along axis 0."""
+    if matrix.size == 0:
+        return {}
+    counts = np.sum(~np.isnan(matrix), axis=0)
+    valid = counts > 0
+    bands = {"count": counts}
+    mean = np.full(matrix.shape[1], np.nan)
+    mean[valid] = np.nanmean(matrix[:, valid], axis=0)
+    bands["mean"] = mean
+    pct = np.full((len(percentiles), matrix.shape[1]), np.nan)
+    pct[:, valid] = np.nanpercentile(matrix[:, valid], percentiles, axis=0)
+    for p, row in zip(percentiles, pct):
+        bands[f"p{p}"] = row
+    return bands
@@ -1,19 +1,89 @@
 import json
 import os
 import sqlite3
+import time
 from contextlib import contextmanager
 from datetime import datetime
 
+import numpy as np
+
+from profiler import tag
+from ingest_journal import JOURNAL_FILE, IngestJournal, ensure_checkpoint_table, recover_unfinished_cycles
+from burst_capture import BURST_DTYPES, burst_metrics
+import sample_files
+
 PROFILES_FILE = "profiles.json"
 CONFIG_FILE = "config.json"
 DB_FILE = "depassivation_history.db"
 
+# Columns filled in by cycle_analytics; added to existing databases on startup
+CYCLE_ANALYTICS_COLUMNS = {
+    "dip_depth": "REAL",
+    "time_to_min": "REAL",
+    "recovery_time": "REAL",
+    "charge_mah": "REAL",
+    "energy_mwh": "REAL",
+    "step_resistance": "REAL",
+    "time_below": "REAL",
+    "analytics_version": "INTEGER",
+}
+
+# How a cycle ended; completed_early is set when adaptive termination stopped it
+CYCLE_END_COLUMNS = {
+    "end_reason": "TEXT",
+    "completed_early": "INTEGER",
+}
+
+# Acquisition link quality, from stream_integrity.StreamMonitor; completeness is NULL for firmware without sequence numbers
+STREAM_COLUMNS = {
+    "samples_received": "INTEGER",
+    "samples_missing": "INTEGER",
+    "samples_duplicate": "INTEGER",
+    "frames_corrupt": "INTEGER",
+    "completeness": "REAL",
+    "sample_rate_hz": "REAL",
+}
+
+# Indexed epoch copy of the free-form 'timestamp' text, used for range queries
+EPOCH_COLUMNS = {
+    "timestamp_epoch": "INTEGER",
+}
+
+# How far retention has compacted a cycle's readings (see retention.py); 0 = raw
+RETENTION_COLUMNS = {
+    "retention_level": "INTEGER NOT NULL DEFAULT 0",
+}
+
+# Numeric cycle columns the history search can filter on with a min/max range
+SEARCHABLE_METRICS = (
+    "min_voltage", "max_current", "power", "resistance", "duration",
+    "dip_depth", "recovery_time", "charge_mah", "energy_mwh", "time_below",
+    "completeness", "sample_rate_hz",
+)
+
+def to_epoch(date_text, end_of_day=False):
+    """Converts a local 'YYYY-MM-DD' date to epoch seconds (start or end of that day)."""
+    day = datetime.strptime(date_text.strip(), "%Y-%m-%d")
+    if end_of_day:
+        day = day.replace(hour=23, minute=59, second=59)
+    return int(day.timestamp())
+
+def ensure_columns(cursor, table, columns):
+    """Adds any missing columns to an existing table."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in cursor.fetchall()}
+    for name, declaration in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
 class DataHandler:
     def __init__(self, app):
         self.app = app
         self.profiles = {}
         self.current_test_id = None
         self.current_cycle_id = None
+        self.journal = None
+        self.sample_storage = "sqlite"   # "files" stores new cycles in memory-mapped files, see sample_files.py
 
     @contextmanager
     def _get_db_cursor(self, commit=False, row_factory=None):
@@ -38,6 +108,9 @@ class DataHandler:
 
     def _init_database(self):
         with self._get_db_cursor(commit=True) as cursor:
+            # Only takes effect while the file is still empty; older databases are converted by retention.py --convert
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
             # --- batteries table (kept from old schema) ---
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS batteries (
@@ -88,6 +161,78 @@ class DataHandler:
                 )
             """)
 
+            # --- cycle_events table (anomalies flagged during acquisition) ---
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cycle_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cycle_id INTEGER NOT NULL,
+                    timestamp_ms INTEGER NOT NULL,
+                    event_type TEXT NOT NULL,
+                    severity TEXT NOT NULL,
+                    value REAL,
+                    detail TEXT,
+                    FOREIGN KEY (cycle_id) REFERENCES cycles (id) ON DELETE CASCADE
+                )
+            """)
+
+            # --- cycle_steps table (load profile step markers reported by the device) ---
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cycle_steps (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cycle_id INTEGER NOT NULL,
+                    timestamp_ms INTEGER NOT NULL,
+                    step_index INTEGER NOT NULL,
+                    label TEXT,
+                    FOREIGN KEY (cycle_id) REFERENCES cycles (id) ON DELETE CASCADE
+                )
+            """)
+
+            # --- cycle_bursts table (high-rate segment captured when the load connects, see burst_capture.py) ---
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS cycle_bursts (
+                    cycle_id INTEGER PRIMARY KEY,
+                    start_ms INTEGER NOT NULL,
+                    samples_expected INTEGER NOT NULL,
+                    sample_count INTEGER NOT NULL,
+                    time_us BLOB NOT NULL,
+                    voltage BLOB NOT NULL,
+                    current BLOB NOT NULL,
+                    min_voltage REAL,
+                    time_to_min_ms REAL,
+                    sample_rate_hz REAL,
+                    FOREIGN KEY (cycle_id) REFERENCES cycles (id) ON DELETE CASCADE
+                )
+            """)
+
+            # --- cycle_sample_files table (cycles whose samples live in a memory-mapped file, see sample_files.py) ---
+            sample_files.ensure_table(cursor)
+
+            # --- journal_checkpoint table (how far the ingestion journal has been applied) ---
+            ensure_checkpoint_table(cursor)
+
+            ensure_columns(cursor, "cycles", CYCLE_ANALYTICS_COLUMNS)
+            ensure_columns(cursor, "cycles", CYCLE_END_COLUMNS)
+            ensure_columns(cursor, "cycles", RETENTION_COLUMNS)
+            ensure_columns(cursor, "cycles", STREAM_COLUMNS)
+            for table in ("tests", "cycles"):
+                ensure_columns(cursor, table, EPOCH_COLUMNS)
+                # Backfill older rows; the stored text is local time
+                cursor.execute(f"""UPDATE {table} SET timestamp_epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+                                   WHERE timestamp_epoch IS NULL""")
+
+            # --- indexes for per-cycle lookups ---
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_cycle ON readings (cycle_id, timestamp_ms)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycles_test ON cycles (test_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycle_events_cycle ON cycle_events (cycle_id, timestamp_ms)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycle_events_type ON cycle_events (event_type, severity)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycle_steps_cycle ON cycle_steps (cycle_id, timestamp_ms)")
+            # --- indexes for the history search ---
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycles_epoch ON cycles (timestamp_epoch, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycles_type_result_epoch ON cycles (cycle_type, result, timestamp_epoch)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycles_min_voltage ON cycles (min_voltage)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tests_profile ON tests (profile_name)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_cycles_retention ON cycles (retention_level, timestamp_epoch)")
+
     # --- Battery Management Methods ---
     def create_battery(self, name):
         """Creates a new battery profile. Returns the ID of the new battery or None on failure."""
@@ -120,11 +265,12 @@ class DataHandler:
             self.app.log_message("ERROR: Cannot create test without a selected battery.")
             return None
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        sql = "INSERT INTO tests (battery_id, timestamp, profile_name) VALUES (?, ?, ?)"
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        sql = "INSERT INTO tests (battery_id, timestamp, timestamp_epoch, profile_name) VALUES (?, ?, ?, ?)"
 
         with self._get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, (battery_id, timestamp, profile_name))
+            cursor.execute(sql, (battery_id, timestamp, int(now.timestamp()), profile_name))
             self.current_test_id = cursor.lastrowid
             self.app.log_message(f"INFO: Started new test (ID: {self.current_test_id}) for battery ID: {battery_id}")
             return self.current_test_id
@@ -136,23 +282,122 @@ class DataHandler:
             self.app.log_message("ERROR: Cannot create cycle without a test ID.")
             return None
 
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        sql = "INSERT INTO cycles (test_id, cycle_type, timestamp, duration, pass_fail_voltage) VALUES (?, ?, ?, ?, ?)"
+        now = datetime.now()
+        timestamp = now.strftime("%Y-%m-%d %H:%M:%S")
+        sql = "INSERT INTO cycles (test_id, cycle_type, timestamp, timestamp_epoch, duration, pass_fail_voltage) VALUES (?, ?, ?, ?, ?, ?)"
         with self._get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, (test_id, cycle_type, timestamp, duration, pass_fail_voltage))
+            cursor.execute(sql, (test_id, cycle_type, timestamp, int(now.timestamp()), duration, pass_fail_voltage))
             self.current_cycle_id = cursor.lastrowid
+            if self.sample_storage == "files":
+                try:
+                    sample_files.create(cursor.connection, self.current_cycle_id)
+                except OSError as e:
+                    self.app.log_message(f"WARN: Could not create a sample file, storing this cycle in the database: {e}")
             self.app.log_message(f"INFO: Started new cycle (ID: {self.current_cycle_id}, Type: {cycle_type}) for test ID: {test_id}")
             return self.current_cycle_id
         return None
 
+    @tag("db")
     def log_reading(self, cycle_id, timestamp_ms, voltage, current):
         """Logs a single data point for a cycle."""
         if cycle_id is None:
             return
+        if self.journal is not None:
+            # Counted by _journal_applied once the batch holding it commits
+            self.journal.append(cycle_id, timestamp_ms, voltage, current)
+            return
         sql = "INSERT INTO readings (cycle_id, timestamp_ms, voltage, current) VALUES (?, ?, ?, ?)"
+        telemetry = self.app.telemetry
+        start = time.perf_counter()
+        conn = sqlite3.connect(DB_FILE)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            with conn:
+                if sample_files.store(conn, [(cycle_id, timestamp_ms, voltage, current)]):
+                    conn.execute(sql, (cycle_id, timestamp_ms, voltage, current))
+        except sqlite3.Error as e:
+            telemetry.db_write_errors += 1
+            self.app.log_message(f"ERROR: Database error: {e}")
+            return
+        finally:
+            conn.close()
+        telemetry.record_db_write(time.perf_counter() - start)
+        telemetry.samples_stored += 1
+
+    def _journal_applied(self, samples, seconds, ok):
+        """Journal on_apply hook; runs in the applier thread, which is then the only writer of these counters."""
+        telemetry = self.app.telemetry
+        if not ok:
+            telemetry.db_write_errors += 1
+            return
+        telemetry.record_db_write(seconds)
+        telemetry.samples_stored += samples
+
+    @tag("db")
+    def open_journal(self, log, path=JOURNAL_FILE):
+        """Routes log_reading through the crash-safe ingestion journal. Returns what was replayed from the last run."""
+        journal = IngestJournal(DB_FILE, path, log, on_apply=self._journal_applied)
+        summary = journal.open()
+        self.journal = journal
+        return summary
+
+    @tag("db")
+    def recover_unfinished_cycles(self):
+        """Closes cycles an unclean shutdown left open; call once at startup, after the journal replay. Returns their ids."""
+        with self._get_db_cursor() as cursor:
+            return recover_unfinished_cycles(cursor.connection)
+        return []
+
+    def flush_journal(self):
+        """Makes every logged reading visible in the database; returns False if it could not be applied yet."""
+        return self.journal.flush() if self.journal is not None else True
+
+    def has_unapplied_samples(self, cycle_id):
+        """True while samples of cycle_id are still in the ingestion journal; safe from any thread."""
+        journal = self.journal
+        return journal is not None and cycle_id in journal.unapplied_cycles()
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def log_cycle_events(self, cycle_id, events):
+        """Stores anomaly events (dicts from AnomalyDetector.update) for a cycle."""
+        if cycle_id is None or not events:
+            return
+        sql = "INSERT INTO cycle_events (cycle_id, timestamp_ms, event_type, severity, value, detail) VALUES (?, ?, ?, ?, ?, ?)"
+        with self._get_db_cursor(commit=True) as cursor:
+            cursor.executemany(sql, [(cycle_id, e['timestamp_ms'], e['event_type'], e['severity'], e['value'], e['detail']) for e in events])
+
+    def get_cycle_events(self, cycle_id):
+        """Fetches the anomaly events of a cycle in time order."""
+        if cycle_id is None: return []
+        sql = "SELECT timestamp_ms, event_type, severity, value, detail FROM cycle_events WHERE cycle_id = ? ORDER BY timestamp_ms ASC"
+        with self._get_db_cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute(sql, (cycle_id,))
+            return cursor.fetchall()
+        return []
+
+    @tag("db")
+    def log_cycle_step(self, cycle_id, timestamp_ms, step_index, label):
+        """Stores the start of a load profile step."""
+        if cycle_id is None:
+            return
+        sql = "INSERT INTO cycle_steps (cycle_id, timestamp_ms, step_index, label) VALUES (?, ?, ?, ?)"
         with self._get_db_cursor(commit=True) as cursor:
-            cursor.execute(sql, (cycle_id, timestamp_ms, voltage, current))
+            cursor.execute(sql, (cycle_id, timestamp_ms, step_index, label))
+
+    def get_cycle_steps(self, cycle_id):
+        """Fetches the load profile step markers of a cycle in time order."""
+        if cycle_id is None: return []
+        sql = "SELECT timestamp_ms, step_index, label FROM cycle_steps WHERE cycle_id = ? ORDER BY timestamp_ms ASC"
+        with self._get_db_cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute(sql, (cycle_id,))
+            return cursor.fetchall()
+        return []
 
+    @tag("db")
     def update_cycle_result(self, cycle_id, min_voltage, max_current, power, resistance, result):
         """Updates a cycle with its final results."""
         if cycle_id is None:
@@ -163,14 +408,200 @@ class DataHandler:
         with self._get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, (min_voltage, max_current, power, resistance, result, cycle_id))
 
+    @tag("db")
+    def update_cycle_end(self, cycle_id, end_reason, completed_early=False):
+        """Records why a cycle ended."""
+        if cycle_id is None:
+            return
+        sql = "UPDATE cycles SET end_reason = ?, completed_early = ? WHERE id = ?"
+        with self._get_db_cursor(commit=True) as cursor:
+            cursor.execute(sql, (end_reason, 1 if completed_early else 0, cycle_id))
+
+    @tag("db")
+    def save_burst(self, cycle_id, start_ms, samples_expected, time_us, voltage, current):
+        """Stores a cycle's burst segment as packed arrays (BURST_DTYPES), with its summary metrics."""
+        if cycle_id is None:
+            return
+        metrics = burst_metrics(time_us, voltage)
+        sql = """INSERT OR REPLACE INTO cycle_bursts (cycle_id, start_ms, samples_expected, sample_count, time_us, voltage, current,
+                                                      min_voltage, time_to_min_ms, sample_rate_hz)
+                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+        arrays = [np.asarray(values, dtype=BURST_DTYPES[name]).tobytes()
+                  for name, values in (("time_us", time_us), ("voltage", voltage), ("current", current))]
+        with self._get_db_cursor(commit=True) as cursor:
+            cursor.execute(sql, [cycle_id, start_ms, samples_expected, len(time_us)] + arrays +
+                           [metrics["min_voltage"], metrics["time_to_min_ms"], metrics["sample_rate_hz"]])
+
+    def get_burst(self, cycle_id):
+        """Returns a cycle's burst segment with its arrays decoded, or None if it has none."""
+        if cycle_id is None: return None
+        with self._get_db_cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute("SELECT * FROM cycle_bursts WHERE cycle_id = ?", (cycle_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            burst = dict(row)
+            for name, dtype in BURST_DTYPES.items():
+                burst[name] = np.frombuffer(row[name], dtype=dtype)
+            return burst
+        return None
+
+    @tag("db")
+    def update_cycle_stream(self, cycle_id, stats):
+        """Stores the link statistics of a cycle (see STREAM_COLUMNS)."""
+        if cycle_id is None:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in STREAM_COLUMNS)
+        with self._get_db_cursor(commit=True) as cursor:
+            cursor.execute(f"UPDATE cycles SET {assignments} WHERE id = ?", [stats.get(name) for name in STREAM_COLUMNS] + [cycle_id])
+
+    @tag("db")
+    def update_cycle_analytics(self, cycle_id, metrics, version):
+        """Stores the derived metrics computed by cycle_analytics for a cycle."""
+        if cycle_id is None or not metrics:
+            return
+        names = [name for name in CYCLE_ANALYTICS_COLUMNS if name != "analytics_version"]
+        assignments = ", ".join(f"{name} = ?" for name in names)
+        sql = f"UPDATE cycles SET {assignments}, analytics_version = ? WHERE id = ?"
+        with self._get_db_cursor(commit=True) as cursor:
+            cursor.execute(sql, [metrics.get(name) for name in names] + [version, cycle_id])
+
+    @tag("db")
     def get_cycle_data(self, cycle_id):
         """Gets all data points for a specific cycle."""
         if cycle_id is None: return []
-        sql = "SELECT timestamp_ms, voltage, current FROM readings WHERE cycle_id = ? ORDER BY timestamp_ms ASC"
+        times, voltages, currents = self.get_cycle_series(cycle_id)
+        return list(zip(times.tolist(), voltages.tolist(), currents.tolist()))
+
+    @tag("db")
+    def get_cycle_series(self, cycle_id, start_s=None, end_s=None):
+        """
+        (times_s, voltages, currents) NumPy arrays of a cycle, optionally limited to
+        start_s <= t < end_s. For file-backed cycles the range is found and sliced
+        before anything is converted, so only the window's timestamps are read into
+        times_s; voltages and currents stay memmap views, paged in only where used.
+        """
+        empty = (np.zeros(0), np.zeros(0), np.zeros(0))
+        if cycle_id is None: return empty
+        start_ms = None if start_s is None else int(np.ceil(start_s * 1000))
+        end_ms = None if end_s is None else int(np.ceil(end_s * 1000))
         with self._get_db_cursor() as cursor:
-            cursor.execute(sql, (cycle_id,))
-            data = cursor.fetchall()
-            return [(ts / 1000.0, v, c) for ts, v, c in data]
+            timestamps, voltages, currents = sample_files.read_samples(cursor.connection, cycle_id, start_ms, end_ms)
+            return timestamps / 1000.0, voltages, currents
+        return empty
+
+    @tag("db")
+    def get_multiple_cycle_data(self, cycle_ids):
+        """
+        Gets the data points for several cycles with a single query.
+        Returns a dict mapping cycle_id -> (times_s, voltages, currents) as NumPy arrays.
+        """
+        if not cycle_ids: return {}
+        with self._get_db_cursor() as cursor:
+            series = {}
+            in_files = sample_files.file_backed(cursor.connection, cycle_ids)
+            for cycle_id in in_files:
+                timestamps, voltages, currents = sample_files.read_samples(cursor.connection, cycle_id)
+                if len(timestamps):
+                    series[cycle_id] = (timestamps / 1000.0, voltages, currents)
+            cycle_ids = [cycle_id for cycle_id in cycle_ids if cycle_id not in in_files]
+            if not cycle_ids:
+                return series
+            placeholders = ",".join("?" * len(cycle_ids))
+            sql = f"""SELECT cycle_id, timestamp_ms, voltage, current FROM readings
+                      WHERE cycle_id IN ({placeholders}) ORDER BY cycle_id ASC, timestamp_ms ASC"""
+            cursor.execute(sql, tuple(cycle_ids))
+            rows = cursor.fetchall()
+            if not rows:
+                return series
+            table = np.array(rows, dtype=float)
+            # Rows are sorted by cycle, so each cycle is one contiguous slice
+            ids = table[:, 0].astype(np.int64)
+            starts = np.flatnonzero(np.diff(ids)) + 1
+            for block in np.split(table, starts):
+                series[int(block[0, 0])] = (block[:, 1] / 1000.0, block[:, 2], block[:, 3])
+            return series
+        return {}
+
+    def find_cycles(self, battery_id=None, cycle_type=None, profile_name=None, limit=None):
+        """Fetches cycle summaries matching the given filters, most recent first."""
+        clauses = []
+        params = []
+        if battery_id is not None:
+            clauses.append("t.battery_id = ?")
+            params.append(battery_id)
+        if cycle_type:
+            clauses.append("c.cycle_type = ?")
+            params.append(cycle_type)
+        if profile_name:
+            clauses.append("t.profile_name = ?")
+            params.append(profile_name)
+        sql = "SELECT c.*, t.battery_id, t.profile_name FROM cycles c JOIN tests t ON t.id = c.test_id"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY c.timestamp DESC, c.id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._get_db_cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        return []
+
+    @tag("db")
+    def search_cycles(self, filters, after=None, page_size=200):
+        """
+        Finds cycles matching `filters`, newest first, one page at a time.
+        filters keys (all optional): date_from/date_to ('YYYY-MM-DD', inclusive), battery_id,
+        uncategorized (True for tests without a battery), profile_name, cycle_type, result, and metrics {column: (min, max)} for SEARCHABLE_METRICS.
+        `after` is the (timestamp_epoch, id) of the last row of the previous page (keyset paging).
+        """
+        clauses = []
+        params = []
+        if filters.get('date_from'):
+            clauses.append("c.timestamp_epoch >= ?")
+            params.append(to_epoch(filters['date_from']))
+        if filters.get('date_to'):
+            clauses.append("c.timestamp_epoch <= ?")
+            params.append(to_epoch(filters['date_to'], end_of_day=True))
+        for key, column in (('battery_id', 't.battery_id'), ('profile_name', 't.profile_name'),
+                            ('cycle_type', 'c.cycle_type'), ('result', 'c.result')):
+            if filters.get(key) is not None and filters.get(key) != "":
+                clauses.append(f"{column} = ?")
+                params.append(filters[key])
+        if filters.get('uncategorized'):
+            clauses.append("t.battery_id IS NULL")
+        for column, (low, high) in (filters.get('metrics') or {}).items():
+            if column not in SEARCHABLE_METRICS:
+                raise ValueError(f"Unknown metric: {column}")
+            if low is not None:
+                clauses.append(f"c.{column} >= ?")
+                params.append(low)
+            if high is not None:
+                clauses.append(f"c.{column} <= ?")
+                params.append(high)
+        if after is not None:
+            clauses.append("(c.timestamp_epoch, c.id) < (?, ?)")
+            params.extend(after)
+
+        sql = """SELECT c.id, c.test_id, c.cycle_type, c.timestamp, c.timestamp_epoch, c.result, c.min_voltage,
+                        t.profile_name, t.battery_id
+                 FROM cycles c JOIN tests t ON t.id = c.test_id"""
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY c.timestamp_epoch DESC, c.id DESC LIMIT ?"
+        params.append(int(page_size))
+        with self._get_db_cursor(row_factory=sqlite3.Row) as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+        return []
+
+    def get_profile_names(self):
+        """Returns the distinct profile names recorded on tests."""
+        sql = "SELECT DISTINCT profile_name FROM tests WHERE profile_name IS NOT NULL ORDER BY profile_name ASC"
+        with self._get_db_cursor() as cursor:
+            cursor.execute(sql)
+            return [row[0] for row in cursor.fetchall()]
         return []
 
     def get_tests_for_battery(self, battery_id):
@@ -227,10 +658,30 @@ class DataHandler:
     def delete_test(self, test_id):
         if test_id is None: return False
         sql = "DELETE FROM tests WHERE id = ?"
+        deleted = False
         with self._get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, (test_id,))
-            return cursor.rowcount > 0
-        return False
+            deleted = cursor.rowcount > 0
+        if deleted:
+            self.clean_sample_files()
+        return deleted
+
+    def clean_sample_files(self):
+        """
+        Deletes the sample files of cycles that no longer exist (their rows went with the
+        cycles) and reports files that do not match their rows. Returns the problems found.
+        """
+        with self._get_db_cursor() as cursor:
+            removed, kept = sample_files.remove_orphans(cursor.connection)
+            problems = sample_files.verify(cursor.connection)
+            if removed:
+                self.app.log_message(f"INFO: Removed {len(removed)} sample file(s) of deleted cycles.")
+            if kept:
+                self.app.log_message(f"WARN: {len(kept)} sample file(s) of deleted cycles are in use; they will be removed later.")
+            for cycle_id, problem in problems:
+                self.app.log_message(f"WARN: Sample file of cycle {cycle_id}: {problem}")
+            return problems
+        return []
 
     def delete_battery(self, battery_id):
         if battery_id is None: return False
@@ -245,11 +696,14 @@ class DataHandler:
         """Deletes all tests associated with a specific battery ID."""
         if battery_id is None: return False
         sql = "DELETE FROM tests WHERE battery_id = ?"
+        deleted = False
         with self._get_db_cursor(commit=True) as cursor:
             cursor.execute(sql, (battery_id,))
             self.app.log_message(f"INFO: Deleted {cursor.rowcount} tests for battery ID: {battery_id}.")
-            return cursor.rowcount > 0
-        return False
+            deleted = cursor.rowcount > 0
+        if deleted:
+            self.clean_sample_files()
+        return deleted
 
     # --- Unchanged Profile and Config Methods ---
     def load_profiles(self):
@@ -287,6 +741,21 @@ class DataHandler:
             "pass_fail_voltage": self.app.pass_fail_voltage_var.get(),
             "baseline_duration": self.app.baseline_duration_var.get(),
             "depassivation_duration": self.app.depassivation_duration_var.get(),
+            "live_windows": self.app.live_windows_var.get(),
+            "adaptive_stop": self.app.adaptive_stop_var.get(),
+            "adaptive_window": self.app.adaptive_window_var.get(),
+            "adaptive_slope": self.app.adaptive_slope_var.get(),
+            "anomaly_detection": self.app.anomaly_detection_var.get(),
+            "anomaly_abort": self.app.anomaly_abort_var.get(),
+            "burst_window_ms": self.app.burst_window_var.get(),
+            "profile": self.app.profile_var.get(),
+            "retention": self.app.retention_policy,
+            "metrics_port": self.app.metrics_config_port,
+            "api_port": self.app.api_config_port,
+            "ingest_journal": self.app.journal_enabled,
+            "sample_storage": self.app.sample_storage_config,
+            "acquisition_process": self.app.acquisition_process_config,
+            "station_name": self.app.telemetry.station if self.app.station_name_configured else None,
         }
         try:
             with open(CONFIG_FILE, 'w') as f:
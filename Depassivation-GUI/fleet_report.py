@@ -0,0 +1,260 @@
+"""
+Fleet-wide depassivation effectiveness report.
+
+For every test that holds a Baseline -> Depassivation -> Check sequence, the effect of
+depassivation is the last Check voltage minus the last Baseline voltage, the same
+"Voltage Change (Check - Baseline)" shown for one sequence in the History tab.
+Everything is computed inside SQLite (window functions need SQLite 3.25+):
+  - sequences are picked with ROW_NUMBER() over each test's cycles, like the History tab
+  - last voltages come from per-cycle lookups on idx_readings_cycle, never full readings,
+    or from cycle_sample_files for cycles stored in sample files
+  - results are cached in sequence_summary; triggers on cycles queue changed tests in
+    sequence_summary_dirty, so a refresh only revisits those tests. Writers that change
+    samples without touching a cycle row (retention.compact_chunk, history_archive
+    imports) queue their tests with mark_dirty()
+
+    python fleet_report.py [--group battery profile month] [--csv report.csv] [--rebuild]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+
+from data_handler import DB_FILE
+import sample_files
+
+GROUP_COLUMNS = {
+    'battery': "COALESCE(b.name, 'Uncategorized')",
+    'profile': "COALESCE(t.profile_name, '(none)')",
+    'month': "substr(s.test_timestamp, 1, 7)",
+}
+
+SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sequence_summary (
+        test_id INTEGER PRIMARY KEY,
+        test_timestamp TEXT NOT NULL,
+        baseline_cycle_id INTEGER NOT NULL,
+        depassivation_cycle_id INTEGER NOT NULL,
+        check_cycle_id INTEGER NOT NULL,
+        baseline_last_voltage REAL,
+        check_last_voltage REAL,
+        voltage_change REAL,
+        check_result TEXT,
+        FOREIGN KEY (test_id) REFERENCES tests (id) ON DELETE CASCADE
+    );
+    CREATE TABLE IF NOT EXISTS sequence_summary_dirty (
+        test_id INTEGER PRIMARY KEY
+    );
+    CREATE INDEX IF NOT EXISTS idx_sequence_summary_timestamp ON sequence_summary (test_timestamp);
+    CREATE TRIGGER IF NOT EXISTS trg_cycles_insert_summary AFTER INSERT ON cycles BEGIN
+        INSERT OR IGNORE INTO sequence_summary_dirty (test_id) VALUES (NEW.test_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_cycles_update_summary AFTER UPDATE OF result, cycle_type, test_id, timestamp ON cycles BEGIN
+        INSERT OR IGNORE INTO sequence_summary_dirty (test_id) VALUES (OLD.test_id);
+        INSERT OR IGNORE INTO sequence_summary_dirty (test_id) VALUES (NEW.test_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_cycles_retention_summary AFTER UPDATE OF retention_level ON cycles BEGIN
+        INSERT OR IGNORE INTO sequence_summary_dirty (test_id) VALUES (NEW.test_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_cycles_delete_summary AFTER DELETE ON cycles BEGIN
+        INSERT OR IGNORE INTO sequence_summary_dirty (test_id) VALUES (OLD.test_id);
+    END;
+"""
+
+# Recomputes the summary rows of the queued tests. The first cycle of each type
+# (by timestamp, then id) forms the sequence, matching the History tab.
+REFRESH_SQL = """
+    INSERT INTO sequence_summary
+    WITH ranked AS (
+        SELECT c.id, c.test_id, c.cycle_type, c.result,
+               ROW_NUMBER() OVER (PARTITION BY c.test_id, c.cycle_type ORDER BY c.timestamp, c.id) AS rn
+        FROM cycles c
+        WHERE c.test_id IN (SELECT test_id FROM sequence_summary_dirty)
+          AND c.cycle_type IN ('Baseline', 'Depassivation', 'Check')
+    ), sequences AS (
+        SELECT test_id,
+               MAX(CASE WHEN cycle_type = 'Baseline' THEN id END) AS baseline_id,
+               MAX(CASE WHEN cycle_type = 'Depassivation' THEN id END) AS depass_id,
+               MAX(CASE WHEN cycle_type = 'Check' THEN id END) AS check_id,
+               MAX(CASE WHEN cycle_type = 'Check' THEN result END) AS check_result
+        FROM ranked WHERE rn = 1
+        GROUP BY test_id
+        HAVING COUNT(*) = 3
+    ), last_voltages AS (
+        SELECT q.*,
+               COALESCE((SELECT f.last_voltage FROM cycle_sample_files f WHERE f.cycle_id = q.baseline_id),
+                        (SELECT r.voltage FROM readings r WHERE r.cycle_id = q.baseline_id
+                         ORDER BY r.timestamp_ms DESC LIMIT 1)) AS baseline_v,
+               COALESCE((SELECT f.last_voltage FROM cycle_sample_files f WHERE f.cycle_id = q.check_id),
+                        (SELECT r.voltage FROM readings r WHERE r.cycle_id = q.check_id
+                         ORDER BY r.timestamp_ms DESC LIMIT 1)) AS check_v
+        FROM sequences q
+    )
+    SELECT l.test_id, t.timestamp, l.baseline_id, l.depass_id, l.check_id,
+           l.baseline_v, l.check_v, l.check_v - l.baseline_v, l.check_result
+    FROM last_voltages l JOIN tests t ON t.id = l.test_id
+"""
+
+
+def ensure_summary_schema(conn):
+    """
+    Creates the summary table and its triggers. When the table is new, every
+    existing test is queued so the first refresh builds the full cache.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sequence_summary'"
+    ).fetchone()
+    conn.executescript(SUMMARY_SCHEMA)
+    sample_files.ensure_table(conn)
+    if not exists:
+        conn.execute("INSERT OR IGNORE INTO sequence_summary_dirty (test_id) SELECT id FROM tests")
+        conn.commit()
+
+
+def mark_dirty(conn, cycle_ids):
+    """
+    Queues the tests of the given cycles for the next refresh. Does nothing before the
+    summary exists, since ensure_summary_schema() queues every test when it creates it.
+    """
+    ids = list(cycle_ids)
+    if not ids or not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sequence_summary_dirty'"
+    ).fetchone():
+        return
+    conn.execute(
+        f"INSERT OR IGNORE INTO sequence_summary_dirty (test_id) SELECT DISTINCT test_id FROM cycles WHERE id IN ({','.join('?' * len(ids))})",
+        ids
+    )
+
+
+def refresh_summary(conn, rebuild=False):
+    """Recomputes the cached rows of every queued test (all tests with rebuild=True). Returns the number refreshed."""
+    ensure_summary_schema(conn)
+    with conn:
+        if rebuild:
+            conn.execute("INSERT OR IGNORE INTO sequence_summary_dirty (test_id) SELECT id FROM tests")
+        pending = conn.execute("SELECT COUNT(*) FROM sequence_summary_dirty").fetchone()[0]
+        if pending:
+            conn.execute("DELETE FROM sequence_summary WHERE test_id IN (SELECT test_id FROM sequence_summary_dirty)")
+            conn.execute(REFRESH_SQL)
+            conn.execute("DELETE FROM sequence_summary_dirty")
+    return pending
+
+
+def sequence_rows(conn, battery_name=None, profile_name=None):
+    """
+    Returns one row per sequence, oldest first, with the per-battery sequence number,
+    the change from that battery's previous sequence and its running average change.
+    """
+    clauses = []
+    params = []
+    if battery_name:
+        clauses.append("b.name = ?")
+        params.append(battery_name)
+    if profile_name:
+        clauses.append("t.profile_name = ?")
+        params.append(profile_name)
+    where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    sql = f"""
+        SELECT s.test_id, s.test_timestamp,
+               COALESCE(b.name, 'Uncategorized') AS battery_name,
+               t.profile_name, s.check_result,
+               s.baseline_last_voltage, s.check_last_voltage, s.voltage_change,
+               ROW_NUMBER() OVER w AS sequence_number,
+               s.voltage_change - LAG(s.voltage_change) OVER w AS change_vs_previous,
+               AVG(s.voltage_change) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW) AS running_avg_change
+        FROM sequence_summary s
+        JOIN tests t ON t.id = s.test_id
+        LEFT JOIN batteries b ON b.id = t.battery_id
+        {where}
+        WINDOW w AS (PARTITION BY t.battery_id ORDER BY s.test_timestamp, s.test_id)
+        ORDER BY s.test_timestamp, s.test_id
+    """
+    return [dict(row) for row in _query(conn, sql, params)]
+
+
+def grouped_report(conn, group_by=("battery",)):
+    """
+    Aggregates the voltage change per group. group_by is any combination of
+    'battery', 'profile' and 'month'. Each group also gets its rank by mean change.
+    """
+    keys = [key for key in group_by if key in GROUP_COLUMNS] or ["battery"]
+    select_keys = ", ".join(f"{GROUP_COLUMNS[key]} AS {key}" for key in keys)
+    group_keys = ", ".join(GROUP_COLUMNS[key] for key in keys)
+    sql = f"""
+        SELECT {select_keys},
+               COUNT(*) AS sequences,
+               COUNT(s.voltage_change) AS measured,
+               AVG(s.voltage_change) AS mean_change,
+               MIN(s.voltage_change) AS min_change,
+               MAX(s.voltage_change) AS max_change,
+               AVG(CASE WHEN s.voltage_change >= 0 THEN 1.0 ELSE 0.0 END) AS improved_ratio,
+               AVG(CASE WHEN s.check_result = 'PASS' THEN 1.0 ELSE 0.0 END) AS pass_ratio,
+               MIN(s.test_timestamp) AS first_test,
+               MAX(s.test_timestamp) AS last_test,
+               RANK() OVER (ORDER BY AVG(s.voltage_change) DESC) AS effectiveness_rank
+        FROM sequence_summary s
+        JOIN tests t ON t.id = s.test_id
+        LEFT JOIN batteries b ON b.id = t.battery_id
+        GROUP BY {group_keys}
+        ORDER BY {", ".join(keys)}
+    """
+    return [dict(row) for row in _query(conn, sql, [])]
+
+
+def _query(conn, sql, params):
+    previous = conn.row_factory
+    conn.row_factory = sqlite3.Row
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.row_factory = previous
+
+
+def build_report(db_file=DB_FILE, group_by=("battery",), rebuild=False):
+    """Refreshes the cache and returns (refreshed_count, grouped rows)."""
+    conn = sqlite3.connect(db_file)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        refreshed = refresh_summary(conn, rebuild=rebuild)
+        return refreshed, grouped_report(conn, group_by)
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report depassivation effectiveness across all stored sequences.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--group", nargs="+", default=["battery"], choices=list(GROUP_COLUMNS), help="Grouping column(s).")
+    parser.add_argument("--sequences", action="store_true", help="List every sequence instead of grouped totals.")
+    parser.add_argument("--csv", help="Write the report to this CSV file.")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute the cached summary for every test.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+
+    conn = sqlite3.connect(args.db)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        refreshed = refresh_summary(conn, rebuild=args.rebuild)
+        rows = sequence_rows(conn) if args.sequences else grouped_report(conn, args.group)
+    finally:
+        conn.close()
+    print(f"INFO: Refreshed {refreshed} test(s) in the summary cache.")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"INFO: Report written to {args.csv}")
+        return
+
+    for row in rows:
+        print(", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,28 @@ from tkinter.ttk import Style
 import threading
 import time
 import csv
+import sqlite3
+import zipfile
 from datetime import datetime
 
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-
-from data_handler import DataHandler
+import numpy as np
+
+from data_handler import DataHandler, DB_FILE, SEARCHABLE_METRICS
+from cycle_overlay import ALIGN_MODES, resample_cycles, compute_bands
+from live_stats import LiveStatistics, parse_windows
+from instrumentation import Instrumentation
+from profiler import PROFILER_MODES, SessionProfiler, tag
+from telemetry import MetricsServer, StationMetrics
+from read_api import ReadApiServer
+from cycle_analytics import ANALYTICS_VERSION, CycleAccumulator, cycle_result
+from stream_integrity import StreamMonitor, unframe
+from burst_capture import BurstReceiver
+from plateau_detector import PlateauDetector, DEFAULT_WINDOW_S, DEFAULT_MAX_SLOPE_MV_S
+from anomaly_detector import AnomalyDetector, SEVERITY_CRITICAL
+from scheduler import SequenceScheduler, SEQUENCE_STEPS
+from pulse_profiles import encode_profile, parse_steps, profile_id, total_duration_ms
+from retention import apply_retention, policy_from_config
+from history_archive import ARCHIVE_EXTENSION, export_tests, import_archive
 
 class BatteryManagerWindow(tk.Toplevel):
     def __init__(self, parent_app):
@@ -73,6 +89,7 @@ class BatteryManagerWindow(tk.Toplevel):
             return
         new_id = self.data_handler.create_battery(name)
         if new_id:
+            self.parent_app._history_changed()
             self.new_battery_name_var.set("")
             self.load_batteries()
             self.parent_app.refresh_battery_dropdown()
@@ -87,6 +104,7 @@ class BatteryManagerWindow(tk.Toplevel):
         selected_battery = self.batteries[selection_index[0]]
         if messagebox.askyesno("Confirm", f"Are you sure you want to delete '{selected_battery['name']}'?\nAssociated tests will become uncategorized.", parent=self):
             if self.data_handler.delete_battery(selected_battery['id']):
+                self.parent_app._history_changed()
                 self.load_batteries()
                 self.parent_app.refresh_battery_dropdown()
             else:
@@ -108,67 +126,775 @@ class BatteryManagerWindow(tk.Toplevel):
 
         if messagebox.askyesno("Confirm", f"Are you sure you want to delete all {test_count} tests for '{selected_battery['name']}'?\nThis action cannot be undone.", parent=self):
             if self.data_handler.delete_all_tests_for_battery(selected_battery['id']):
+                self.parent_app._history_changed()
                 self.parent_app.log_message(f"INFO: Deleted all tests for battery '{selected_battery['name']}'.")
                 self.parent_app.on_history_battery_selected() # Refresh history view
             else:
                 messagebox.showerror("Error", "Could not delete the tests for the selected battery.", parent=self)
 
+class CycleOverlayWindow(tk.Toplevel):
+    ALL_BATTERIES = "[All Batteries]"
+    ANY_PROFILE = "[Any Profile]"
+
+    def __init__(self, parent_app, cycle_ids=None, battery_name=None):
+        super().__init__(parent_app.root)
+        self.parent_app = parent_app
+        self.data_handler = self.parent_app.data_handler
+        self.cycle_ids = cycle_ids or []
+        self.title("Cycle Overlay")
+        self.geometry("900x600")
+        self.transient(parent_app.root)
+        self.battery_var = tk.StringVar(value=battery_name or self.ALL_BATTERIES)
+        self.cycle_type_var = tk.StringVar(value="Check")
+        self.profile_var = tk.StringVar(value=self.ANY_PROFILE)
+        self.align_var = tk.StringVar(value=ALIGN_MODES[0])
+        self.max_cycles_var = tk.StringVar(value="200")
+        self._create_widgets()
+        self.plot_overlay(use_selection=bool(self.cycle_ids))
+
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(1, weight=1)
+        main_frame.columnconfigure(0, weight=1)
+
+        filter_frame = ttk.LabelFrame(main_frame, text="Cycle Selection", padding=10)
+        filter_frame.grid(row=0, column=0, sticky="ew", pady=(0, 10))
+        batteries = [self.ALL_BATTERIES] + [b['name'] for b in self.parent_app.batteries]
+        profiles = [self.ANY_PROFILE] + self.data_handler.get_profile_names()
+
+        ttk.Label(filter_frame, text="Battery:").grid(row=0, column=0, sticky="w", padx=5)
+        ttk.Combobox(filter_frame, textvariable=self.battery_var, values=batteries, state='readonly', width=18).grid(row=0, column=1, padx=5)
+        ttk.Label(filter_frame, text="Cycle Type:").grid(row=0, column=2, sticky="w", padx=5)
+        ttk.Combobox(filter_frame, textvariable=self.cycle_type_var, values=["Baseline", "Depassivation", "Check"], state='readonly', width=14).grid(row=0, column=3, padx=5)
+        ttk.Label(filter_frame, text="Profile:").grid(row=0, column=4, sticky="w", padx=5)
+        ttk.Combobox(filter_frame, textvariable=self.profile_var, values=profiles, state='readonly', width=18).grid(row=0, column=5, padx=5)
+        ttk.Label(filter_frame, text="Align:").grid(row=1, column=0, sticky="w", padx=5, pady=(5, 0))
+        ttk.Combobox(filter_frame, textvariable=self.align_var, values=ALIGN_MODES, state='readonly', width=18).grid(row=1, column=1, padx=5, pady=(5, 0))
+        ttk.Label(filter_frame, text="Max Cycles:").grid(row=1, column=2, sticky="w", padx=5, pady=(5, 0))
+        ttk.Entry(filter_frame, textvariable=self.max_cycles_var, width=8).grid(row=1, column=3, sticky="w", padx=5, pady=(5, 0))
+        ttk.Button(filter_frame, text="Plot", command=self.plot_overlay).grid(row=1, column=5, sticky="e", padx=5, pady=(5, 0))
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        graph_frame = ttk.LabelFrame(main_frame, text="Overlay: Voltage (V) vs. Time (s)", padding=10)
+        graph_frame.grid(row=1, column=0, sticky="nsew")
+        self.fig = Figure(figsize=(8, 4), dpi=100)
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+        self.summary_label = ttk.Label(main_frame, text="")
+        self.summary_label.grid(row=2, column=0, sticky="w", pady=(5, 0))
+
+    def _selected_cycles(self):
+        try:
+            max_cycles = max(1, int(self.max_cycles_var.get()))
+        except ValueError:
+            max_cycles = 200
+        battery = next((b for b in self.parent_app.batteries if b['name'] == self.battery_var.get()), None)
+        profile = self.profile_var.get()
+        return self.data_handler.find_cycles(
+            battery_id=battery['id'] if battery else None,
+            cycle_type=self.cycle_type_var.get(),
+            profile_name=None if profile == self.ANY_PROFILE else profile,
+            limit=max_cycles,
+        )
+
+    def plot_overlay(self, use_selection=False):
+        from matplotlib.collections import LineCollection
+        if use_selection:
+            cycle_ids = list(self.cycle_ids)
+        else:
+            cycle_ids = [c['id'] for c in self._selected_cycles()]
+
+        self.ax.cla()
+        series = self.data_handler.get_multiple_cycle_data(cycle_ids)
+        traces = [(t, v) for t, v, _ in series.values()]
+        grid, matrix = resample_cycles(traces, align=self.align_var.get())
+
+        if matrix.size:
+            # A single LineCollection keeps hundreds of traces cheap to draw
+            segments = [np.column_stack((grid, row)) for row in matrix]
+            self.ax.add_collection(LineCollection(segments, colors='grey', linewidths=0.6, alpha=0.35))
+            bands = compute_bands(matrix)
+            self.ax.fill_between(grid, bands['p10'], bands['p90'], color='tab:blue', alpha=0.25, label="P10-P90")
+            self.ax.plot(grid, bands['p50'], color='tab:blue', linestyle='--', linewidth=1, label="Median")
+            self.ax.plot(grid, bands['mean'], color='tab:red', linewidth=1.5, label="Mean")
+            self.ax.set_xlim(grid[0], grid[-1])
+            lo, hi = np.nanmin(matrix), np.nanmax(matrix)
+            margin = (hi - lo) * 0.1 if (hi - lo) > 0 else 0.1
+            self.ax.set_ylim(lo - margin, hi + margin)
+            self.ax.legend(loc='lower right')
+
+        xlabel = "Time from Minimum (s)" if self.align_var.get() == "Min Voltage" else "Time (s)"
+        self.ax.set_title(f"{len(traces)} Cycle(s) Overlaid")
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel("Voltage (V)")
+        self.ax.grid(True)
+        self.fig.tight_layout()
+        self.canvas.draw()
+        self.summary_label.config(text=f"Cycles requested: {len(cycle_ids)} | Cycles with data: {len(traces)}")
+
+class BatchExportWindow(tk.Toplevel):
+    ALL_BATTERIES = "[All Batteries]"
+
+    def __init__(self, parent_app, battery_name=None):
+        super().__init__(parent_app.root)
+        self.parent_app = parent_app
+        self.title("Batch Export Graphs")
+        self.geometry("420x300")
+        self.transient(parent_app.root)
+        self.battery_var = tk.StringVar(value=battery_name or self.ALL_BATTERIES)
+        self.start_date_var = tk.StringVar()
+        self.end_date_var = tk.StringVar()
+        self.png_var = tk.BooleanVar(value=True)
+        self.pdf_var = tk.BooleanVar(value=False)
+        self.force_var = tk.BooleanVar(value=False)
+        self.out_dir_var = tk.StringVar()
+        self.is_exporting = False
+        self._create_widgets()
+
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(1, weight=1)
+        batteries = [self.ALL_BATTERIES] + [b['name'] for b in self.parent_app.batteries]
+
+        ttk.Label(main_frame, text="Battery:").grid(row=0, column=0, sticky="w", padx=5, pady=2)
+        ttk.Combobox(main_frame, textvariable=self.battery_var, values=batteries, state='readonly').grid(row=0, column=1, columnspan=2, sticky="ew", padx=5, pady=2)
+        ttk.Label(main_frame, text="From (YYYY-MM-DD):").grid(row=1, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(main_frame, textvariable=self.start_date_var).grid(row=1, column=1, columnspan=2, sticky="ew", padx=5, pady=2)
+        ttk.Label(main_frame, text="To (YYYY-MM-DD):").grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(main_frame, textvariable=self.end_date_var).grid(row=2, column=1, columnspan=2, sticky="ew", padx=5, pady=2)
+
+        format_frame = ttk.Frame(main_frame)
+        format_frame.grid(row=3, column=0, columnspan=3, sticky="w", padx=5, pady=2)
+        ttk.Checkbutton(format_frame, text="PNG", variable=self.png_var).pack(side="left")
+        ttk.Checkbutton(format_frame, text="PDF", variable=self.pdf_var).pack(side="left", padx=(10, 0))
+        ttk.Checkbutton(format_frame, text="Re-render up-to-date files", variable=self.force_var).pack(side="left", padx=(10, 0))
+
+        ttk.Label(main_frame, text="Output Folder:").grid(row=4, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(main_frame, textvariable=self.out_dir_var).grid(row=4, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Button(main_frame, text="Browse...", command=self.choose_out_dir).grid(row=4, column=2, padx=5, pady=2)
+
+        self.progress_bar = ttk.Progressbar(main_frame, orient='horizontal', mode='determinate', style="blue.Horizontal.TProgressbar")
+        self.progress_bar.grid(row=5, column=0, columnspan=3, sticky="ew", padx=5, pady=(10, 2))
+        self.status_label = ttk.Label(main_frame, text="")
+        self.status_label.grid(row=6, column=0, columnspan=3, sticky="w", padx=5)
+        self.export_button = ttk.Button(main_frame, text="Export", command=self.start_export, style='success.TButton')
+        self.export_button.grid(row=7, column=0, columnspan=3, sticky="ew", padx=5, pady=(10, 0))
+
+    def choose_out_dir(self):
+        path = filedialog.askdirectory(title="Select Export Folder", parent=self)
+        if path:
+            self.out_dir_var.set(path)
+
+    def start_export(self):
+        if self.is_exporting:
+            return
+        out_dir = self.out_dir_var.get().strip()
+        if not out_dir:
+            messagebox.showwarning("Warning", "Please select an output folder.", parent=self)
+            return
+        formats = [fmt for fmt, var in (("png", self.png_var), ("pdf", self.pdf_var)) if var.get()]
+        if not formats:
+            messagebox.showwarning("Warning", "Please select at least one format.", parent=self)
+            return
+        battery = self.battery_var.get()
+        kwargs = {
+            'battery_name': None if battery == self.ALL_BATTERIES else battery,
+            'start_date': self.start_date_var.get().strip() or None,
+            'end_date': self.end_date_var.get().strip() or None,
+            'formats': formats,
+            'force': self.force_var.get(),
+            # Scheduled on the root: the window may be closed while the export runs
+            'progress': lambda done, total: self.parent_app.root.after(0, self._update_progress, done, total),
+        }
+        self.is_exporting = True
+        self.export_button.config(state=tk.DISABLED)
+        self.status_label.config(text="Selecting cycles...")
+        # The pool is driven from a worker thread so the window stays responsive
+        threading.Thread(target=self._run_export, args=(out_dir, kwargs), daemon=True).start()
+
+    def _run_export(self, out_dir, kwargs):
+        from batch_export import export_cycles
+        try:
+            counts = export_cycles(DB_FILE, out_dir, **kwargs)
+            message = f"INFO: Batch export to {out_dir}: {counts['written']} file(s) written, {counts['skipped']} up to date, {counts['failed']} failed."
+        except Exception as e:
+            message = f"ERROR: Batch export failed: {e}"
+        self.parent_app.root.after(0, self._finish_export, message)
+
+    def _update_progress(self, done, total):
+        if not self.winfo_exists():
+            return
+        self.progress_bar['maximum'] = total
+        self.progress_bar['value'] = done
+        self.status_label.config(text=f"Rendering {done}/{total}...")
+
+    def _finish_export(self, message):
+        self.is_exporting = False
+        self.parent_app.log_message(message)
+        if self.winfo_exists():
+            self.export_button.config(state=tk.NORMAL)
+            self.status_label.config(text=message.split(": ", 1)[1])
+
+class FleetReportWindow(tk.Toplevel):
+    GROUPINGS = {
+        "Battery": ("battery",),
+        "Profile": ("profile",),
+        "Month": ("month",),
+        "Battery / Profile": ("battery", "profile"),
+        "Profile / Month": ("profile", "month"),
+    }
+    COLUMNS = ("sequences", "mean_change", "min_change", "max_change", "improved_ratio", "pass_ratio", "effectiveness_rank")
+    HEADINGS = ("Sequences", "Mean ΔV", "Min ΔV", "Max ΔV", "Improved", "Pass", "Rank")
+
+    def __init__(self, parent_app):
+        super().__init__(parent_app.root)
+        self.parent_app = parent_app
+        self.title("Fleet Depassivation Report")
+        self.geometry("900x450")
+        self.transient(parent_app.root)
+        self.grouping_var = tk.StringVar(value="Battery")
+        self.rows = []
+        self.is_running = False
+        self._create_widgets()
+        self.run_report()
+
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(1, weight=1)
+        main_frame.columnconfigure(0, weight=1)
+
+        top_frame = ttk.Frame(main_frame)
+        top_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        ttk.Label(top_frame, text="Group by:").pack(side="left")
+        grouping = ttk.Combobox(top_frame, textvariable=self.grouping_var, values=list(self.GROUPINGS), state='readonly', width=18)
+        grouping.pack(side="left", padx=5)
+        grouping.bind("<<ComboboxSelected>>", lambda e: self.run_report())
+        ttk.Button(top_frame, text="Export CSV...", command=self.export_csv).pack(side="right")
+        ttk.Button(top_frame, text="Rebuild Cache", command=lambda: self.run_report(rebuild=True)).pack(side="right", padx=5)
+        self.status_label = ttk.Label(top_frame, text="")
+        self.status_label.pack(side="right", padx=10)
+
+        self.tree = ttk.Treeview(main_frame, show="headings")
+        self.tree.grid(row=1, column=0, sticky="nsew")
+        scrollbar = ttk.Scrollbar(main_frame, orient="vertical", command=self.tree.yview)
+        scrollbar.grid(row=1, column=1, sticky="ns")
+        self.tree.configure(yscrollcommand=scrollbar.set)
+
+    def run_report(self, rebuild=False):
+        if self.is_running:
+            return
+        self.is_running = True
+        self.status_label.config(text="Refreshing...")
+        keys = self.GROUPINGS[self.grouping_var.get()]
+        threading.Thread(target=self._build, args=(keys, rebuild), daemon=True).start()
+
+    def _build(self, keys, rebuild):
+        from fleet_report import build_report
+        started = time.perf_counter()
+        try:
+            refreshed, rows = build_report(DB_FILE, group_by=keys, rebuild=rebuild)
+            error = None
+        except Exception as e:
+            refreshed, rows, error = 0, [], e
+        self.parent_app.root.after(0, self._show, keys, refreshed, rows, error, time.perf_counter() - started)
+
+    def _show(self, keys, refreshed, rows, error, elapsed):
+        self.is_running = False
+        if error is not None:
+            self.parent_app.log_message(f"ERROR: Fleet report failed: {error}")
+        if not self.winfo_exists():
+            return
+        self.rows = rows
+        columns = tuple(keys) + self.COLUMNS
+        self.tree.configure(columns=columns)
+        for col, heading in zip(columns, tuple(k.capitalize() for k in keys) + self.HEADINGS):
+            self.tree.heading(col, text=heading)
+            self.tree.column(col, width=140 if col in keys else 80, anchor='w' if col in keys else 'e')
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            values = [row[k] for k in keys] + [
+                row['sequences'],
+                *(f"{row[k]:+.3f} V" if row[k] is not None else "--" for k in ('mean_change', 'min_change', 'max_change')),
+                f"{row['improved_ratio'] * 100:.0f}%",
+                f"{row['pass_ratio'] * 100:.0f}%",
+                row['effectiveness_rank'],
+            ]
+            self.tree.insert("", tk.END, values=values)
+        self.status_label.config(text=f"{len(rows)} group(s), {refreshed} test(s) refreshed in {elapsed:.2f} s")
+
+    def export_csv(self):
+        if not self.rows:
+            return
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv")],
+            title="Save Fleet Report As...",
+            initialfile=f"fleet_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            parent=self
+        )
+        if not filepath: return
+        try:
+            with open(filepath, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=list(self.rows[0]))
+                writer.writeheader()
+                writer.writerows(self.rows)
+            self.parent_app.log_message(f"INFO: Saved fleet report to {filepath}")
+        except IOError as e:
+            messagebox.showerror("Error", f"Failed to save report: {e}", parent=self)
+
+class SchedulerWindow(tk.Toplevel):
+    REFRESH_MS = 1000
+
+    def __init__(self, parent_app):
+        super().__init__(parent_app.root)
+        self.parent_app = parent_app
+        self.scheduler = parent_app.scheduler
+        self.title("Sequence Scheduler")
+        self.geometry("760x480")
+        self.transient(parent_app.root)
+        self.step_vars = {step: tk.BooleanVar(value=True) for step in SEQUENCE_STEPS}
+        self.rest_cycles_var = tk.StringVar(value=f"{self.scheduler.rest_between_cycles_s:g}")
+        self.rest_batteries_var = tk.StringVar(value=f"{self.scheduler.rest_between_batteries_s:g}")
+        self._create_widgets()
+        self.refresh()
+
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(0, weight=1)
+
+        add_frame = ttk.LabelFrame(main_frame, text="Add Sequences", padding=10)
+        add_frame.grid(row=0, column=0, sticky="nsw", padx=(0, 10))
+        add_frame.rowconfigure(0, weight=1)
+        self.battery_list = tk.Listbox(add_frame, selectmode=tk.EXTENDED, exportselection=False, height=10)
+        self.battery_list.grid(row=0, column=0, columnspan=2, sticky="nsew")
+        for battery in self.parent_app.batteries:
+            self.battery_list.insert(tk.END, battery['name'])
+        for row, step in enumerate(SEQUENCE_STEPS, start=1):
+            ttk.Checkbutton(add_frame, text=step, variable=self.step_vars[step]).grid(row=row, column=0, columnspan=2, sticky="w")
+        ttk.Label(add_frame, text="Rest between cycles (s):").grid(row=4, column=0, sticky="w", pady=(5, 0))
+        ttk.Entry(add_frame, textvariable=self.rest_cycles_var, width=6).grid(row=4, column=1, sticky="ew", pady=(5, 0))
+        ttk.Label(add_frame, text="Rest between batteries (s):").grid(row=5, column=0, sticky="w")
+        ttk.Entry(add_frame, textvariable=self.rest_batteries_var, width=6).grid(row=5, column=1, sticky="ew")
+        ttk.Button(add_frame, text="Add to Queue", command=self.add_to_queue).grid(row=6, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+
+        queue_frame = ttk.LabelFrame(main_frame, text="Queue", padding=10)
+        queue_frame.grid(row=0, column=1, sticky="nsew")
+        queue_frame.rowconfigure(0, weight=1)
+        queue_frame.columnconfigure(0, weight=1)
+        columns = ("Battery", "Steps", "Status", "Results")
+        self.tree = ttk.Treeview(queue_frame, columns=columns, show="headings")
+        for col, width in zip(columns, (140, 160, 140, 160)):
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=width)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+
+        control_frame = ttk.Frame(main_frame)
+        control_frame.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(10, 0))
+        ttk.Button(control_frame, text="Start", command=self.start, style='success.TButton').pack(side="left")
+        ttk.Button(control_frame, text="Pause", command=self.scheduler.pause).pack(side="left", padx=5)
+        ttk.Button(control_frame, text="Clear Queue", command=self.scheduler.clear).pack(side="left")
+        self.stats_label = ttk.Label(control_frame, text="")
+        self.stats_label.pack(side="right")
+
+    def _apply_rests(self):
+        try:
+            self.scheduler.rest_between_cycles_s = max(float(self.rest_cycles_var.get()), 0.0)
+            self.scheduler.rest_between_batteries_s = max(float(self.rest_batteries_var.get()), 0.0)
+            return True
+        except ValueError:
+            messagebox.showerror("Error", "Rest intervals must be numbers of seconds.", parent=self)
+            return False
+
+    def add_to_queue(self):
+        if not self._apply_rests():
+            return
+        steps = [step for step in SEQUENCE_STEPS if self.step_vars[step].get()]
+        names = [self.battery_list.get(i) for i in self.battery_list.curselection()]
+        if not steps or not names:
+            messagebox.showwarning("Warning", "Select at least one battery and one step.", parent=self)
+            return
+        try:
+            durations = {
+                "Baseline": int(self.parent_app.baseline_duration_var.get()),
+                "Depassivation": int(self.parent_app.depassivation_duration_var.get()),
+                "Check": int(self.parent_app.baseline_duration_var.get()),
+            }
+        except ValueError:
+            messagebox.showerror("Error", "Cycle durations must be whole seconds.", parent=self)
+            return
+        for name in names:
+            battery = next(b for b in self.parent_app.batteries if b['name'] == name)
+            self.scheduler.enqueue(battery['id'], name, [(step, durations[step]) for step in steps])
+        self.parent_app.log_message(f"INFO: Queued {len(names)} sequence(s): {', '.join(names)}")
+        self.refresh(reschedule=False)
+
+    def start(self):
+        if self._apply_rests():
+            self.scheduler.start()
+            self.refresh(reschedule=False)
+
+    def refresh(self, reschedule=True):
+        if not self.winfo_exists():
+            return
+        self.tree.delete(*self.tree.get_children())
+        for job in self.scheduler.jobs:
+            steps = " > ".join(step for step, _ in job.steps)
+            self.tree.insert("", tk.END, values=(job.battery_name, steps, job.status, ", ".join(job.results)))
+        eta = self.scheduler.eta_s()
+        utilization = self.scheduler.utilization()
+        eta_text = time.strftime("%H:%M:%S", time.localtime(time.time() + eta)) if eta else "--"
+        util_text = f"{utilization * 100:.0f}%" if utilization is not None else "--"
+        self.stats_label.config(text=f"{self.scheduler.state} | Remaining {eta / 60:.1f} min (done ~{eta_text}) | "
+                                     f"Utilization {util_text} | {self.scheduler.cycles_completed} cycle(s) run")
+        if reschedule:
+            self.after(self.REFRESH_MS, self.refresh)
+
+class DiagnosticsWindow(tk.Toplevel):
+    REFRESH_MS = 1000
+
+    def __init__(self, parent_app):
+        super().__init__(parent_app.root)
+        self.parent_app = parent_app
+        self.instrumentation = parent_app.instrumentation
+        self.title("Diagnostics")
+        self.geometry("760x350")
+        self.transient(parent_app.root)
+        self.enabled_var = tk.BooleanVar(value=self.instrumentation.enabled)
+        self.profiler = parent_app.profiler
+        self.profiler_mode_var = tk.StringVar(value=PROFILER_MODES[0])
+        self.profiler_seconds_var = tk.StringVar(value="60")
+        self.memory_var = tk.BooleanVar(value=self.profiler.memory_tracing)
+        self._create_widgets()
+        self.refresh()
+
+    def _create_widgets(self):
+        main_frame = ttk.Frame(self, padding=10)
+        main_frame.pack(fill=tk.BOTH, expand=True)
+        main_frame.rowconfigure(1, weight=1)
+        main_frame.columnconfigure(0, weight=1)
+
+        top_frame = ttk.Frame(main_frame)
+        top_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        ttk.Checkbutton(top_frame, text="Enable instrumentation", variable=self.enabled_var, command=self.toggle_enabled).pack(side="left")
+        ttk.Button(top_frame, text="Dump JSON...", command=self.dump_json).pack(side="right")
+        ttk.Button(top_frame, text="Reset", command=self.reset).pack(side="right", padx=5)
+        self.queue_label = ttk.Label(top_frame, text="Queue depth: --")
+        self.queue_label.pack(side="right", padx=10)
+
+        columns = ("Metric", "Count", "Mean", "P50", "P95", "P99", "Max")
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings")
+        for col in columns:
+            self.tree.heading(col, text=col)
+            self.tree.column(col, width=80 if col != "Metric" else 200, anchor='e' if col != "Metric" else 'w')
+        self.tree.grid(row=1, column=0, sticky="nsew")
+        for name in self.instrumentation.histograms:
+            self.tree.insert("", tk.END, iid=name, values=(name,) + ("--",) * 6)
+
+        profiler_frame = ttk.Frame(main_frame)
+        profiler_frame.grid(row=2, column=0, sticky="ew", pady=(5, 0))
+        ttk.Label(profiler_frame, text="Profiler:").pack(side="left")
+        ttk.Combobox(profiler_frame, textvariable=self.profiler_mode_var, values=PROFILER_MODES, state="readonly", width=10).pack(side="left", padx=5)
+        ttk.Label(profiler_frame, text="Window (s):").pack(side="left")
+        ttk.Entry(profiler_frame, textvariable=self.profiler_seconds_var, width=6).pack(side="left", padx=5)
+        self.profiler_button = ttk.Button(profiler_frame, text="Start", command=self.toggle_profiler)
+        self.profiler_button.pack(side="left")
+        ttk.Checkbutton(profiler_frame, text="Memory growth per cycle", variable=self.memory_var, command=self.toggle_memory).pack(side="right")
+
+    @staticmethod
+    def _format(value, unit):
+        if value is None:
+            return "--"
+        if unit == "s":
+            return f"{value * 1000:.2f} ms"
+        return f"{value:.0f}"
+
+    def refresh(self):
+        if not self.winfo_exists():
+            return
+        for name, histogram in self.instrumentation.histograms.items():
+            summary = histogram.summary()
+            values = [name, summary['count']] + [self._format(summary[k], summary['unit']) for k in ('mean', 'p50', 'p95', 'p99', 'max')]
+            self.tree.item(name, values=values)
+        depth = max(self.instrumentation.enqueued - self.instrumentation.dequeued, 0)
+        self.queue_label.config(text=f"Queue depth: {depth}")
+        self.profiler_button.config(text=f"Stop {self.profiler.mode}" if self.profiler.active else "Start")
+        self.after(self.REFRESH_MS, self.refresh)
+
+    def toggle_profiler(self):
+        if self.profiler.active:
+            self.profiler.stop()
+        else:
+            try:
+                seconds = float(self.profiler_seconds_var.get())
+            except ValueError:
+                messagebox.showerror("Error", "The profiler window must be a number of seconds (0 runs until stopped).", parent=self)
+                return
+            self.profiler.start(self.profiler_mode_var.get(), seconds)
+        self.profiler_button.config(text=f"Stop {self.profiler.mode}" if self.profiler.active else "Start")
+
+    def toggle_memory(self):
+        if self.memory_var.get():
+            self.profiler.start_memory()
+        else:
+            self.profiler.stop_memory()
+
+    def toggle_enabled(self):
+        if self.enabled_var.get():
+            self.instrumentation.enable()
+            self.parent_app.log_message("INFO: Instrumentation enabled.")
+        else:
+            self.instrumentation.disable()
+            self.parent_app.log_message("INFO: Instrumentation disabled.")
+
+    def reset(self):
+        self.instrumentation.reset()
+
+    def dump_json(self):
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json")],
+            title="Save Diagnostics As...",
+            initialfile=f"diagnostics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+            parent=self
+        )
+        if not filepath: return
+        try:
+            self.instrumentation.dump(filepath)
+            self.parent_app.log_message(f"INFO: Saved diagnostics to {filepath}")
+        except IOError as e:
+            messagebox.showerror("Error", f"Failed to save diagnostics: {e}", parent=self)
+
 class DepassivationApp:
-    def __init__(self, root, simulate=False):
+    HISTORY_PAGE_SIZE = 200
+    NO_PROFILE = "[Continuous]"
+    RETENTION_FIRST_RUN_MS = 60 * 1000
+    RETENTION_INTERVAL_MS = 6 * 60 * 60 * 1000
+    PROFILE_ACK_TIMEOUT_MS = 5000
+
+    def __init__(self, root, simulate=False, instrument=False, sim_speed=1.0, sim_loss=0.0, sim_unplug=None,
+                 profile=None, profile_seconds=60, trace_memory=False, metrics_port=None, api_port=None,
+                 acquisition_process=False):
         self.root = root
         self.simulation_mode = simulate
+        self.sim_speed = sim_speed
+        self.sim_loss = sim_loss
+        self.sim_unplug = sim_unplug
+        self.instrumentation = Instrumentation(root)
+        if instrument:
+            self.instrumentation.enable()
+        self.profiler = SessionProfiler(root, self.log_message)
         self.is_running = False
         self.current_mode = "main"
         self.current_test_id = None
         self.current_cycle_id = None
         self.last_completed_cycle_id = None
+        self.plateau_detector = None
+        self.early_stop_reason = None
+        self.anomaly_detector = None
+        self.anomaly_abort_reason = None
+        self.scheduled_cycle_active = False
+        self.profiles = {}
+        self.device_profile_id = None        # profile the device reported holding, None if unknown
+        self.cycle_profile_steps = None      # ProfileSteps of the running cycle, for marker labels
+        self.pending_profile_start = None    # (profile id, timeout after id) while START_PROFILE waits for PROFILE_OK
+        self.scheduler = SequenceScheduler(root.after, root.after_cancel, self._start_scheduled_cycle, self.log_message)
         self.selected_battery_id = None
         self.selected_history_test_id = None
         self.current_history_sequences = {}
+        self.history_search_filters = None   # set while the tree shows search results
+        self.history_search_last = None      # keyset of the last row loaded
+        self.history_search_tests = {}       # cycle_id -> test_id of the rows loaded
         self.current_sequence_info = None
         self.data_points = []
-        self.min_voltage = 0.0
-        self.max_current = 0.0
-        self.power = 0.0
-        self.resistance = 0.0
+        self.cycle_accumulator = CycleAccumulator()
+        self.cycle_stream = StreamMonitor()
+        self.live_stream = StreamMonitor()
+        self.burst = BurstReceiver()
+        self.metrics_refresh_pending = False
         self.live_min_voltage = 0.0
         self.live_max_current = 0.0
         self.live_min_resistance = 0.0
         self.live_max_resistance = 0.0
+        self.live_start_time = None
+        self.live_redraw_pending = False
+        self.current_pass_fail_voltage = None
+        self.plot_times = []
+        self.plot_voltages = []
+        self.pending_render_read_time = None
+        self.pending_live_render_read_time = None
         self.comparison_result_label = None
 
+        self.data_handler = DataHandler(self)
+        config = self.data_handler.load_config()
+        self.acquisition_process_config = config.get("acquisition_process", False)
+        # The simulator has no port to move out of the GUI process
+        self.acquisition_process = (acquisition_process or self.acquisition_process_config) and not self.simulation_mode
         if self.simulation_mode:
             from simulation_handler import SimulationHandler
-            self.connection_handler = SimulationHandler(self)
+            self.connection_handler = SimulationHandler(self, speed=self.sim_speed, link_loss=self.sim_loss,
+                                                        unplug_after_s=self.sim_unplug)
             self.root.title("Battery Analyzer (SIMULATION MODE)")
+        elif self.acquisition_process:
+            from acquisition_process import AcquisitionClient
+            self.connection_handler = AcquisitionClient(self)
+            self.root.title("Battery Analyzer")
         else:
             from serial_handler import SerialHandler
             self.connection_handler = SerialHandler(self)
             self.root.title("Battery Analyzer")
 
-        self.data_handler = DataHandler(self)
-        config = self.data_handler.load_config()
         self.root.geometry(config.get("geometry", "950x850"))
         self.pass_fail_voltage_var = tk.StringVar(value=config.get("pass_fail_voltage", "3.2"))
         self.selected_port_var = tk.StringVar(value=config.get("last_port", ""))
         self.selected_battery_var = tk.StringVar()
         self.baseline_duration_var = tk.StringVar(value=config.get("baseline_duration", "10"))
         self.depassivation_duration_var = tk.StringVar(value=config.get("depassivation_duration", "180"))
+        self.live_windows_var = tk.StringVar(value=config.get("live_windows", "10,100"))
+        self.adaptive_stop_var = tk.BooleanVar(value=config.get("adaptive_stop", False))
+        self.adaptive_window_var = tk.StringVar(value=config.get("adaptive_window", f"{DEFAULT_WINDOW_S:g}"))
+        self.adaptive_slope_var = tk.StringVar(value=config.get("adaptive_slope", f"{DEFAULT_MAX_SLOPE_MV_S:g}"))
+        self.anomaly_detection_var = tk.BooleanVar(value=config.get("anomaly_detection", True))
+        self.burst_window_var = tk.StringVar(value=config.get("burst_window_ms", "0"))
+        self.anomaly_abort_var = tk.BooleanVar(value=config.get("anomaly_abort", False))
+        self.profile_var = tk.StringVar(value=config.get("profile", self.NO_PROFILE))
+        self.retention_policy = policy_from_config(config)
+        self.station_name_configured = bool(config.get("station_name"))
+        self.telemetry = StationMetrics(config.get("station_name"))
+        self.telemetry.state_source = self._telemetry_state
+        self.metrics_config_port = config.get("metrics_port")
+        self.metrics_server = None
+        metrics_port = metrics_port or self.metrics_config_port
+        self.api_config_port = config.get("api_port")
+        self.journal_enabled = config.get("ingest_journal", True)
+        self.sample_storage_config = config.get("sample_storage", "sqlite")
+        self.data_handler.sample_storage = self.sample_storage_config
+        self.read_api = None
+        api_port = api_port or self.api_config_port
+        self.retention_running = False
+        self.closing = False
+        self.live_stats = LiveStatistics(windows=parse_windows(self.live_windows_var.get()))
+
+        self.batteries = []
+        self.startup_scheduled = False
+        self.startup_complete = False
 
         self._setup_styles()
         self._create_widgets()
-        self.data_handler._init_database()
-        self.clear_graph_and_stats()
-        self.refresh_battery_dropdown()
-        self.populate_battery_history_list()
+        self.status_var.set("Loading...")
 
+        # Everything not needed for the first paint is deferred until the window is mapped
+        self.root.bind("<Map>", self._on_first_map, add="+")
         if not self.simulation_mode:
             self._refresh_port_list()
-        else:
-            self.status_var.set("Simulation Mode: Ready.")
 
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
 
+        if metrics_port:
+            self._start_metrics_server(int(metrics_port))
+        if api_port:
+            self._start_read_api(int(api_port))
+        if profile:
+            self.profiler.start(profile, profile_seconds)
+        if trace_memory:
+            self.profiler.start_memory()
+
+    def _start_metrics_server(self, port):
+        try:
+            self.metrics_server = MetricsServer(self.telemetry, port)
+        except OSError as e:
+            self.log_message(f"ERROR: Could not start the metrics endpoint on port {port}: {e}")
+            return
+        self.metrics_server.start()
+        self.log_message(f"INFO: Serving station metrics at {self.metrics_server.address}")
+
+    def _start_read_api(self, port):
+        try:
+            self.read_api = ReadApiServer(port, log=self.log_message, samples_pending=self._samples_pending)
+        except OSError as e:
+            self.log_message(f"ERROR: Could not start the read API on port {port}: {e}")
+            return
+        self.read_api.start()
+        self.log_message(f"INFO: Serving history and the live stream at {self.read_api.address}")
+
+    def _open_ingest_journal(self):
+        try:
+            # The applier thread logs through the Tk thread
+            summary = self.data_handler.open_journal(lambda message: self.root.after(0, self.log_message, message))
+        except (sqlite3.Error, OSError) as e:
+            self.log_message(f"ERROR: Could not open the ingestion journal, writing samples directly: {e}")
+            return
+        if summary["records"]:
+            self.log_message(f"INFO: Replayed {summary['records']} sample(s) from the ingestion journal.")
+        if summary["torn_bytes"]:
+            self.log_message(f"WARN: Discarded {summary['torn_bytes']} byte(s) of a partially written journal record.")
+        # Only here, once: no cycle has started yet. Later journal opens (each acquisition process connect) only replay
+        recovered = self.data_handler.recover_unfinished_cycles()
+        if recovered:
+            self.log_message(f"WARN: Closed {len(recovered)} cycle(s) interrupted by an unclean shutdown "
+                             f"(IDs: {', '.join(map(str, recovered))}).")
+
+    def _samples_pending(self, cycle_id):
+        """True while samples of cycle_id are still in an ingestion journal; called from the read API's threads."""
+        if self.data_handler.has_unapplied_samples(cycle_id):
+            return True
+        return self.acquisition_process and self.connection_handler.has_unapplied_samples(cycle_id)
+
+    def _history_changed(self):
+        """Drops the read API's cached summaries after the history was modified."""
+        if self.read_api:
+            self.read_api.invalidate()
+
+    def _telemetry_state(self):
+        """(state, connected) for the metrics endpoint; runs in its thread, so it only reads attributes."""
+        connected = self.connection_handler.is_connected()
+        if not connected:
+            return "disconnected", False
+        if self.is_running:
+            return "cycle", True
+        return ("live" if self.current_mode == "live" else "idle"), True
+
+    def _on_first_map(self, event):
+        if event.widget is not self.root or self.startup_scheduled:
+            return
+        self.startup_scheduled = True
+        self.root.after_idle(self._finish_startup)
+
+    def _finish_startup(self):
+        """Initializes matplotlib, the database and the battery lists once the window is on screen."""
+        if self.startup_complete:
+            return
+        self._build_main_graph()
+        self.data_handler._init_database()
+        if self.journal_enabled or self.acquisition_process:
+            self._open_ingest_journal()
+        if self.acquisition_process:
+            # Replayed here so History is complete before connecting; the acquisition process writes the journal from then on
+            self.data_handler.close_journal()
+        elif self.data_handler.sample_storage == "files" and self.data_handler.journal is None:
+            # Without the journal's batches every sample would cost a file fsync and a database commit
+            self.log_message("WARN: Sample files need the ingestion journal; new cycles are stored in the database.")
+            self.data_handler.sample_storage = "sqlite"
+        # Files a crash or a still-mapped view kept from being deleted; checked after the replay appended to them
+        self.data_handler.clean_sample_files()
+        self.refresh_profiles()
+        self.clear_graph_and_stats()
+        self.refresh_battery_dropdown()
+        if self.simulation_mode:
+            self.status_var.set("Simulation Mode: Ready.")
+        else:
+            self.status_var.set("Ready.")
+        self.startup_complete = True
+        if self.retention_policy.get("enabled"):
+            self.root.after(self.RETENTION_FIRST_RUN_MS, self._run_retention)
+
     def _setup_styles(self):
         style = ttk.Style(self.root)
         style.theme_use('clam')
@@ -194,6 +920,7 @@ class DepassivationApp:
         self.history_tab = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(self.main_tab, text="Test Control")
         self.notebook.add(self.history_tab, text="History")
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
         self._create_main_tab_widgets(self.main_tab)
         self._create_history_tab_widgets(self.history_tab)
         self._create_status_bar()
@@ -252,6 +979,7 @@ class DepassivationApp:
         self.history_battery_list = tk.Listbox(battery_list_frame)
         self.history_battery_list.grid(row=0, column=0, sticky="nswe")
         self.history_battery_list.bind("<<ListboxSelect>>", self.on_history_battery_selected)
+        self._create_history_search_frame(list_frame).pack(fill="x", side="top", pady=(10,0))
         test_list_frame = ttk.LabelFrame(list_frame, text="Test History", padding="10")
         test_list_frame.pack(fill="both", expand=True, side="bottom", pady=(10,0))
         test_list_frame.rowconfigure(0, weight=1)
@@ -267,27 +995,21 @@ class DepassivationApp:
         self.history_tree.grid(row=0, column=0, sticky="nswe")
         self.history_tree.tag_configure('baseline', background='lightblue')
         self.history_tree.tag_configure('check', background='lightgreen')
+        self.history_more_button = ttk.Button(test_list_frame, text="Load More Results", command=self.load_more_search_results)
         details_frame = ttk.LabelFrame(parent, text="Test Details", padding="10")
         details_frame.grid(row=0, column=1, rowspan=2, sticky="nswe", padx=(5, 0))
         details_frame.grid_columnconfigure(0, weight=1)
         details_frame.grid_rowconfigure(0, weight=1)
         details_frame.grid_rowconfigure(1, weight=1)
 
-        # Graph 1: Depassivation
-        graph1_frame = ttk.LabelFrame(details_frame, text="Depassivation Cycle", padding="10")
-        graph1_frame.grid(row=0, column=0, sticky="nsew")
-        self.history_fig1 = Figure(figsize=(5, 2.5), dpi=100)
-        self.history_ax1 = self.history_fig1.add_subplot(111)
-        self.history_canvas1 = FigureCanvasTkAgg(self.history_fig1, master=graph1_frame)
-        self.history_canvas1.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Graph 1: Depassivation (figures are created on first visit, see _ensure_history_figures)
+        self.history_graph1_frame = ttk.LabelFrame(details_frame, text="Depassivation Cycle", padding="10")
+        self.history_graph1_frame.grid(row=0, column=0, sticky="nsew")
 
         # Graph 2: Baseline vs. Check
-        graph2_frame = ttk.LabelFrame(details_frame, text="Baseline vs. Check", padding="10")
-        graph2_frame.grid(row=1, column=0, sticky="nsew", pady=(5,0))
-        self.history_fig2 = Figure(figsize=(5, 2.5), dpi=100)
-        self.history_ax2 = self.history_fig2.add_subplot(111)
-        self.history_canvas2 = FigureCanvasTkAgg(self.history_fig2, master=graph2_frame)
-        self.history_canvas2.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.history_graph2_frame = ttk.LabelFrame(details_frame, text="Baseline vs. Check", padding="10")
+        self.history_graph2_frame.grid(row=1, column=0, sticky="nsew", pady=(5,0))
+        self.history_fig1 = None
 
         # This container will hold either the single test stats or the comparison stats
         history_stats_container = ttk.Frame(details_frame)
@@ -313,7 +1035,13 @@ class DepassivationApp:
         self.history_power_label = ttk.Label(self.history_stats_frame, text="Power: -- mW")
         self.history_power_label.pack(anchor="w", pady=2)
         self.history_resistance_label = ttk.Label(self.history_stats_frame, text="Resistance: -- Ω")
-        self.history_resistance_label.pack(anchor="w", pady=8)
+        self.history_resistance_label.pack(anchor="w", pady=2)
+        self.history_voltage_delay_label = ttk.Label(self.history_stats_frame, text="Voltage Delay: --")
+        self.history_voltage_delay_label.pack(anchor="w", pady=2)
+        self.history_delivered_label = ttk.Label(self.history_stats_frame, text="Delivered: --")
+        self.history_delivered_label.pack(anchor="w", pady=2)
+        self.history_events_label = ttk.Label(self.history_stats_frame, text="Anomalies: --")
+        self.history_events_label.pack(anchor="w", pady=8)
         self.history_result_label = ttk.Label(self.history_stats_frame, text="Result: --", font=("Helvetica", 14, "bold"))
         self.history_result_label.pack(anchor="w", pady=8)
         self.delete_history_button = ttk.Button(self.history_stats_frame, text="Delete This Test", command=self.delete_selected_history_test, style="danger.TButton", state=tk.DISABLED)
@@ -348,7 +1076,20 @@ class DepassivationApp:
         self.export_history_graph_button = ttk.Button(export_frame, text="Export Graph (.png)", command=self.export_history_graph, state=tk.DISABLED)
         self.export_history_graph_button.pack(side="left", expand=True, fill="x", padx=(0,5))
         self.export_history_data_button = ttk.Button(export_frame, text="Export Data (.csv)", command=self.export_history_data, state=tk.DISABLED)
-        self.export_history_data_button.pack(side="left", expand=True, fill="x", padx=(5,0))
+        self.export_history_data_button.pack(side="left", expand=True, fill="x", padx=(5,5))
+        self.overlay_button = ttk.Button(export_frame, text="Overlay Cycles...", command=self.open_cycle_overlay)
+        self.overlay_button.pack(side="left", expand=True, fill="x", padx=(5,5))
+        self.batch_export_button = ttk.Button(export_frame, text="Batch Export...", command=self.open_batch_export)
+        self.batch_export_button.pack(side="left", expand=True, fill="x", padx=(5,5))
+        self.fleet_report_button = ttk.Button(export_frame, text="Fleet Report...", command=self.open_fleet_report)
+        self.fleet_report_button.pack(side="left", expand=True, fill="x", padx=(5,0))
+
+        archive_frame = ttk.Frame(details_frame)
+        archive_frame.grid(row=4, column=0, sticky="ew")
+        self.export_archive_button = ttk.Button(archive_frame, text="Export Archive...", command=self.export_history_archive)
+        self.export_archive_button.pack(side="left", expand=True, fill="x", padx=(0,5))
+        self.import_archive_button = ttk.Button(archive_frame, text="Import Archive...", command=self.import_history_archive)
+        self.import_archive_button.pack(side="left", expand=True, fill="x", padx=(5,0))
 
     def _create_main_view_widgets(self, parent):
         frame = ttk.Frame(parent)
@@ -362,6 +1103,7 @@ class DepassivationApp:
         frame.columnconfigure(0, weight=1)
         frame.columnconfigure(1, weight=1)
         frame.rowconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
 
         # --- Live Readings Frame ---
         live_frame = ttk.LabelFrame(frame, text="Live Measurement", padding=20)
@@ -392,14 +1134,86 @@ class DepassivationApp:
         self.live_min_r_label.pack(anchor='w', pady=4)
         self.live_max_r_label = ttk.Label(stats_frame, text="Max Resistance: -- Ω", font=("Helvetica", 12))
         self.live_max_r_label.pack(anchor='w', pady=4)
+        ttk.Separator(stats_frame, orient='horizontal').pack(fill='x', pady=8)
+        self.live_smoothed_label = ttk.Label(stats_frame, text="Smoothed Voltage: -- V", font=("Helvetica", 12))
+        self.live_smoothed_label.pack(anchor='w', pady=4)
+        self.live_link_label = ttk.Label(stats_frame, text="Link: --", font=("Helvetica", 10))
+        self.live_link_label.pack(anchor='w', pady=4)
+        self.live_rolling_frame = ttk.Frame(stats_frame)
+        self.live_rolling_frame.pack(anchor='w', fill='x')
+        self._build_live_rolling_labels()
+
+        window_frame = ttk.Frame(stats_frame)
+        window_frame.pack(anchor='w', fill='x', pady=(8, 0))
+        ttk.Label(window_frame, text="Windows (samples):").pack(side='left')
+        ttk.Entry(window_frame, textvariable=self.live_windows_var, width=10).pack(side='left', padx=5)
+        ttk.Button(window_frame, text="Apply", command=self.apply_live_windows).pack(side='left')
+
+        # --- Scrolling Trend Plot ---
+        self.live_trend_frame = ttk.LabelFrame(frame, text="Voltage Trend", padding=10)
+        self.live_trend_frame.grid(row=1, column=0, columnspan=2, sticky="nsew", pady=(10, 0))
+        self.live_trend_fig = None
 
         return frame
 
+    def _ensure_live_trend_figure(self):
+        if self.live_trend_fig is not None:
+            return
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.live_trend_fig = Figure(figsize=(5, 2), dpi=100)
+        self.live_trend_ax = self.live_trend_fig.add_subplot(111)
+        self.live_trend_ax.set_xlabel("Time (s)")
+        self.live_trend_ax.set_ylabel("Voltage (V)")
+        self.live_trend_ax.grid(True)
+        self.live_trend_line, = self.live_trend_ax.plot([], [], color='tab:blue', linewidth=1)
+        self.live_trend_canvas = FigureCanvasTkAgg(self.live_trend_fig, master=self.live_trend_frame)
+        self.live_trend_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.live_trend_canvas.mpl_connect('draw_event', self._on_live_trend_drawn)
+
+    def _ensure_history_figures(self):
+        if self.history_fig1 is not None:
+            return
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.history_fig1 = Figure(figsize=(5, 2.5), dpi=100)
+        self.history_ax1 = self.history_fig1.add_subplot(111)
+        self.history_canvas1 = FigureCanvasTkAgg(self.history_fig1, master=self.history_graph1_frame)
+        self.history_canvas1.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.history_fig2 = Figure(figsize=(5, 2.5), dpi=100)
+        self.history_ax2 = self.history_fig2.add_subplot(111)
+        self.history_canvas2 = FigureCanvasTkAgg(self.history_fig2, master=self.history_graph2_frame)
+        self.history_canvas2.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+
+    def on_tab_changed(self, event=None):
+        if self.notebook.select() == str(self.history_tab):
+            self._ensure_history_figures()
+
+    def _build_live_rolling_labels(self):
+        for child in self.live_rolling_frame.winfo_children():
+            child.destroy()
+        self.live_rolling_labels = {}
+        for window in self.live_stats.windows:
+            label = ttk.Label(self.live_rolling_frame, text=f"Voltage (last {window}): -- V", font=("Helvetica", 12))
+            label.pack(anchor='w', pady=4)
+            self.live_rolling_labels[window] = label
+        self.live_window_minmax_label = ttk.Label(self.live_rolling_frame, text="Window Min/Max: -- V", font=("Helvetica", 12))
+        self.live_window_minmax_label.pack(anchor='w', pady=4)
+
+    def apply_live_windows(self):
+        windows = parse_windows(self.live_windows_var.get())
+        self.live_windows_var.set(",".join(str(w) for w in windows))
+        self.live_stats = LiveStatistics(windows=windows)
+        self._build_live_rolling_labels()
+
     def show_frame(self, mode):
         self.current_mode = mode
         if mode == "live":
+            self._ensure_live_trend_figure()
             self.live_view_frame.tkraise()
             if self.connection_handler.is_connected():
+                # The device numbers live samples from 0 again
+                self.live_stream.reset()
                 self.connection_handler.send("SET_MODE,LIVE\n")
         else:
             self.main_view_frame.tkraise()
@@ -432,12 +1246,8 @@ class DepassivationApp:
         frame.grid_columnconfigure(0, weight=3)
         frame.grid_columnconfigure(1, weight=1)
         frame.grid_rowconfigure(0, weight=1)
-        graph_frame = ttk.LabelFrame(frame, text="Graph: Voltage (V) vs. Time (s)", padding="10")
-        graph_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
-        self.fig = Figure(figsize=(5, 4), dpi=100)
-        self.ax = self.fig.add_subplot(111)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=graph_frame)
-        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.graph_frame = ttk.LabelFrame(frame, text="Graph: Voltage (V) vs. Time (s)", padding="10")
+        self.graph_frame.grid(row=0, column=0, sticky="nsew", padx=(0, 5))
         stats_frame = ttk.LabelFrame(frame, text="Metrics", padding="10")
         stats_frame.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
         self.voltage_label = ttk.Label(stats_frame, text="Current Voltage: -- V", font=("Helvetica", 12))
@@ -452,11 +1262,28 @@ class DepassivationApp:
         self.power_label.pack(anchor="w", pady=5)
         self.resistance_label = ttk.Label(stats_frame, text="Resistance: -- Ω", font=("Helvetica", 12))
         self.resistance_label.pack(anchor="w", pady=5)
+        self.mean_voltage_label = ttk.Label(stats_frame, text="Mean Voltage: -- V", font=("Helvetica", 12))
+        self.mean_voltage_label.pack(anchor="w", pady=5)
+        self.energy_label = ttk.Label(stats_frame, text="Delivered: -- mAh / -- mWh", font=("Helvetica", 12))
+        self.energy_label.pack(anchor="w", pady=5)
+        self.time_below_label = ttk.Label(stats_frame, text="Time Below Target: -- s", font=("Helvetica", 12))
+        self.time_below_label.pack(anchor="w", pady=5)
+        self.link_label = ttk.Label(stats_frame, text="Link: --", font=("Helvetica", 10))
+        self.link_label.pack(anchor="w", pady=5)
         ttk.Separator(stats_frame, orient='horizontal').pack(fill='x', pady=10, padx=5)
         self.pass_fail_label = ttk.Label(stats_frame, text="---", font=("Helvetica", 16, "bold"), anchor="center")
         self.pass_fail_label.pack(fill='x', expand=True, pady=5)
         return frame
 
+    def _build_main_graph(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        self.fig = Figure(figsize=(5, 4), dpi=100)
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.graph_frame)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect('draw_event', self._on_main_canvas_drawn)
+
     def _create_control_frame(self, parent):
         frame = ttk.LabelFrame(parent, text="Controls", padding="10")
         frame.columnconfigure(0, weight=1)
@@ -488,6 +1315,9 @@ class DepassivationApp:
         self.export_live_graph_button.grid(row=0, column=0, sticky="ew", padx=(0,5))
         self.export_live_data_button = ttk.Button(export_frame, text="Export Data", command=self.export_live_data, state=tk.DISABLED)
         self.export_live_data_button.grid(row=0, column=1, sticky="ew", padx=(5,0))
+
+        ttk.Button(frame, text="Scheduler...", command=self.open_scheduler).grid(row=4, column=0, sticky="ew", pady=(5,0))
+        ttk.Button(frame, text="Diagnostics...", command=self.open_diagnostics).grid(row=5, column=0, sticky="ew", pady=(5,0))
         return frame
 
     def _create_settings_frame(self, parent):
@@ -501,6 +1331,22 @@ class DepassivationApp:
         ttk.Label(frame, text="Pass/Fail Voltage (V):").grid(row=2, column=0, sticky="w", padx=5, pady=2)
         self.pass_fail_entry = ttk.Entry(frame, textvariable=self.pass_fail_voltage_var)
         self.pass_fail_entry.grid(row=2, column=1, sticky="ew", padx=5, pady=2)
+
+        ttk.Checkbutton(frame, text="Stop depassivation early once voltage is stable", variable=self.adaptive_stop_var).grid(row=3, column=0, columnspan=2, sticky="w", padx=5, pady=(6,2))
+        ttk.Label(frame, text="Stability Window (s):").grid(row=4, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(frame, textvariable=self.adaptive_window_var, width=10).grid(row=4, column=1, sticky="ew", padx=5, pady=2)
+        ttk.Label(frame, text="Max Slope (mV/s):").grid(row=5, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(frame, textvariable=self.adaptive_slope_var, width=10).grid(row=5, column=1, sticky="ew", padx=5, pady=2)
+
+        ttk.Checkbutton(frame, text="Flag data anomalies (spikes, jumps, dropouts)", variable=self.anomaly_detection_var).grid(row=6, column=0, columnspan=2, sticky="w", padx=5, pady=(6,2))
+        ttk.Checkbutton(frame, text="Abort the cycle on critical anomalies", variable=self.anomaly_abort_var).grid(row=7, column=0, columnspan=2, sticky="w", padx=5, pady=2)
+
+        ttk.Label(frame, text="Load Profile:").grid(row=8, column=0, sticky="w", padx=5, pady=(6,2))
+        self.profile_combobox = ttk.Combobox(frame, textvariable=self.profile_var, state='readonly', postcommand=self.refresh_profiles)
+        self.profile_combobox.grid(row=8, column=1, sticky="ew", padx=5, pady=(6,2))
+        self.profile_combobox.bind("<<ComboboxSelected>>", self.on_profile_selected)
+        ttk.Label(frame, text="Burst on Load Connect (ms, 0 = off):").grid(row=9, column=0, sticky="w", padx=5, pady=2)
+        ttk.Entry(frame, textvariable=self.burst_window_var, width=10).grid(row=9, column=1, sticky="ew", padx=5, pady=2)
         return frame
 
     def _create_log_frame(self, parent):
@@ -519,6 +1365,42 @@ class DepassivationApp:
     def open_battery_manager(self):
         BatteryManagerWindow(self)
 
+    def open_cycle_overlay(self):
+        """Opens the overlay window for the selected history items, or for the selected battery."""
+        cycle_ids = []
+        for item_id in self.history_tree.selection():
+            if item_id in self.current_history_sequences:
+                cycle_ids.extend(c['id'] for c in self.current_history_sequences[item_id].values())
+            else:
+                cycle_ids.append(int(item_id))
+
+        CycleOverlayWindow(self, cycle_ids=cycle_ids if len(cycle_ids) > 1 else None, battery_name=self._selected_history_battery_name())
+
+    def open_diagnostics(self):
+        DiagnosticsWindow(self)
+
+    def open_scheduler(self):
+        SchedulerWindow(self)
+
+    def open_batch_export(self):
+        BatchExportWindow(self, battery_name=self._selected_history_battery_name())
+
+    def open_fleet_report(self):
+        FleetReportWindow(self)
+
+    def _history_uncategorized_selected(self):
+        selection_idx = self.history_battery_list.curselection()
+        return bool(selection_idx) and self.history_battery_list.get(selection_idx[0]) == "[Uncategorized Tests]"
+
+    def _selected_history_battery_name(self):
+        """Returns the battery selected in the History tab, or None for uncategorized/no selection."""
+        selection_idx = self.history_battery_list.curselection()
+        if selection_idx:
+            name = self.history_battery_list.get(selection_idx[0])
+            if name != "[Uncategorized Tests]":
+                return name
+        return None
+
     def log_message(self, msg):
         if hasattr(self, 'log_area'):
             self.log_area.config(state=tk.NORMAL)
@@ -563,7 +1445,7 @@ class DepassivationApp:
 
     def start_baseline_test(self):
         # A baseline test always starts a new test sequence
-        self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id)
+        self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id, self.selected_profile_name())
         if self.current_test_id:
             duration = int(self.baseline_duration_var.get())
             self._start_cycle("Baseline", duration)
@@ -572,7 +1454,7 @@ class DepassivationApp:
         if self.current_test_id is None:
             # For now, let's start a new test if one isn't running.
             # A more robust implementation would guide the user.
-            self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id)
+            self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id, self.selected_profile_name())
         if self.current_test_id:
             duration = int(self.depassivation_duration_var.get())
             self._start_cycle("Depassivation", duration)
@@ -580,39 +1462,195 @@ class DepassivationApp:
     def start_check_test(self):
         if self.current_test_id is None:
             # For now, let's start a new test if one isn't running.
-            self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id)
+            self.current_test_id = self.data_handler.create_new_test(self.selected_battery_id, self.selected_profile_name())
         if self.current_test_id:
             duration = int(self.baseline_duration_var.get())
             self._start_cycle("Check", duration)
 
+    # --- Load Profiles ---
+    def refresh_profiles(self):
+        """Reloads profiles.json into the profile selector."""
+        self.profiles = self.data_handler.load_profiles()
+        self.profile_combobox['values'] = [self.NO_PROFILE] + sorted(self.profiles)
+        if self.profile_var.get() not in self.profiles:
+            self.profile_var.set(self.NO_PROFILE)
+
+    def selected_profile_name(self):
+        name = self.profile_var.get()
+        return name if name in self.profiles else None
+
+    def on_profile_selected(self, event=None):
+        """Applies the profile's target voltage and, for a continuous profile, its duration."""
+        profile = self.profiles.get(self.profile_var.get())
+        if not profile:
+            return
+        if "voltage" in profile:
+            self.pass_fail_voltage_var.set(str(profile["voltage"]))
+        try:
+            steps = parse_steps(profile)
+        except ValueError as e:
+            messagebox.showerror("Invalid Profile", f"Profile '{self.profile_var.get()}': {e}")
+            return
+        if steps:
+            self.log_message(f"INFO: Profile '{self.profile_var.get()}' runs {len(steps)} step(s) over {total_duration_ms(steps) / 1000:g} s in Depassivation cycles.")
+        elif "duration" in profile:
+            self.depassivation_duration_var.set(str(profile["duration"]))
+
+    def _selected_profile_steps(self):
+        """ProfileSteps of the selected profile; empty for continuous. Raises ValueError if malformed."""
+        profile = self.profiles.get(self.profile_var.get())
+        return parse_steps(profile) if profile else []
+
+    def _download_profile(self, steps):
+        """Sends the profile to the device unless it already reported holding it. Returns the id sent, or None."""
+        steps_id = profile_id(steps)
+        if steps_id == self.device_profile_id:
+            return None
+        for line in encode_profile(steps):
+            self.connection_handler.send(line)
+        self.log_message(f"INFO: Downloading load profile {steps_id} ({len(steps)} step(s)) to the device.")
+        return steps_id
+
+    def _handle_profile_reply(self, data):
+        parts = data.split(',')
+        if parts[0] in ("PROFILE_OK", "PROFILE_LOADED") and len(parts) > 1:
+            self.device_profile_id = None if parts[1] == "NONE" else parts[1]
+            self.log_message(f"ESP32: {data}")
+            if self.pending_profile_start and parts[0] == "PROFILE_OK":
+                expected, timer = self.pending_profile_start
+                if parts[1] != expected:
+                    self._fail_profile_start(f"the device stored profile {parts[1]}, expected {expected}")
+                    return
+                self.root.after_cancel(timer)
+                self.pending_profile_start = None
+                self.connection_handler.send("START_PROFILE\n")
+        else:
+            self.device_profile_id = None
+            self.log_message(f"ERROR: Profile download failed: {data}")
+            if self.pending_profile_start:
+                self._fail_profile_start(data)
+
+    def _fail_profile_start(self, reason):
+        """Ends a cycle whose load profile the device never confirmed; START_PROFILE was not sent."""
+        if self.pending_profile_start is None:
+            return
+        self.log_message(f"ERROR: Cycle {self.current_cycle_id} not started, the load profile download failed: {reason}")
+        # Paused first, so finalizing the cycle does not chain the next one onto the same failing download
+        self.scheduler.pause("load profile download failed")
+        self._finish_cycle(f"PROCESS_END: Aborted, load profile download failed ({reason}).")
+
+    def _handle_step_marker(self, data):
+        if self.current_cycle_id is None:
+            return
+        parts = data.split(',')
+        try:
+            time_ms = int(parts[1])
+            index = int(parts[2])
+        except (IndexError, ValueError):
+            self.telemetry.lines_malformed += 1
+            self.log_message(f"WARN: Malformed step marker: {data}")
+            return
+        steps = self.cycle_profile_steps or []
+        label = steps[index].label if index < len(steps) else f"Step {index + 1}"
+        self.data_handler.log_cycle_step(self.current_cycle_id, time_ms, index, label)
+        self.log_message(f"INFO: Step {index + 1} at {time_ms / 1000.0:.3f} s: {label}")
+        self.ax.axvline(time_ms / 1000.0, color='gray', linestyle='--', alpha=0.6, linewidth=1)
+        self.canvas.draw_idle()
+
+    def _start_scheduled_cycle(self, job, cycle_type, duration):
+        """Starts the next cycle of a scheduler job. Returns False if the station is not ready."""
+        if self.is_running or not self.connection_handler.is_connected():
+            return False
+        self.selected_battery_id = job.battery_id
+        self.selected_battery_var.set(job.battery_name)
+        if job.test_id is None or cycle_type == "Baseline":
+            job.test_id = self.data_handler.create_new_test(job.battery_id, self.selected_profile_name())
+        self.current_test_id = job.test_id
+        self.scheduled_cycle_active = self._start_cycle(cycle_type, duration)
+        return self.scheduled_cycle_active
+
     def _start_cycle(self, cycle_type, duration):
         if self.selected_battery_id is None:
             messagebox.showerror("Error", "Please select a battery before starting a test.")
-            return
+            return False
         if self.is_running:
             messagebox.showwarning("Warning", "A cycle is already in progress.")
-            return
+            return False
+
+        steps = []
+        if cycle_type == "Depassivation":
+            try:
+                steps = self._selected_profile_steps()
+            except ValueError as e:
+                messagebox.showerror("Invalid Profile", f"Profile '{self.profile_var.get()}': {e}")
+                return False
+        if steps:
+            # The profile defines the cycle length; the device times every step
+            duration = -(-total_duration_ms(steps) // 1000)
 
         self.clear_graph_and_stats()
-        self.cycle_label.config(text=f"Current Cycle: {cycle_type}")
+        self.cycle_label.config(text=f"Current Cycle: {cycle_type}" + (f" ({self.profile_var.get()})" if steps else ""))
         self.test_progress_bar['maximum'] = duration * 1000
         self.test_progress_bar['value'] = 0
         self.update_graph_xaxis(duration)
 
         pass_fail_voltage = float(self.pass_fail_voltage_var.get())
+        self.current_pass_fail_voltage = pass_fail_voltage
+        self.cycle_accumulator = CycleAccumulator(pass_fail_voltage)
+        self.plateau_detector = None
+        self.early_stop_reason = None
+        self.anomaly_abort_reason = None
+        self.anomaly_detector = AnomalyDetector(load_switching=bool(steps)) if self.anomaly_detection_var.get() else None
+        self.cycle_profile_steps = steps or None
+        if steps and self.adaptive_stop_var.get():
+            self.log_message("INFO: Adaptive stop is not used with stepped load profiles.")
+        elif cycle_type == "Depassivation" and self.adaptive_stop_var.get():
+            try:
+                window_s = float(self.adaptive_window_var.get())
+                max_slope = float(self.adaptive_slope_var.get())
+                # The configured duration stays the hard limit enforced by the device
+                self.plateau_detector = PlateauDetector(pass_fail_voltage, window_s, max_slope)
+            except ValueError:
+                self.log_message("WARN: Invalid adaptive stop settings; running the full duration.")
         self.current_cycle_id = self.data_handler.create_new_cycle(self.current_test_id, cycle_type, duration, pass_fail_voltage)
 
         self.is_running = True
+        self.telemetry.cycle_type = cycle_type
+        if self.read_api:
+            self.read_api.publish({'type': 'cycle_start', 'cycle_id': self.current_cycle_id, 'test_id': self.current_test_id,
+                                   'cycle_type': cycle_type, 'duration': duration, 'pass_fail_voltage': pass_fail_voltage})
 
         self.baseline_button.config(state=tk.DISABLED)
         self.depassivation_button.config(state=tk.DISABLED)
         self.check_button.config(state=tk.DISABLED)
         self.abort_button.config(state=tk.NORMAL)
 
-        self.connection_handler.send(f"START,{duration}\n")
+        if self.acquisition_process:
+            self.connection_handler.set_cycle(self.current_cycle_id)
+        # Sent every time so the device never keeps a window from an earlier session
+        self.connection_handler.send(f"BURST,{self._burst_window_ms()}\n")
+        if steps:
+            steps_id = self._download_profile(steps)
+            if steps_id is None:
+                self.connection_handler.send("START_PROFILE\n")
+            else:
+                # Held until PROFILE_OK: a rejected download would leave the device running its previous profile
+                timer = self.root.after(self.PROFILE_ACK_TIMEOUT_MS, self._fail_profile_start, "no reply from the device")
+                self.pending_profile_start = (steps_id, timer)
+        else:
+            self.connection_handler.send(f"START,{duration}\n")
+        return True
+
+    def _burst_window_ms(self):
+        try:
+            return max(0, int(self.burst_window_var.get()))
+        except ValueError:
+            self.log_message("WARN: Invalid burst window; burst capture is off for this cycle.")
+            return 0
 
     def abort_process(self):
         if not self.is_running: return
+        self.scheduler.pause("cycle aborted by operator")
         self.is_running = False
         self.abort_button.config(state=tk.DISABLED)
         self.baseline_button.config(state=tk.NORMAL if self.selected_battery_id else tk.DISABLED)
@@ -624,6 +1662,10 @@ class DepassivationApp:
             self.live_power_label.config(text="Power: --")
             self.live_resistance_label.config(text="Resistance: --")
 
+        if self.pending_profile_start:
+            # The device has not started anything, so no PROCESS_END will come
+            self._finish_cycle("PROCESS_END: Aborted by the operator before the load profile was confirmed.")
+            return
         if self.connection_handler.is_connected():
             self.connection_handler.send('ABORT\n')
 
@@ -632,7 +1674,8 @@ class DepassivationApp:
         self.connection_handler.send(f"SET_MOSFET,{1 if self.mosfet_on else 0}\n")
 
         if self.mosfet_on:
-            # Reset stats when activating load
+            # Reset stats when activating load; the trend keeps scrolling across the switch
+            self.live_stats.reset(clear_trend=False)
             self.live_min_voltage = 0.0
             self.live_max_current = 0.0
             self.live_min_resistance = 0.0
@@ -649,22 +1692,595 @@ class DepassivationApp:
             self.live_power_label.config(text="Power: -- mW")
             self.live_resistance_label.config(text="Resistance: -- Ω")
 
+    # --- Serial Data Handling ---
+    @tag("serial")
+    def handle_serial_data(self, data, read_time=None):
+        """
+        Central dispatcher for every line received from the device. Always runs in the Tk thread.
+        `read_time` is the perf_counter() stamp taken at serial read, passed only while instrumentation is on.
+        """
+        self.telemetry.lines_dispatched += 1
+        if read_time is not None:
+            self.instrumentation.on_dequeue(read_time)
+        data, sequence, intact = unframe(data)
+        if not intact:
+            self.telemetry.lines_corrupt += 1
+            if data.startswith(("DATA,", "LIVE_DATA,")):
+                # Counted rather than logged, a noisy link would flood the log; the gap shows up as missing samples
+                if self.current_cycle_id is not None:
+                    self.cycle_stream.corrupt += 1
+                elif self.current_mode == "live":
+                    self.live_stream.corrupt += 1
+                return
+            if data.startswith("BURST_DATA,"):
+                # The burst counts its own missing samples; the 1 Hz stream's statistics stay out of it
+                return
+            # Anything else is still acted on, above all PROCESS_END, or the cycle would never be finalized;
+            # its sample count cannot be trusted
+            sequence = None
+        if data.startswith("LIVE_DATA,"):
+            self._handle_live_data(data, read_time, sequence)
+        elif data.startswith("DATA,"):
+            self._handle_test_data(data, read_time, sequence)
+        elif data.startswith("BURST_"):
+            self._handle_burst(data)
+        elif data.startswith("STEP,"):
+            self._handle_step_marker(data)
+        elif data.startswith("PROFILE_"):
+            self._handle_profile_reply(data)
+        elif data.startswith("PROCESS_END"):
+            self.log_message(f"ESP32: {data}")
+            self._finish_cycle(data, sequence)
+        else:
+            self.log_message(f"ESP32: {data}")
+
+    def _handle_test_data(self, data, read_time=None, sequence=None):
+        if self.current_cycle_id is None:
+            self.telemetry.samples_outside_cycle += 1
+            return
+        if read_time is not None:
+            parse_start = time.perf_counter()
+        parts = data.split(',')
+        try:
+            time_ms = int(parts[1])
+            voltage = float(parts[2])
+            current = float(parts[3])
+        except (IndexError, ValueError):
+            self.telemetry.lines_malformed += 1
+            self.log_message(f"WARN: Malformed data line: {data}")
+            return
+        if read_time is not None:
+            self.instrumentation.record('sample.parse', time.perf_counter() - parse_start)
+        self._process_test_sample(time_ms, voltage, current, sequence, read_time)
+
+    @tag("serial")
+    def handle_ring_samples(self, records):
+        """
+        Samples parsed by the acquisition process (RECORD_DTYPE records, in wire order). Those
+        tagged with the running cycle are already stored; the rest go through log_reading.
+        """
+        from acquisition_process import KIND_DATA
+        self.telemetry.lines_dispatched += len(records)
+        timed = self.instrumentation.enabled
+        for kind, sequence, cycle_id, time_ms, voltage, current, power, resistance, read_time in records.tolist():
+            sequence = sequence if sequence >= 0 else None
+            read_time = read_time if timed else None
+            if read_time is not None:
+                self.instrumentation.histograms['sample.read_to_dispatch'].record(time.perf_counter() - read_time)
+            if kind == KIND_DATA:
+                if self.current_cycle_id is None:
+                    self.telemetry.samples_outside_cycle += 1
+                    continue
+                self._process_test_sample(time_ms, voltage, current, sequence, read_time,
+                                          stored=cycle_id == self.current_cycle_id)
+            else:
+                self._process_live_sample(voltage, current, power, resistance, sequence, read_time)
+
+    def _process_test_sample(self, time_ms, voltage, current, sequence=None, read_time=None, stored=False):
+        """Accounts for, stores (unless `stored`) and shows one sample of the running cycle."""
+        gap = self.cycle_stream.accept(sequence, time_ms / 1000.0)
+        if gap is None:
+            self.telemetry.samples_duplicate += 1
+            return
+        self.telemetry.samples_missing += gap
+
+        self.data_points.append((time_ms / 1000.0, voltage, current))
+        if self.read_api:
+            self.read_api.publish({'type': 'sample', 'cycle_id': self.current_cycle_id, 't': time_ms / 1000.0, 'v': voltage, 'i': current})
+        if not stored:
+            db_start = time.perf_counter()
+            self.data_handler.log_reading(self.current_cycle_id, time_ms, voltage, current)
+            if read_time is not None:
+                db_end = time.perf_counter()
+                self.instrumentation.record('db.write', db_end - db_start)
+                self.instrumentation.record('sample.read_to_db_commit', db_end - read_time)
+        if read_time is not None and self.pending_render_read_time is None:
+            self.pending_render_read_time = read_time
+
+        if self.anomaly_detector is not None:
+            events = self.anomaly_detector.update(time_ms, voltage, current)
+            if events:
+                self._handle_anomalies(events)
+
+        self.cycle_accumulator.add(time_ms / 1000.0, voltage, current)
+        if self.plateau_detector is not None and self.is_running:
+            reason = self.plateau_detector.update(time_ms / 1000.0, voltage)
+            if reason:
+                self.plateau_detector = None
+                self.early_stop_reason = reason
+                self.log_message(f"INFO: Stopping depassivation early at {time_ms / 1000.0:.1f} s: {reason}")
+                self.connection_handler.send('ABORT\n')
+        if not self.metrics_refresh_pending:
+            self.metrics_refresh_pending = True
+            self.root.after(250, self._refresh_cycle_metrics)
+
+        self.plot_times.append(time_ms / 1000.0)
+        self.plot_voltages.append(voltage)
+        self.line.set_data(self.plot_times, self.plot_voltages)
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+        self.canvas.draw_idle()
+
+    def _handle_burst(self, data):
+        if self.current_cycle_id is None:
+            return
+        try:
+            if data.startswith("BURST_DATA,"):
+                self.burst.add(data)
+            elif data.startswith("BURST_BEGIN,"):
+                self.burst.begin(data)
+            elif data.startswith("BURST_END"):
+                self.burst.end(data)
+                self._store_burst()
+        except (IndexError, ValueError) as e:
+            self.telemetry.lines_malformed += 1
+            self.log_message(f"WARN: Malformed burst line ({e}): {data}")
+
+    def _store_burst(self):
+        """Saves the burst received so far with the current cycle and shows it on the live graph."""
+        burst = self.burst
+        if not burst.active:
+            return
+        time_us, voltage, current = burst.segment()
+        self.data_handler.save_burst(self.current_cycle_id, burst.start_ms, burst.expected, time_us, voltage, current)
+        missing = f", {burst.expected - len(time_us)} missing" if len(time_us) < burst.expected else ""
+        if len(time_us):
+            k = int(voltage.argmin())
+            self.log_message(f"INFO: Burst of {len(time_us)} samples over {time_us[-1] / 1000.0:.0f} ms{missing}: "
+                             f"min {voltage[k]:.3f} V at {time_us[k] / 1000.0:.1f} ms")
+            self._plot_burst_inset(self.ax, time_us, voltage)
+            self.canvas.draw_idle()
+        else:
+            self.log_message(f"WARN: Burst of {burst.expected} samples announced but none arrived.")
+        burst.reset()
+
+    def _plot_burst_inset(self, ax, time_us, voltage):
+        """Draws a burst on its own millisecond scale; on the cycle's axis it would be a few pixels wide."""
+        inset = ax.inset_axes([0.55, 0.08, 0.42, 0.4])
+        inset.plot(time_us / 1000.0, voltage, linewidth=0.8, color='tab:red')
+        inset.set_title("Load connect (ms)", fontsize=7)
+        inset.tick_params(labelsize=6)
+        inset.grid(True, alpha=0.3)
+
+    def _handle_anomalies(self, events):
+        self.data_handler.log_cycle_events(self.current_cycle_id, events)
+        for event in events:
+            self.log_message(f"WARN: Anomaly at {event['timestamp_ms'] / 1000.0:.3f} s ({event['event_type']}): {event['detail']}")
+        critical = next((e for e in events if e['severity'] == SEVERITY_CRITICAL), None)
+        if critical and self.anomaly_abort_var.get() and self.is_running and self.anomaly_abort_reason is None:
+            self.anomaly_abort_reason = f"{critical['event_type']}: {critical['detail']}"
+            self.log_message(f"ERROR: Aborting cycle on critical anomaly: {critical['detail']}")
+            self.connection_handler.send('ABORT\n')
+
+    def _refresh_cycle_metrics(self):
+        """Updates the Metrics panel from the running accumulator; called at most every 250 ms."""
+        self.metrics_refresh_pending = False
+        acc = self.cycle_accumulator
+        if acc.count == 0:
+            return
+        self.voltage_label.config(text=f"Current Voltage: {acc.last_v:.3f} V")
+        self.current_label.config(text=f"Current: {acc.last_i:.1f} mA")
+        self.max_current_label.config(text=f"Max Current: {acc.max_current:.1f} mA")
+        self.min_voltage_label.config(text=f"Min Voltage: {acc.min_voltage:.3f} V")
+        self.power_label.config(text=f"Power: {acc.power:.1f} mW")
+        self.resistance_label.config(text=f"Resistance: {acc.resistance:.2f} Ω")
+        std = acc.voltage_std
+        std_text = f" ± {std * 1000:.1f} mV" if std is not None else ""
+        self.mean_voltage_label.config(text=f"Mean Voltage: {acc.mean_voltage:.3f} V{std_text}")
+        self.energy_label.config(text=f"Delivered: {acc.charge_mas / 3600.0:.3f} mAh / {acc.energy_mws / 3600.0:.3f} mWh")
+        self.time_below_label.config(text=f"Time Below Target: {acc.time_below:.1f} s")
+        self.test_progress_bar['value'] = acc.last_t * 1000
+        self.link_label.config(text=self.cycle_stream.describe())
+
+    def _finish_cycle(self, message, samples_sent=None):
+        """`samples_sent` is the sample count the firmware reports with PROCESS_END, if it numbers its samples."""
+        if self.current_cycle_id is None:
+            return
+        if self.pending_profile_start:
+            self.root.after_cancel(self.pending_profile_start[1])
+            self.pending_profile_start = None
+        self.telemetry.samples_missing += self.cycle_stream.end(samples_sent)
+        # Keeps what arrived of a burst whose BURST_END was lost
+        self._store_burst()
+        acc = self.cycle_accumulator
+        completed_early = self.early_stop_reason is not None
+        result = cycle_result(acc.min_voltage if acc.count else None, self.current_pass_fail_voltage,
+                              aborted="abort" in message.lower() and not completed_early)
+        if completed_early:
+            end_reason = f"Completed early: {self.early_stop_reason}"
+        elif self.anomaly_abort_reason:
+            end_reason = f"Aborted on anomaly: {self.anomaly_abort_reason}"
+        else:
+            end_reason = message.replace("PROCESS_END:", "").strip()
+        self.plateau_detector = None
+        self.early_stop_reason = None
+        self.anomaly_abort_reason = None
+        self.cycle_profile_steps = None
+
+        # The accumulator already holds every metric, so finalizing does not revisit the samples
+        self._refresh_cycle_metrics()
+        if not self.data_handler.flush_journal():
+            self.log_message("WARN: Some samples of this cycle are still in the ingestion journal; they will be stored once the database accepts them.")
+        self.data_handler.update_cycle_result(self.current_cycle_id, acc.min_voltage, acc.max_current, acc.power, acc.resistance, result)
+        self.data_handler.update_cycle_end(self.current_cycle_id, end_reason, completed_early)
+        stream = self.cycle_stream
+        self.data_handler.update_cycle_stream(self.current_cycle_id, stream.summary())
+        if stream.missing or stream.duplicates or stream.corrupt:
+            self.log_message(f"WARN: Cycle {self.current_cycle_id} lost data on the serial link. {stream.describe()}")
+        if acc.count:
+            self.data_handler.update_cycle_analytics(self.current_cycle_id, acc.finalize(), ANALYTICS_VERSION)
+        self.log_message(f"INFO: Cycle {self.current_cycle_id} finished with result: {result}" + (" (completed early)" if completed_early else ""))
+        self.profiler.memory_checkpoint(f"cycle {self.current_cycle_id}")
+        self.telemetry.cycle_finished(result)
+        if self.read_api:
+            self.read_api.publish({'type': 'cycle_end', 'cycle_id': self.current_cycle_id, 'result': result, 'end_reason': end_reason,
+                                   'completeness': stream.completeness})
+            self._history_changed()
+        self.last_completed_cycle_id = self.current_cycle_id
+        self.current_cycle_id = None
+        self.is_running = False
+        if self.acquisition_process:
+            self.connection_handler.set_cycle(None)
+
+        self.abort_button.config(state=tk.DISABLED)
+        self.baseline_button.config(state=tk.NORMAL if self.selected_battery_id else tk.DISABLED)
+        self.depassivation_button.config(state=tk.NORMAL if self.selected_battery_id else tk.DISABLED)
+        self.check_button.config(state=tk.NORMAL if self.selected_battery_id else tk.DISABLED)
+        self.export_live_graph_button.config(state=tk.NORMAL)
+        self.export_live_data_button.config(state=tk.NORMAL)
+        self.test_progress_bar['value'] = self.test_progress_bar['maximum']
+        style = 'pass.TLabel' if result == "PASS" else 'fail.TLabel'
+        self.pass_fail_label.config(text=result, style=style)
+
+        if self.history_battery_list.curselection():
+            self.on_history_battery_selected()
+
+        if self.scheduled_cycle_active:
+            self.scheduled_cycle_active = False
+            self.scheduler.on_cycle_finished(result)
+
+    def _handle_live_data(self, data, read_time=None, sequence=None):
+        parts = data.split(',')
+        try:
+            voltage, current, power, resistance = (float(p) for p in parts[1:5])
+        except ValueError:
+            self.telemetry.lines_malformed += 1
+            self.log_message(f"WARN: Malformed live data line: {data}")
+            return
+        self._process_live_sample(voltage, current, power, resistance, sequence, read_time)
+
+    def _process_live_sample(self, voltage, current, power, resistance, sequence=None, read_time=None):
+        if self.live_start_time is None:
+            self.live_start_time = time.monotonic()
+        elapsed = time.monotonic() - self.live_start_time
+        gap = self.live_stream.accept(sequence, elapsed)
+        if gap is None:
+            self.telemetry.samples_duplicate += 1
+            return
+        self.telemetry.samples_missing += gap
+        if self.read_api:
+            self.read_api.publish({'type': 'live', 't': elapsed, 'v': voltage, 'i': current, 'power': power, 'resistance': resistance})
+
+        self.live_voltage_label.config(text=f"Voltage: {voltage:.3f} V")
+        self.live_current_label.config(text=f"Current: {current:.1f} mA")
+        self.live_power_label.config(text=f"Power: {power:.1f} mW")
+        self.live_resistance_label.config(text=f"Resistance: {resistance:.2f} Ω")
+
+        # The firmware reports 0 Ω when no meaningful current flows
+        self.live_stats.update(elapsed, {
+            'voltage': voltage,
+            'current': current,
+            'power': power,
+            'resistance': resistance if resistance > 0 else None,
+        })
+        stats = self.live_stats
+        self.live_min_voltage = stats.session_min['voltage'] or 0.0
+        self.live_max_current = stats.session_max['current'] or 0.0
+        self.live_min_resistance = stats.session_min['resistance'] or 0.0
+        self.live_max_resistance = stats.session_max['resistance'] or 0.0
+        if read_time is not None and self.pending_live_render_read_time is None:
+            # Track the oldest sample not yet on screen
+            self.pending_live_render_read_time = read_time
+
+        # Labels and the trend plot are refreshed at a fixed rate, independent of the sample rate
+        if not self.live_redraw_pending:
+            self.live_redraw_pending = True
+            self.root.after(200, self._redraw_live_view)
+
+    @tag("plot")
+    def _redraw_live_view(self):
+        self.live_redraw_pending = False
+        stats = self.live_stats
+        if stats.sample_count:
+            self.live_min_v_label.config(text=f"Min Voltage: {self.live_min_voltage:.3f} V")
+            self.live_max_c_label.config(text=f"Max Current: {self.live_max_current:.1f} mA")
+            if stats.session_min['resistance'] is not None:
+                self.live_min_r_label.config(text=f"Min Resistance: {self.live_min_resistance:.2f} Ω")
+                self.live_max_r_label.config(text=f"Max Resistance: {self.live_max_resistance:.2f} Ω")
+            self.live_smoothed_label.config(text=f"Smoothed Voltage: {stats.smoothed['voltage'].value:.3f} V")
+            self.live_link_label.config(text=self.live_stream.describe())
+            for window, label in self.live_rolling_labels.items():
+                rolling = stats.rolling['voltage'][window]
+                std = rolling.std
+                std_text = f" ± {std * 1000:.1f} mV" if std is not None else ""
+                label.config(text=f"Voltage (last {window}): {rolling.mean:.3f} V{std_text}")
+            widest = stats.rolling['voltage'][stats.windows[-1]]
+            self.live_window_minmax_label.config(text=f"Window Min/Max: {widest.min:.3f} / {widest.max:.3f} V")
+
+        times, voltages = stats.trend.view()
+        if len(times) == 0 or self.current_mode != "live" or self.live_trend_fig is None:
+            return
+        self.live_trend_line.set_data(times, voltages)
+        self.live_trend_ax.set_xlim(times[0], max(times[-1], times[0] + 1.0))
+        v_min, v_max = voltages.min(), voltages.max()
+        margin = (v_max - v_min) * 0.1 if (v_max - v_min) > 0 else 0.05
+        self.live_trend_ax.set_ylim(v_min - margin, v_max + margin)
+        self.live_trend_canvas.draw_idle()
+
+    def _on_main_canvas_drawn(self, event):
+        if self.pending_render_read_time is not None:
+            self.instrumentation.record('sample.read_to_render', time.perf_counter() - self.pending_render_read_time)
+            self.pending_render_read_time = None
+
+    def _on_live_trend_drawn(self, event):
+        if self.pending_live_render_read_time is not None:
+            self.instrumentation.record('live.read_to_render', time.perf_counter() - self.pending_live_render_read_time)
+            self.pending_live_render_read_time = None
+
+    def clear_graph_and_stats(self):
+        self.data_points = []
+        self.plot_times = []
+        self.plot_voltages = []
+        self.cycle_accumulator = CycleAccumulator(self.current_pass_fail_voltage)
+        self.cycle_stream.reset()
+        self.burst.reset()
+        self.ax.cla()
+        self.ax.set_title("Voltage vs. Time")
+        self.ax.set_xlabel("Time (s)")
+        self.ax.set_ylabel("Voltage (V)")
+        self.ax.grid(True)
+        self.line, = self.ax.plot([], [], marker='.', linestyle='-')
+        self.canvas.draw_idle()
+        self.voltage_label.config(text="Current Voltage: -- V")
+        self.current_label.config(text="Current: -- mA")
+        self.max_current_label.config(text="Max Current: -- mA")
+        self.min_voltage_label.config(text="Min Voltage: -- V")
+        self.power_label.config(text="Power: -- mW")
+        self.resistance_label.config(text="Resistance: -- Ω")
+        self.mean_voltage_label.config(text="Mean Voltage: -- V")
+        self.energy_label.config(text="Delivered: -- mAh / -- mWh")
+        self.time_below_label.config(text="Time Below Target: -- s")
+        self.link_label.config(text="Link: --")
+        self.pass_fail_label.config(text="---", style='TLabel')
+
+    def update_graph_xaxis(self, duration):
+        self.ax.set_xlim(0, duration)
+        self.canvas.draw_idle()
+
+    def handle_disconnect(self):
+        self.device_profile_id = None
+        # Paused first, so finalizing the cycle does not chain the next one onto a dead link
+        self.scheduler.pause("device disconnected")
+        if self.current_cycle_id is not None:
+            # No PROCESS_END will come; the samples received so far are kept
+            self._finish_cycle("PROCESS_END: Aborted, link to the device lost.")
+        if hasattr(self, 'connect_button'):
+            self.connect_button.config(text="Connect", state=tk.NORMAL)
+        self.status_var.set("Disconnected.")
+        self.on_battery_selected(None)
+
+    # --- Retention ---
+    def _run_retention(self):
+        """Starts a background retention pass and schedules the next one."""
+        self.root.after(self.RETENTION_INTERVAL_MS, self._run_retention)
+        if self.retention_running:
+            return
+        self.retention_running = True
+        threading.Thread(target=self._retention_worker, daemon=True).start()
+
+    def _retention_worker(self):
+        try:
+            # Steps aside while a cycle is acquiring; each chunk is a short transaction anyway
+            summary = apply_retention(DB_FILE, self.retention_policy,
+                                      should_stop=lambda: self.closing, busy=lambda: self.is_running)
+            error = None
+        except sqlite3.Error as e:
+            summary, error = None, e
+        if not self.closing:
+            self.root.after(0, self._finish_retention, summary, error)
+
+    def _finish_retention(self, summary, error):
+        self.retention_running = False
+        if error:
+            self.log_message(f"ERROR: Retention job failed: {error}")
+        elif summary["cycles"]:
+            self._history_changed()
+            self.log_message(f"INFO: Retention downsampled {summary['downsampled']} and purged {summary['purged']} cycle(s), "
+                             f"deleting {summary['rows_deleted']} sample(s).")
+            if not summary["incremental_vacuum"]:
+                self.log_message("INFO: Run 'python retention.py --convert' once so the database file shrinks.")
+
+    def on_closing(self):
+        self.closing = True
+        self.profiler.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.read_api:
+            self.read_api.stop()
+        if self.is_running:
+            self.abort_process()
+        self.data_handler.save_config()
+        # Also stops an acquisition process that is still connecting
+        self.connection_handler.disconnect()
+        self.data_handler.close_journal()
+        self.root.destroy()
+
     def _refresh_port_list(self):
-        ports = self.connection_handler.get_ports()
-        port_names = [p.device for p in ports]
+        """Enumerates serial ports in a background thread; enumeration can take seconds on some systems."""
+        self.refresh_ports_button.config(state=tk.DISABLED)
+        threading.Thread(target=self._enumerate_ports, daemon=True).start()
+
+    def _enumerate_ports(self):
+        try:
+            port_names = [p.device for p in self.connection_handler.get_ports()]
+        except Exception as e:
+            self.root.after(0, self.log_message, f"ERROR: Could not list serial ports: {e}")
+            port_names = []
+        self.root.after(0, self._apply_port_list, port_names)
+
+    def _apply_port_list(self, port_names):
+        self.refresh_ports_button.config(state=tk.NORMAL)
         self.port_combobox['values'] = port_names
         if port_names: self.port_combobox.set(port_names[0] if not self.selected_port_var.get() else self.selected_port_var.get())
 
     def toggle_connection(self):
+        self.device_profile_id = None
         if self.connection_handler.is_connected():
             self.connection_handler.disconnect()
             self.connect_button.config(text="Connect")
             self.on_battery_selected(None) # Re-evaluates button states
         else:
-            if self.connection_handler.connect(self.selected_port_var.get()):
-                self.connect_button.config(text="Disconnect")
-                self.on_battery_selected(None) # Re-evaluates button states
-                self.connection_handler.send("SET_MODE,IDLE\n")
+            connected = self.connection_handler.connect(self.selected_port_var.get())
+            if connected is None:
+                # The acquisition process is starting; it calls handle_connected() once the port is open
+                self.connect_button.config(text="Connecting...", state=tk.DISABLED)
+            elif connected:
+                self.handle_connected()
+
+    def handle_connected(self):
+        self.connect_button.config(text="Disconnect", state=tk.NORMAL)
+        self.on_battery_selected(None) # Re-evaluates button states
+        self.connection_handler.send("SET_MODE,IDLE\n")
+        self.connection_handler.send("PROFILE_QUERY\n")
+
+    def _create_history_search_frame(self, parent):
+        frame = ttk.LabelFrame(parent, text="Search", padding="10")
+        frame.columnconfigure(1, weight=1)
+        frame.columnconfigure(3, weight=1)
+        self.search_from_var = tk.StringVar()
+        self.search_to_var = tk.StringVar()
+        self.search_type_var = tk.StringVar()
+        self.search_result_var = tk.StringVar()
+        self.search_profile_var = tk.StringVar()
+        self.search_metric_var = tk.StringVar(value="min_voltage")
+        self.search_metric_min_var = tk.StringVar()
+        self.search_metric_max_var = tk.StringVar()
+
+        ttk.Label(frame, text="From:").grid(row=0, column=0, sticky="w")
+        ttk.Entry(frame, textvariable=self.search_from_var, width=11).grid(row=0, column=1, sticky="ew", padx=2, pady=1)
+        ttk.Label(frame, text="To:").grid(row=0, column=2, sticky="w")
+        ttk.Entry(frame, textvariable=self.search_to_var, width=11).grid(row=0, column=3, sticky="ew", padx=2, pady=1)
+        ttk.Label(frame, text="Type:").grid(row=1, column=0, sticky="w")
+        ttk.Combobox(frame, textvariable=self.search_type_var, values=["", "Baseline", "Depassivation", "Check"], state='readonly', width=11).grid(row=1, column=1, sticky="ew", padx=2, pady=1)
+        ttk.Label(frame, text="Result:").grid(row=1, column=2, sticky="w")
+        ttk.Combobox(frame, textvariable=self.search_result_var, values=["", "PASS", "FAIL", "ABORTED", "NO DATA"], state='readonly', width=9).grid(row=1, column=3, sticky="ew", padx=2, pady=1)
+        ttk.Label(frame, text="Profile:").grid(row=2, column=0, sticky="w")
+        self.search_profile_combo = ttk.Combobox(frame, textvariable=self.search_profile_var, width=11, postcommand=self._refresh_search_profiles)
+        self.search_profile_combo.grid(row=2, column=1, columnspan=3, sticky="ew", padx=2, pady=1)
+        ttk.Combobox(frame, textvariable=self.search_metric_var, values=SEARCHABLE_METRICS, state='readonly', width=11).grid(row=3, column=0, columnspan=2, sticky="ew", padx=2, pady=1)
+        range_frame = ttk.Frame(frame)
+        range_frame.grid(row=3, column=2, columnspan=2, sticky="ew")
+        ttk.Entry(range_frame, textvariable=self.search_metric_min_var, width=6).pack(side="left", expand=True, fill="x", padx=2)
+        ttk.Label(range_frame, text="to").pack(side="left")
+        ttk.Entry(range_frame, textvariable=self.search_metric_max_var, width=6).pack(side="left", expand=True, fill="x", padx=2)
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=4, column=0, columnspan=4, sticky="ew", pady=(4,0))
+        ttk.Button(button_frame, text="Search", command=self.run_history_search).pack(side="left", expand=True, fill="x", padx=(0,2))
+        ttk.Button(button_frame, text="Clear", command=self.clear_history_search).pack(side="left", expand=True, fill="x", padx=(2,0))
+        return frame
+
+    def _refresh_search_profiles(self):
+        self.search_profile_combo['values'] = [""] + self.data_handler.get_profile_names()
+
+    def _collect_search_filters(self):
+        """Builds the filter dict for DataHandler.search_cycles from the Search panel, or None if invalid."""
+        filters = {
+            'date_from': self.search_from_var.get().strip() or None,
+            'date_to': self.search_to_var.get().strip() or None,
+            'cycle_type': self.search_type_var.get() or None,
+            'result': self.search_result_var.get() or None,
+            'profile_name': self.search_profile_var.get().strip() or None,
+        }
+        battery_name = self._selected_history_battery_name()
+        if battery_name:
+            battery = next((b for b in self.batteries if b['name'] == battery_name), None)
+            filters['battery_id'] = battery['id'] if battery else None
+        elif self._history_uncategorized_selected():
+            filters['uncategorized'] = True
+        try:
+            for key in ('date_from', 'date_to'):
+                if filters[key]:
+                    datetime.strptime(filters[key], "%Y-%m-%d")
+            low = self.search_metric_min_var.get().strip()
+            high = self.search_metric_max_var.get().strip()
+            if low or high:
+                filters['metrics'] = {self.search_metric_var.get(): (float(low) if low else None, float(high) if high else None)}
+        except ValueError:
+            messagebox.showerror("Invalid Search", "Dates must be YYYY-MM-DD and metric bounds must be numbers.", parent=self.root)
+            return None
+        return filters
+
+    def run_history_search(self):
+        filters = self._collect_search_filters()
+        if filters is None:
+            return
+        self.history_search_filters = filters
+        self.history_search_last = None
+        self.history_search_tests = {}
+        self.current_history_sequences = {}
+        self.history_tree.delete(*self.history_tree.get_children())
+        self.clear_history_details()
+        self.load_more_search_results()
+
+    def load_more_search_results(self):
+        """Appends the next page of search results to the history list."""
+        if self.history_search_filters is None:
+            return
+        rows = self.data_handler.search_cycles(self.history_search_filters, after=self.history_search_last, page_size=self.HISTORY_PAGE_SIZE)
+        for row in rows:
+            self.history_search_tests[row['id']] = row['test_id']
+            tags = ('baseline',) if row['cycle_type'] == 'Baseline' else ('check',) if row['cycle_type'] == 'Check' else ()
+            self.history_tree.insert("", tk.END, iid=row['id'], values=(row['id'], row['cycle_type'], row['timestamp'], row['result'] or "Incomplete"), tags=tags)
+        if rows:
+            self.history_search_last = (rows[-1]['timestamp_epoch'], rows[-1]['id'])
+        if len(rows) == self.HISTORY_PAGE_SIZE:
+            self.history_more_button.grid(row=1, column=0, sticky="ew", pady=(5,0))
+        else:
+            self.history_more_button.grid_remove()
+        self.status_var.set(f"Search: {len(self.history_search_tests)} cycle(s) shown" + (" (more available)" if len(rows) == self.HISTORY_PAGE_SIZE else ""))
+
+    def clear_history_search(self):
+        for var in (self.search_from_var, self.search_to_var, self.search_type_var, self.search_result_var,
+                    self.search_profile_var, self.search_metric_min_var, self.search_metric_max_var):
+            var.set("")
+        self._leave_search_mode()
+        self.on_history_battery_selected()
+
+    def _leave_search_mode(self):
+        self.history_search_filters = None
+        self.history_search_last = None
+        self.history_search_tests = {}
+        self.history_more_button.grid_remove()
 
     def populate_battery_history_list(self):
         self.history_battery_list.delete(0, tk.END)
@@ -672,7 +2288,14 @@ class DepassivationApp:
         for battery in self.batteries:
             self.history_battery_list.insert(tk.END, battery['name'])
 
+    @tag("history")
     def on_history_battery_selected(self, event=None):
+        if event is not None:
+            self._leave_search_mode()
+        elif self.history_search_filters is not None:
+            # Refreshes after a cycle finishes or a delete keep the search results
+            self.run_history_search()
+            return
         selection_idx = self.history_battery_list.curselection()
         if not selection_idx:
             if self.history_battery_list.size() > 0:
@@ -750,22 +2373,24 @@ class DepassivationApp:
             self.clear_history_details()
 
     def show_sequence_details(self, sequence_info):
+        self._ensure_history_figures()
         self.history_comparison_frame.tkraise()
         self.current_sequence_info = sequence_info
         self.selected_history_test_id = None # Not a single cycle
 
-        baseline_data = self.data_handler.get_cycle_data(sequence_info['baseline']['id'])
-        depass_data = self.data_handler.get_cycle_data(sequence_info['depassivation']['id'])
-        check_data = self.data_handler.get_cycle_data(sequence_info['check']['id'])
+        # (times, voltages, currents) arrays; file-backed cycles are paged in as matplotlib reads them
+        baseline_data = self.data_handler.get_cycle_series(sequence_info['baseline']['id'])
+        depass_data = self.data_handler.get_cycle_series(sequence_info['depassivation']['id'])
+        check_data = self.data_handler.get_cycle_series(sequence_info['check']['id'])
 
         # --- Plot 1: Depassivation cycle ---
         self.history_ax1.cla()
-        if depass_data:
-            times, voltages, _ = zip(*depass_data)
+        if len(depass_data[0]):
+            times, voltages, _ = depass_data
             self.history_ax1.plot(times, voltages, marker='.', linestyle='-', label=f"Depassivation (ID: {sequence_info['depassivation']['id']})", color='orange')
 
-            min_v = min(voltages) if voltages else 0
-            max_v = max(voltages) if voltages else 5
+            min_v = float(voltages.min())
+            max_v = float(voltages.max())
             margin = (max_v - min_v) * 0.1 if (max_v - min_v) > 0 else 0.1
             self.history_ax1.set_ylim(min_v - margin, max_v + margin)
 
@@ -782,15 +2407,15 @@ class DepassivationApp:
         all_voltages = []
         max_duration = 0
 
-        if baseline_data:
-            times, voltages, _ = zip(*baseline_data)
-            all_voltages.extend(voltages)
+        if len(baseline_data[0]):
+            times, voltages, _ = baseline_data
+            all_voltages.extend([voltages.min(), voltages.max()])
             max_duration = max(max_duration, sequence_info['baseline']['duration'])
             self.history_ax2.plot(times, voltages, marker='.', linestyle='-', label=f"Baseline (ID: {sequence_info['baseline']['id']})", color='blue')
 
-        if check_data:
-            times, voltages, _ = zip(*check_data)
-            all_voltages.extend(voltages)
+        if len(check_data[0]):
+            times, voltages, _ = check_data
+            all_voltages.extend([voltages.min(), voltages.max()])
             max_duration = max(max_duration, sequence_info['check']['duration'])
             self.history_ax2.plot(times, voltages, marker='.', linestyle='-', label=f"Check (ID: {sequence_info['check']['id']})", color='green')
 
@@ -829,8 +2454,8 @@ class DepassivationApp:
             self.comparison_labels[f'{cycle_type}_max_voltage'].config(text=f"{summary['max_current']:.1f} mA" if summary['max_current'] is not None else "--")
             self.comparison_labels[f'{cycle_type}_min_voltage'].config(text=f"{summary['min_voltage']:.3f} V" if summary['min_voltage'] is not None else "--")
 
-        baseline_last_v = baseline_data[-1][1] if baseline_data else None
-        check_last_v = check_data[-1][1] if check_data else None
+        baseline_last_v = float(baseline_data[1][-1]) if len(baseline_data[1]) else None
+        check_last_v = float(check_data[1][-1]) if len(check_data[1]) else None
         self.comparison_labels['baseline_last_voltage'].config(text=f"{baseline_last_v:.3f} V" if baseline_last_v is not None else "--")
         # Depassivation doesn't have a "last voltage" in the comparison view
         self.comparison_labels['depassivation_last_voltage'].config(text="--")
@@ -845,6 +2470,7 @@ class DepassivationApp:
             self.comparison_result_label.config(text="")
 
     def clear_history_details(self):
+        self._ensure_history_figures()
         self.selected_history_test_id = None
         self.current_sequence_info = None
         self.history_stats_frame.tkraise()
@@ -856,6 +2482,9 @@ class DepassivationApp:
         self.history_max_current_label.config(text="Max Current: -- mA")
         self.history_power_label.config(text="Power: -- mW")
         self.history_resistance_label.config(text="Resistance: -- Ω")
+        self.history_voltage_delay_label.config(text="Voltage Delay: --")
+        self.history_delivered_label.config(text="Delivered: --")
+        self.history_events_label.config(text="Anomalies: --")
         self.history_result_label.config(text="Result: --")
         self.history_ax1.cla()
         self.history_ax1.grid(True)
@@ -867,6 +2496,7 @@ class DepassivationApp:
         self.export_history_data_button.config(state=tk.DISABLED)
 
     def show_cycle_details(self, cycle_id):
+        self._ensure_history_figures()
         self.history_stats_frame.tkraise()
         self.current_sequence_info = None
         self.selected_history_test_id = cycle_id
@@ -876,7 +2506,10 @@ class DepassivationApp:
             self.log_message(f"WARN: No details found for cycle ID {cycle_id}.")
             return
 
-        data_points = self.data_handler.get_cycle_data(cycle_id)
+        times, voltages, _ = self.data_handler.get_cycle_series(cycle_id)
+        events = self.data_handler.get_cycle_events(cycle_id)
+        steps = self.data_handler.get_cycle_steps(cycle_id)
+        burst = self.data_handler.get_burst(cycle_id)
         self.history_id_label.config(text=f"Cycle ID: {summary['id']}")
         self.history_timestamp_label.config(text=f"Timestamp: {summary['timestamp']}")
         self.history_duration_label.config(text=f"Duration: {summary['duration']} s")
@@ -885,17 +2518,41 @@ class DepassivationApp:
         self.history_max_current_label.config(text=f"Max Current: {summary['max_current']:.1f} mA" if summary['max_current'] is not None else "--")
         self.history_power_label.config(text=f"Power: {summary['power']:.1f} mW" if summary['power'] is not None else "--")
         self.history_resistance_label.config(text=f"Resistance: {summary['resistance']:.2f} Ω" if summary['resistance'] is not None else "--")
-        self.history_result_label.config(text=f"Result: {summary['result'] or 'N/A'}")
+        early = " (completed early)" if summary['completed_early'] else ""
+        self.history_result_label.config(text=f"Result: {summary['result'] or 'N/A'}{early}")
+        if summary['dip_depth'] is not None:
+            recovery = f"{summary['recovery_time']:.1f} s" if summary['recovery_time'] is not None else "not recovered"
+            below = f", {summary['time_below']:.1f} s below target" if summary['time_below'] is not None else ""
+            self.history_voltage_delay_label.config(text=f"Voltage Delay: {summary['dip_depth'] * 1000:.0f} mV dip at {summary['time_to_min']:.1f} s, recovery {recovery}{below}")
+            step_r = f", ΔV/ΔI {summary['step_resistance']:.2f} Ω" if summary['step_resistance'] is not None else ""
+            self.history_delivered_label.config(text=f"Delivered: {summary['charge_mah']:.3f} mAh / {summary['energy_mwh']:.3f} mWh{step_r}")
+        else:
+            self.history_voltage_delay_label.config(text="Voltage Delay: --")
+            self.history_delivered_label.config(text="Delivered: --")
+        counts = {}
+        for event in events:
+            counts[event['event_type']] = counts.get(event['event_type'], 0) + 1
+        steps_text = f" | {len(steps)} profile step(s)" if steps else ""
+        if summary['completeness'] is not None:
+            steps_text += f" | {summary['completeness']:.1%} of samples received ({summary['samples_missing']} missing)"
+        if burst and burst['min_voltage'] is not None:
+            steps_text += f" | burst min {burst['min_voltage']:.3f} V at {burst['time_to_min_ms']:.1f} ms ({burst['sample_count']} samples)"
+        self.history_events_label.config(text="Anomalies: " + (", ".join(f"{n} {kind}" for kind, n in sorted(counts.items())) or "none") + steps_text)
 
         self.history_ax1.cla()
-        if data_points:
+        if len(times):
             self.export_history_graph_button.config(state=tk.NORMAL)
             self.export_history_data_button.config(state=tk.NORMAL)
-            times, voltages, _ = zip(*data_points)
             self.history_ax1.plot(times, voltages, marker='o', linestyle='-')
-
-            min_v = min(voltages) if voltages else 0
-            max_v = max(voltages) if voltages else 5
+            for event in events:
+                self.history_ax1.axvline(event['timestamp_ms'] / 1000.0, color='red' if event['severity'] == SEVERITY_CRITICAL else 'orange', alpha=0.4, linewidth=1)
+            for step in steps:
+                self.history_ax1.axvline(step['timestamp_ms'] / 1000.0, color='gray', linestyle='--', alpha=0.6, linewidth=1)
+            if burst and burst['sample_count']:
+                self._plot_burst_inset(self.history_ax1, burst['time_us'], burst['voltage'])
+
+            min_v = float(voltages.min())
+            max_v = float(voltages.max())
             margin = (max_v - min_v) * 0.1 if (max_v - min_v) > 0 else 0.1
             self.history_ax1.set_ylim(min_v - margin, max_v + margin)
         else:
@@ -915,19 +2572,27 @@ class DepassivationApp:
         self.history_ax2.grid(True)
         self.history_canvas2.draw()
 
+    def _selected_history_test_ids(self):
+        """Test IDs of the selected top-level rows; search results list cycles, which map to their tests."""
+        test_ids = []
+        for item_id_in_tree in self.history_tree.selection():
+            if self.history_search_filters is not None:
+                test_id = self.history_search_tests.get(int(item_id_in_tree))
+                if test_id is not None and test_id not in test_ids:
+                    test_ids.append(test_id)
+                continue
+            if not self.history_tree.parent(item_id_in_tree):
+                test_ids.append(int(self.history_tree.item(item_id_in_tree, "values")[0]))
+        return test_ids
+
     def delete_selected_history_test(self):
         selection = self.history_tree.selection()
         if not selection:
             messagebox.showwarning("Warning", "No item selected to delete.", parent=self.root)
             return
 
-        test_ids_to_delete = []
-        for item_id_in_tree in selection:
-            # Only allow deleting top-level tests, not individual cycles
-            if not self.history_tree.parent(item_id_in_tree):
-                test_id_str = self.history_tree.item(item_id_in_tree, "values")[0]
-                test_ids_to_delete.append(int(test_id_str))
-
+        # Only top-level tests can be deleted, not individual cycles
+        test_ids_to_delete = self._selected_history_test_ids()
         if not test_ids_to_delete:
             messagebox.showinfo("Info", "Please select a top-level test to delete. Individual cycles cannot be deleted.", parent=self.root)
             return
@@ -940,9 +2605,68 @@ class DepassivationApp:
                 if self.data_handler.delete_test(test_id):
                     deleted_count += 1
             self.log_message(f"INFO: Deleted {deleted_count} test record(s).")
+            self._history_changed()
             self.on_history_battery_selected() # Refresh the view
             self.clear_history_details()
 
+    def export_history_archive(self):
+        """Exports the selected tests, or every test listed for the selected battery, to one archive."""
+        test_ids = self._selected_history_test_ids()
+        if not test_ids and self.history_search_filters is None:
+            test_ids = [int(self.history_tree.item(item, "values")[0]) for item in self.history_tree.get_children()]
+        if not test_ids:
+            messagebox.showwarning("Warning", "Select the tests to archive, or a battery with tests.", parent=self.root)
+            return
+        name = self._selected_history_battery_name() or "tests"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=ARCHIVE_EXTENSION,
+            filetypes=[("Depassivation archives", f"*{ARCHIVE_EXTENSION}")],
+            title="Save Test Archive As...",
+            initialfile=f"{name}{ARCHIVE_EXTENSION}",
+            parent=self.root
+        )
+        if not filepath: return
+        self.export_archive_button.config(state=tk.DISABLED)
+        threading.Thread(target=self._run_archive_export, args=(test_ids, filepath), daemon=True).start()
+
+    def _run_archive_export(self, test_ids, filepath):
+        try:
+            tests, cycles, samples = export_tests(test_ids, filepath, DB_FILE)
+            message = f"INFO: Archived {tests} test(s), {cycles} cycle(s) and {samples} sample(s) to {filepath}"
+        except (sqlite3.Error, OSError) as e:
+            message = f"ERROR: Failed to write archive: {e}"
+        self.root.after(0, self._finish_archive_job, message)
+
+    def import_history_archive(self):
+        filepaths = filedialog.askopenfilenames(
+            filetypes=[("Depassivation archives", f"*{ARCHIVE_EXTENSION}")],
+            title="Import Test Archives",
+            parent=self.root
+        )
+        if not filepaths: return
+        self.import_archive_button.config(state=tk.DISABLED)
+        threading.Thread(target=self._run_archive_import, args=(filepaths,), daemon=True).start()
+
+    def _run_archive_import(self, filepaths):
+        messages = []
+        for filepath in filepaths:
+            try:
+                summary = import_archive(filepath, DB_FILE)
+                messages.append(f"INFO: Imported {filepath}: {summary['tests_created']} new test(s), {summary['tests_merged']} merged, "
+                                f"{summary['cycles_imported']} cycle(s), {summary['cycles_skipped']} duplicate(s) skipped.")
+            except (sqlite3.Error, OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                messages.append(f"ERROR: Failed to import {filepath}: {e}")
+        self.root.after(0, self._finish_archive_job, "\n".join(messages), True)
+
+    def _finish_archive_job(self, message, imported=False):
+        for line in message.split("\n"):
+            self.log_message(line)
+        self.export_archive_button.config(state=tk.NORMAL)
+        self.import_archive_button.config(state=tk.NORMAL)
+        if imported:
+            self._history_changed()
+            self.refresh_battery_dropdown()
+
     def export_history_graph(self):
         if self.selected_history_test_id is None:
             messagebox.showwarning("Warning", "Please select a cycle from the history list first.", parent=self.root)
@@ -971,8 +2695,8 @@ class DepassivationApp:
             return
 
         cycle_id = self.selected_history_test_id
-        cycle_data = self.data_handler.get_cycle_data(cycle_id)
-        if not cycle_data:
+        cycle_data = self.data_handler.get_cycle_series(cycle_id)
+        if not len(cycle_data[0]):
             messagebox.showwarning("Warning", "No data points found for the selected cycle.", parent=self.root)
             return
 
@@ -987,14 +2711,21 @@ class DepassivationApp:
         if not filepath: return
 
         try:
-            with open(filepath, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Timestamp_s', 'Voltage_V', 'Current_mA'])
-                writer.writerows(cycle_data)
+            self._write_cycle_csv(filepath, cycle_data)
             self.log_message(f"INFO: Saved history data to {filepath}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save data: {e}", parent=self.root)
 
+    def _write_cycle_csv(self, filepath, series, chunk=65536):
+        """Writes (times, voltages, currents) arrays to CSV a chunk at a time, so a file-backed cycle is never fully in memory."""
+        times, voltages, currents = series
+        with open(filepath, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Timestamp_s', 'Voltage_V', 'Current_mA'])
+            for start in range(0, len(times), chunk):
+                end = start + chunk
+                writer.writerows(zip(times[start:end].tolist(), voltages[start:end].tolist(), currents[start:end].tolist()))
+
     def export_live_graph(self):
         if self.last_completed_cycle_id is None:
             messagebox.showwarning("Warning", "Please complete a test before exporting.")
@@ -1011,17 +2742,14 @@ class DepassivationApp:
         if self.last_completed_cycle_id is None:
             messagebox.showwarning("Warning", "Please complete a test before exporting.")
             return
-        test_data = self.data_handler.get_cycle_data(self.last_completed_cycle_id)
-        if not test_data:
+        test_data = self.data_handler.get_cycle_series(self.last_completed_cycle_id)
+        if not len(test_data[0]):
             messagebox.showwarning("Warning", "No data points found for the last test.")
             return
         filepath = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")], title="Save Live Test Data As...", initialfile=f"test_data_{self.last_completed_cycle_id}.csv")
         if not filepath: return
         try:
-            with open(filepath, 'w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['Timestamp_s', 'Voltage_V', 'Current_mA'])
-                writer.writerows(test_data)
+            self._write_cycle_csv(filepath, test_data)
             self.log_message(f"INFO: Saved live test data to {filepath}")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save data: {e}")
@@ -0,0 +1,287 @@
+"""
+Compressed archives of tests for moving history between stations.
+
+An archive (.dpz) is a zip file laid out like an .npz: manifest.json holds the
+battery, test and cycle metadata (results, analytics, anomaly events, profile
+steps), and every cycle's samples are stored as packed column arrays:
+
+    manifest.json
+    cycles/0/timestamp_ms.npy   int64
+    cycles/0/voltage.npy        float64
+    cycles/0/current.npy        float64
+    ...
+
+Members are compressed with lzma (default) or zlib and written and read one
+cycle at a time, so memory use does not grow with the archive. Import merges
+into an existing database in bulk transactions of whole tests: batteries are
+matched by name, tests by battery and timestamp, and cycles already present
+(same test, type and timestamp) are skipped, so importing twice is harmless.
+
+    python history_archive.py export --battery "Bateria 1" -o bateria1.dpz
+    python history_archive.py export --test 12 15 -o tests.dpz --compression zlib
+    python history_archive.py import bateria1.dpz tests.dpz
+"""
+import argparse
+import json
+import os
+import sqlite3
+import zipfile
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+
+from data_handler import DB_FILE
+import fleet_report
+import sample_files
+
+FORMAT_NAME = "depassivation-archive"
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+ARCHIVE_EXTENSION = ".dpz"
+COMPRESSION = {
+    "lzma": zipfile.ZIP_LZMA,
+    "zlib": zipfile.ZIP_DEFLATED,
+}
+SAMPLE_COLUMNS = (("timestamp_ms", np.int64), ("voltage", np.float64), ("current", np.float64))
+# Import commits once at least this many samples are pending; a test is never split
+COMMIT_SAMPLES = 100000
+# Cycle columns that only make sense inside the source database
+LOCAL_CYCLE_COLUMNS = ("id", "test_id")
+
+
+def _connect(db_file):
+    conn = sqlite3.connect(db_file, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def _write_array(archive, name, array):
+    with archive.open(name, "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+def _read_array(archive, name):
+    with archive.open(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+
+def tests_for_battery(db_file, battery_id):
+    conn = sqlite3.connect(db_file)
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM tests WHERE battery_id = ? ORDER BY timestamp, id", (battery_id,))]
+    finally:
+        conn.close()
+
+
+def export_tests(test_ids, path, db_file=DB_FILE, compression="lzma", progress=None):
+    """
+    Writes the given tests, with all their cycles and samples, to an archive at `path`.
+    Returns (tests, cycles, samples) written.
+    """
+    conn = _connect(db_file)
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "batteries": [],
+        "tests": [],
+    }
+    battery_keys = {}
+    cycle_count = sample_count = 0
+    try:
+        with zipfile.ZipFile(path, "w", compression=COMPRESSION[compression]) as archive:
+            for done, test_id in enumerate(test_ids, 1):
+                test = conn.execute("SELECT * FROM tests WHERE id = ?", (test_id,)).fetchone()
+                if test is None:
+                    continue
+                battery_key = None
+                if test["battery_id"] is not None:
+                    if test["battery_id"] not in battery_keys:
+                        battery = conn.execute("SELECT name, created_at FROM batteries WHERE id = ?", (test["battery_id"],)).fetchone()
+                        battery_keys[test["battery_id"]] = len(manifest["batteries"])
+                        manifest["batteries"].append(dict(battery))
+                    battery_key = battery_keys[test["battery_id"]]
+                entry = {
+                    "battery": battery_key,
+                    "timestamp": test["timestamp"],
+                    "timestamp_epoch": test["timestamp_epoch"] if "timestamp_epoch" in test.keys() else None,
+                    "profile_name": test["profile_name"],
+                    "cycles": [],
+                }
+                for cycle in conn.execute("SELECT * FROM cycles WHERE test_id = ? ORDER BY timestamp, id", (test_id,)).fetchall():
+                    member = f"cycles/{cycle_count}"
+                    samples = sample_files.read_samples(conn, cycle["id"])
+                    for index, (name, dtype) in enumerate(SAMPLE_COLUMNS):
+                        _write_array(archive, f"{member}/{name}.npy", np.asarray(samples[index], dtype=dtype))
+                    events = conn.execute(
+                        "SELECT timestamp_ms, event_type, severity, value, detail FROM cycle_events WHERE cycle_id = ? ORDER BY timestamp_ms",
+                        (cycle["id"],)
+                    ).fetchall()
+                    steps = conn.execute(
+                        "SELECT timestamp_ms, step_index, label FROM cycle_steps WHERE cycle_id = ? ORDER BY timestamp_ms",
+                        (cycle["id"],)
+                    ).fetchall()
+                    entry["cycles"].append({
+                        "member": member,
+                        "samples": len(samples[0]),
+                        "columns": {key: cycle[key] for key in cycle.keys() if key not in LOCAL_CYCLE_COLUMNS},
+                        "events": [dict(row) for row in events],
+                        "steps": [dict(row) for row in steps],
+                    })
+                    cycle_count += 1
+                    sample_count += len(samples[0])
+                manifest["tests"].append(entry)
+                if progress:
+                    progress(done, len(test_ids))
+            # Written last so the metadata can be collected while the samples stream out
+            archive.writestr(MANIFEST, json.dumps(manifest, indent=1))
+    finally:
+        conn.close()
+    return len(manifest["tests"]), cycle_count, sample_count
+
+
+def read_manifest(path):
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST))
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} is not a depassivation archive.")
+    if manifest.get("version", 0) > FORMAT_VERSION:
+        raise ValueError(f"{path} was written by a newer version (format {manifest['version']}).")
+    return manifest
+
+
+def _battery_id(conn, battery, cache, summary):
+    """Maps an archived battery to a local one by name, creating it if needed."""
+    name = battery["name"]
+    if name not in cache:
+        row = conn.execute("SELECT id FROM batteries WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            row = (conn.execute("INSERT INTO batteries (name, created_at) VALUES (?, ?)", (name, battery["created_at"])).lastrowid,)
+            summary["batteries_created"] += 1
+        cache[name] = row[0]
+    return cache[name]
+
+
+def import_archive(path, db_file=DB_FILE, progress=None):
+    """
+    Merges an archive into the database, remapping every id. Returns a summary dict with the
+    numbers of batteries/tests created, tests merged into existing ones, cycles imported and
+    skipped as duplicates, and samples inserted.
+    """
+    manifest = read_manifest(path)
+    summary = {"batteries_created": 0, "tests_created": 0, "tests_merged": 0,
+               "cycles_imported": 0, "cycles_skipped": 0, "samples": 0}
+    conn = _connect(db_file)
+    try:
+        cycle_columns = {row[1] for row in conn.execute("PRAGMA table_info(cycles)")}
+        battery_cache = {}
+        pending = 0
+        with zipfile.ZipFile(path) as archive:
+            for done, test in enumerate(manifest["tests"], 1):
+                before = summary["samples"]
+                battery_id = None
+                if test["battery"] is not None:
+                    battery_id = _battery_id(conn, manifest["batteries"][test["battery"]], battery_cache, summary)
+                row = conn.execute("SELECT id FROM tests WHERE battery_id IS ? AND timestamp = ?",
+                                   (battery_id, test["timestamp"])).fetchone()
+                if row is not None:
+                    test_id = row[0]
+                    summary["tests_merged"] += 1
+                else:
+                    test_id = conn.execute(
+                        "INSERT INTO tests (battery_id, timestamp, timestamp_epoch, profile_name) VALUES (?, ?, ?, ?)",
+                        (battery_id, test["timestamp"], test["timestamp_epoch"], test["profile_name"])
+                    ).lastrowid
+                    summary["tests_created"] += 1
+
+                for cycle in test["cycles"]:
+                    columns = {k: v for k, v in cycle["columns"].items() if k in cycle_columns}
+                    exists = conn.execute("SELECT 1 FROM cycles WHERE test_id = ? AND cycle_type = ? AND timestamp = ?",
+                                          (test_id, columns["cycle_type"], columns["timestamp"])).fetchone()
+                    if exists:
+                        summary["cycles_skipped"] += 1
+                        continue
+                    names = ["test_id"] + list(columns)
+                    cycle_id = conn.execute(
+                        f"INSERT INTO cycles ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                        [test_id] + list(columns.values())
+                    ).lastrowid
+                    arrays = [_read_array(archive, f"{cycle['member']}/{name}.npy").tolist() for name, _ in SAMPLE_COLUMNS]
+                    conn.executemany("INSERT INTO readings (cycle_id, timestamp_ms, voltage, current) VALUES (?, ?, ?, ?)",
+                                     zip(repeat(cycle_id), *arrays))
+                    conn.executemany(
+                        "INSERT INTO cycle_events (cycle_id, timestamp_ms, event_type, severity, value, detail) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(cycle_id, e["timestamp_ms"], e["event_type"], e["severity"], e["value"], e["detail"]) for e in cycle["events"]]
+                    )
+                    conn.executemany(
+                        "INSERT INTO cycle_steps (cycle_id, timestamp_ms, step_index, label) VALUES (?, ?, ?, ?)",
+                        [(cycle_id, s["timestamp_ms"], s["step_index"], s["label"]) for s in cycle["steps"]]
+                    )
+                    fleet_report.mark_dirty(conn, [cycle_id])
+                    summary["cycles_imported"] += 1
+                    summary["samples"] += len(arrays[0])
+                pending += summary["samples"] - before
+                if pending >= COMMIT_SAMPLES:
+                    conn.commit()
+                    pending = 0
+                if progress:
+                    progress(done, len(manifest["tests"]))
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export tests to, or import them from, compressed archives.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write tests to an archive.")
+    selection = export.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--battery", help="Export every test of this battery.")
+    selection.add_argument("--test", type=int, nargs="+", help="Test ID(s) to export.")
+    export.add_argument("-o", "--output", required=True, help=f"Archive file to write ({ARCHIVE_EXTENSION}).")
+    export.add_argument("--compression", choices=list(COMPRESSION), default="lzma", help="Member compression.")
+    archive_import = commands.add_parser("import", help="Merge archives into the database.")
+    archive_import.add_argument("archives", nargs="+", help="Archive file(s) to import.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+
+    if args.command == "export":
+        test_ids = args.test
+        if args.battery:
+            conn = sqlite3.connect(args.db)
+            try:
+                row = conn.execute("SELECT id FROM batteries WHERE name = ?", (args.battery,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                print(f"ERROR: Battery '{args.battery}' not found.")
+                return
+            test_ids = tests_for_battery(args.db, row[0])
+        tests, cycles, samples = export_tests(test_ids, args.output, args.db, args.compression)
+        print(f"INFO: Wrote {tests} test(s), {cycles} cycle(s) and {samples} sample(s) to {args.output} "
+              f"({os.path.getsize(args.output) / 1024:.1f} KiB).")
+        return
+
+    for path in args.archives:
+        try:
+            summary = import_archive(path, args.db)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            print(f"ERROR: Could not import {path}: {e}")
+            continue
+        print(f"INFO: {path}: {summary['tests_created']} new test(s), {summary['tests_merged']} merged, "
+              f"{summary['cycles_imported']} cycle(s) imported ({summary['samples']} samples), "
+              f"{summary['cycles_skipped']} duplicate(s) skipped, {summary['batteries_created']} new batter(ies).")
+
+
+if __name__ == "__main__":
+    main()
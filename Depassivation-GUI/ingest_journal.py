@@ -0,0 +1,257 @@
+"""
+Crash-safe ingestion journal.
+
+Every parsed sample is appended to an append-only binary journal before it
+reaches SQLite, and a background thread applies the journal to the database:
+
+  - append() writes the record straight to the file (one os.write), so it is
+    in the OS page cache and survives a crash of the GUI process; the applier
+    fsyncs it in batches every APPLY_INTERVAL_S, which covers power loss, before
+    inserting the batch.
+  - A batch of readings and the journal position it reaches are committed in
+    one transaction (journal_checkpoint table), so applying is idempotent: after
+    a crash, replay() resumes exactly after the last committed record.
+  - When everything has been applied the journal is truncated and starts a new
+    generation; a checkpoint of another generation means nothing of the current
+    file has been applied yet.
+  - If the database is locked or failing, batches stay pending and are retried;
+    nothing is dropped. An optional on_apply(samples, seconds, ok) hook sees every
+    apply attempt, from the thread that made it.
+
+File layout: an 8-byte magic and a 8-byte generation id, then fixed-size records
+(cycle_id, timestamp_ms, voltage, current, crc32). A torn record at the end,
+left by a crash mid-write, fails its CRC and is discarded on replay.
+
+recover_unfinished_cycles() closes cycles a crash left without a result: their
+results and analytics are computed from the recovered readings and they are
+marked ABORTED. It is the application's job to call it once at startup, after
+replay and before any cycle starts; a journal opened later (the acquisition
+process opens one on every connect) only replays, or it would close the cycle
+that is running.
+"""
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+import sample_files
+
+JOURNAL_FILE = "ingest.journal"
+MAGIC = b"DPJRNL01"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<Iqdd")
+RECORD_SIZE = RECORD.size + 4   # + crc32
+APPLY_INTERVAL_S = 0.1
+TRUNCATE_BYTES = 1 << 20
+RECOVERED_END_REASON = "Recovered from the ingestion journal after an unclean shutdown"
+
+INSERT_READING_SQL = """INSERT INTO readings (cycle_id, timestamp_ms, voltage, current)
+                        SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM cycles WHERE id = ?)"""
+
+
+def _new_generation():
+    return time.time_ns() ^ int.from_bytes(os.urandom(4), "little")
+
+
+def _pack(cycle_id, timestamp_ms, voltage, current):
+    body = RECORD.pack(cycle_id, timestamp_ms, voltage, current)
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+def ensure_checkpoint_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS journal_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        )
+    """)
+
+
+def read_records(path, start):
+    """Returns (records, end) with the valid records from byte `start` on; `end` is where the valid data stops."""
+    records = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read()
+    end = start
+    for pos in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        body = data[pos:pos + RECORD.size]
+        (crc,) = struct.unpack_from("<I", data, pos + RECORD.size)
+        if zlib.crc32(body) != crc:
+            break
+        records.append(RECORD.unpack(body))
+        end = start + pos + RECORD_SIZE
+    return records, end
+
+
+def _apply(conn, records, generation, offset):
+    """Inserts records (or appends them to their cycle's sample file) and moves the checkpoint to `offset` in one transaction."""
+    with conn:
+        records = sample_files.store(conn, records)
+        conn.executemany(INSERT_READING_SQL, [(c, t, v, i, c) for c, t, v, i in records])
+        conn.execute("INSERT OR REPLACE INTO journal_checkpoint (id, generation, offset) VALUES (1, ?, ?)",
+                     (generation, offset))
+
+
+def recover_unfinished_cycles(conn):
+    """Closes cycles a crash left without a result; only valid while no cycle is running. Returns their ids."""
+    # cycle_analytics imports data_handler, which imports this module
+    from cycle_analytics import ANALYTICS_VERSION, METRIC_NAMES, compute_cycle_extremes, compute_cycle_metrics, cycle_result
+    cycles = conn.execute("SELECT id, pass_fail_voltage FROM cycles WHERE result IS NULL").fetchall()
+    assignments = ", ".join(f"{name} = ?" for name in METRIC_NAMES)
+    with conn:
+        for cycle_id, threshold in cycles:
+            timestamps, voltages, currents = sample_files.read_samples(conn, cycle_id)
+            times = timestamps / 1000.0
+            min_voltage, max_current, power, resistance = compute_cycle_extremes(voltages, currents)
+            result = cycle_result(min_voltage, threshold, aborted=True)
+            conn.execute("""UPDATE cycles SET min_voltage = ?, max_current = ?, power = ?, resistance = ?, result = ?,
+                                              end_reason = ?, completed_early = 0 WHERE id = ?""",
+                         (min_voltage, max_current, power, resistance, result, RECOVERED_END_REASON, cycle_id))
+            if len(times):
+                metrics = compute_cycle_metrics(times, voltages, currents, threshold)
+                conn.execute(f"UPDATE cycles SET {assignments}, analytics_version = ? WHERE id = ?",
+                             [metrics.get(name) for name in METRIC_NAMES] + [ANALYTICS_VERSION, cycle_id])
+    return [cycle_id for cycle_id, _ in cycles]
+
+
+class IngestJournal:
+    """
+    Journal for one database. open() replays what a previous run left behind,
+    then append() may be called from one thread while the applier runs.
+    """
+    def __init__(self, db_file, path=JOURNAL_FILE, log=print, on_apply=None):
+        self.db_file = db_file
+        self.path = path
+        self.log = log
+        self.on_apply = on_apply
+        self.fd = None
+        self.generation = None
+        self.written = 0          # file offset after the last appended record
+        self.applied = 0          # file offset after the last committed record
+        self.pending = []         # records appended but not yet committed
+        self.unapplied = {}       # cycle_id -> how many of its records are not committed yet
+        self.lock = threading.Lock()        # guards pending/written and the file
+        self.apply_lock = threading.Lock()  # one applier at a time
+        self.running = False
+        self.thread = None
+        self.conn = None
+        self.last_error = None
+
+    def open(self):
+        """Replays and truncates any existing journal, then starts the applier. Returns the replay summary."""
+        self.conn = sqlite3.connect(self.db_file, timeout=5, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        with self.conn:
+            ensure_checkpoint_table(self.conn)
+        summary = self.replay()
+        self._start_generation()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return summary
+
+    def replay(self):
+        """Applies whatever the checkpoint has not seen yet."""
+        summary = {"records": 0, "torn_bytes": 0}
+        if os.path.exists(self.path) and os.path.getsize(self.path) >= HEADER.size:
+            with open(self.path, "rb") as f:
+                magic, generation = HEADER.unpack(f.read(HEADER.size))
+            if magic == MAGIC:
+                row = self.conn.execute("SELECT generation, offset FROM journal_checkpoint WHERE id = 1").fetchone()
+                start = row[1] if row and row[0] == generation else HEADER.size
+                records, end = read_records(self.path, start)
+                if records:
+                    _apply(self.conn, records, generation, end)
+                summary["records"] = len(records)
+                summary["torn_bytes"] = os.path.getsize(self.path) - end
+            else:
+                self.log(f"WARN: {self.path} is not an ingestion journal; it will be replaced.")
+        return summary
+
+    def _start_generation(self):
+        """Truncates the file to a fresh header. Only called once everything written has been applied."""
+        self.generation = _new_generation()
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        os.ftruncate(self.fd, 0)
+        os.lseek(self.fd, 0, os.SEEK_SET)
+        os.write(self.fd, HEADER.pack(MAGIC, self.generation))
+        os.fsync(self.fd)
+        self.written = self.applied = HEADER.size
+
+    def append(self, cycle_id, timestamp_ms, voltage, current):
+        record = (cycle_id, timestamp_ms, voltage, current)
+        data = _pack(*record)
+        with self.lock:
+            os.write(self.fd, data)
+            self.written += RECORD_SIZE
+            self.pending.append(record)
+            self.unapplied[cycle_id] = self.unapplied.get(cycle_id, 0) + 1
+
+    def unapplied_cycles(self):
+        """Ids of the cycles that still have samples waiting to be committed."""
+        with self.lock:
+            return set(self.unapplied)
+
+    def flush(self):
+        """Applies everything appended so far before returning. Returns False if the database refused it."""
+        return self._apply_pending()
+
+    def _apply_pending(self):
+        with self.apply_lock:
+            with self.lock:
+                batch, end = self.pending, self.written
+                self.pending = []
+            if not batch:
+                return True
+            start = time.perf_counter()
+            try:
+                os.fsync(self.fd)
+                _apply(self.conn, batch, self.generation, end)
+            except (sqlite3.Error, OSError) as e:
+                with self.lock:
+                    self.pending = batch + self.pending
+                if self.on_apply:
+                    self.on_apply(len(batch), time.perf_counter() - start, False)
+                if str(e) != self.last_error:
+                    self.last_error = str(e)
+                    self.log(f"WARN: Journal apply deferred ({len(self.pending)} samples pending): {e}")
+                return False
+            if self.on_apply:
+                self.on_apply(len(batch), time.perf_counter() - start, True)
+            self.last_error = None
+            self.applied = end
+            with self.lock:
+                # Only now: a cycle stops counting as unapplied once its samples are readable
+                for cycle_id, *_ in batch:
+                    self.unapplied[cycle_id] -= 1
+                    if not self.unapplied[cycle_id]:
+                        del self.unapplied[cycle_id]
+                if self.applied == self.written and self.written >= TRUNCATE_BYTES:
+                    self._start_generation()
+            return True
+
+    def _run(self):
+        while self.running:
+            time.sleep(APPLY_INTERVAL_S)
+            self._apply_pending()
+
+    def close(self):
+        """Stops the applier after a final apply. Anything still pending stays in the journal for the next start."""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        applied = self._apply_pending()
+        if applied and self.applied == self.written:
+            with self.lock:
+                self._start_generation()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
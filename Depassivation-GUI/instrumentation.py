@@ -0,0 +1,151 @@
+import json
+import math
+import time
+
+
+class Histogram:
+    """
+    Log-bucketed histogram with O(1) recording.
+    Buckets grow by `growth` per step starting at `lowest`, which keeps the
+    relative error of percentile estimates below ~10% over many decades.
+    """
+    def __init__(self, unit="s", lowest=1e-6, growth=1.2, buckets=120):
+        self.unit = unit
+        self.lowest = lowest
+        self.log_growth = math.log(growth)
+        self.growth = growth
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (self.buckets + 1)  # bucket 0 collects values <= lowest
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        if value <= self.lowest:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.lowest) / self.log_growth) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Estimates the p-th percentile from the bucket upper bounds."""
+        if not self.count:
+            return None
+        target = self.count * p / 100.0
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                upper = self.lowest * self.growth ** index
+                return min(upper, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        return {
+            'unit': self.unit,
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+
+class Instrumentation:
+    """
+    Collects latency histograms for the acquisition path and the Tk event loop.
+    Call sites check `enabled` before taking timestamps, so the disabled cost is one attribute read.
+    """
+    HEARTBEAT_MS = 50
+
+    # Per-sample stages, all measured from the moment the line was read from the port
+    METRICS = {
+        'sample.read_to_dispatch': "s",   # serial thread -> Tk thread queue latency
+        'sample.parse': "s",
+        'sample.read_to_db_commit': "s",
+        'sample.read_to_render': "s",
+        'live.read_to_render': "s",
+        'db.write': "s",
+        'tk.loop_lag': "s",
+        'queue.depth': "lines",
+    }
+
+    def __init__(self, root):
+        self.root = root
+        self.enabled = False
+        self.histograms = {name: Histogram(unit) for name, unit in self.METRICS.items()}
+        self.enqueued = 0   # written only by the reader thread
+        self.dequeued = 0   # written only by the Tk thread
+        self.started_at = None
+        self._heartbeat_id = None
+        self._heartbeat_expected = None
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self.started_at = time.time()
+        self._schedule_heartbeat()
+
+    def disable(self):
+        self.enabled = False
+        if self._heartbeat_id is not None:
+            self.root.after_cancel(self._heartbeat_id)
+            self._heartbeat_id = None
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.started_at = time.time() if self.enabled else None
+
+    def record(self, name, value):
+        self.histograms[name].record(value)
+
+    def on_enqueue(self):
+        self.enqueued += 1
+
+    def on_dequeue(self, read_time):
+        """Called in the Tk thread when a line read at `read_time` is dispatched."""
+        self.dequeued += 1
+        self.histograms['sample.read_to_dispatch'].record(time.perf_counter() - read_time)
+        self.histograms['queue.depth'].record(max(self.enqueued - self.dequeued, 0))
+
+    def _schedule_heartbeat(self):
+        self._heartbeat_expected = time.perf_counter() + self.HEARTBEAT_MS / 1000.0
+        self._heartbeat_id = self.root.after(self.HEARTBEAT_MS, self._heartbeat)
+
+    def _heartbeat(self):
+        """Measures how late the Tk event loop runs a timer that should fire every HEARTBEAT_MS."""
+        if not self.enabled:
+            return
+        self.histograms['tk.loop_lag'].record(max(time.perf_counter() - self._heartbeat_expected, 0.0))
+        self._schedule_heartbeat()
+
+    def to_dict(self):
+        return {
+            'started_at': self.started_at,
+            'dumped_at': time.time(),
+            'enabled': self.enabled,
+            'queue_depth_now': max(self.enqueued - self.dequeued, 0),
+            'metrics': {name: h.summary() for name, h in self.histograms.items()},
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
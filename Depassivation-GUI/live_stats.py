@@ -0,0 +1,155 @@
+import math
+from collections import deque
+
+import numpy as np
+
+
+class RollingWindow:
+    """
+    Rolling mean/standard deviation and min/max over the last `size` samples.
+    Every update is O(1): running sums for mean/variance and monotonic deques for min/max.
+    """
+    def __init__(self, size):
+        self.size = max(1, int(size))
+        self.values = deque()
+        self.index = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min_deque = deque()  # (index, value), values increasing
+        self.max_deque = deque()  # (index, value), values decreasing
+
+    def push(self, value):
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if len(self.values) > self.size:
+            old = self.values.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append((self.index, value))
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append((self.index, value))
+        expired = self.index - self.size
+        if self.min_deque[0][0] <= expired:
+            self.min_deque.popleft()
+        if self.max_deque[0][0] <= expired:
+            self.max_deque.popleft()
+
+        self.index += 1
+        # Re-sum once per window to stop floating point drift on long sessions (amortized O(1))
+        if self.index % self.size == 0:
+            self.total = math.fsum(self.values)
+            self.total_sq = math.fsum(v * v for v in self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def mean(self):
+        return self.total / len(self.values) if self.values else None
+
+    @property
+    def std(self):
+        n = len(self.values)
+        if n < 2:
+            return None
+        variance = (self.total_sq - self.total * self.total / n) / (n - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    @property
+    def min(self):
+        return self.min_deque[0][1] if self.min_deque else None
+
+    @property
+    def max(self):
+        return self.max_deque[0][1] if self.max_deque else None
+
+
+class ExponentialSmoother:
+    """Exponentially weighted moving average."""
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.value = None
+
+    def push(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+
+class RingBuffer:
+    """Fixed-size buffer of (time, value) pairs backed by preallocated NumPy arrays."""
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.times = np.zeros(self.capacity)
+        self.values = np.zeros(self.capacity)
+        self.head = 0
+        self.count = 0
+
+    def push(self, t, value):
+        self.times[self.head] = t
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def view(self):
+        """Returns the buffered samples in chronological order."""
+        if self.count < self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+        order = np.r_[self.head:self.capacity, 0:self.head]
+        return self.times[order], self.values[order]
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+
+class LiveStatistics:
+    """Streaming statistics for the LIVE_DATA channels."""
+    CHANNELS = ("voltage", "current", "power", "resistance")
+
+    def __init__(self, windows=(10, 100), alpha=0.1, trend_capacity=3000):
+        self.windows = tuple(sorted({max(2, int(w)) for w in windows})) or (10,)
+        self.alpha = alpha
+        self.trend = RingBuffer(trend_capacity)
+        self.reset()
+
+    def reset(self, clear_trend=True):
+        self.rolling = {ch: {w: RollingWindow(w) for w in self.windows} for ch in self.CHANNELS}
+        self.smoothed = {ch: ExponentialSmoother(self.alpha) for ch in self.CHANNELS}
+        self.session_min = {ch: None for ch in self.CHANNELS}
+        self.session_max = {ch: None for ch in self.CHANNELS}
+        self.sample_count = 0
+        if clear_trend:
+            self.trend.clear()
+
+    def update(self, t, sample):
+        """Feeds one sample, a dict keyed by channel name. Constant cost per call."""
+        for ch in self.CHANNELS:
+            value = sample.get(ch)
+            if value is None:
+                continue
+            for window in self.rolling[ch].values():
+                window.push(value)
+            self.smoothed[ch].push(value)
+            if self.session_min[ch] is None or value < self.session_min[ch]:
+                self.session_min[ch] = value
+            if self.session_max[ch] is None or value > self.session_max[ch]:
+                self.session_max[ch] = value
+        self.trend.push(t, sample["voltage"])
+        self.sample_count += 1
+
+
+def parse_windows(text, default=(10, 100)):
+    """Parses a comma-separated list of window sizes, e.g. '10,100'."""
+    try:
+        windows = tuple(int(w) for w in str(text).split(",") if w.strip())
+        return windows if windows and all(w > 1 for w in windows) else default
+    except ValueError:
+        return default
@@ -1,8 +1,11 @@
 import tkinter as tk
 import argparse
-from gui import DepassivationApp
+from profiler import PROFILER_MODES
 
 if __name__ == "__main__":
+    # Imported here so the acquisition process, which re-imports this module when spawned, does not load the GUI
+    from gui import DepassivationApp
+
     # Set up an argument parser to detect if we want to run in simulation mode
     parser = argparse.ArgumentParser(
         description="Run the Depassivation Station GUI."
@@ -12,11 +15,68 @@ if __name__ == "__main__":
         action="store_true",
         help="Run the application in simulation mode without connecting to hardware."
     )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="Enable latency and event-loop instrumentation from startup."
+    )
+    parser.add_argument(
+        "--sim-speed",
+        type=float,
+        default=1.0,
+        help="Speed-up factor for simulated cycles, e.g. 10 to load-test the scheduler."
+    )
+    parser.add_argument(
+        "--sim-loss",
+        type=float,
+        default=0.0,
+        help="Share of simulated sample lines dropped or corrupted, e.g. 0.01 to check the link statistics."
+    )
+    parser.add_argument(
+        "--sim-unplug",
+        type=float,
+        help="Unplug the simulated device once a cycle has run this many seconds, to check how a lost link ends the cycle and pauses the scheduler."
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILER_MODES,
+        help="Profile the GUI thread from startup (sampling: low overhead; cprofile: exact call counts)."
+    )
+    parser.add_argument(
+        "--profile-seconds",
+        type=float,
+        default=60,
+        help="Length of the --profile window; 0 profiles until the application exits."
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Trace allocations and report memory growth after every cycle (tracemalloc)."
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics at http://127.0.0.1:<port>/metrics (overrides metrics_port in config.json)."
+    )
+    parser.add_argument(
+        "--api-port",
+        type=int,
+        help="Serve the read API (history queries and the live WebSocket) on http://127.0.0.1:<port> (overrides api_port in config.json)."
+    )
+    parser.add_argument(
+        "--acquisition-process",
+        action="store_true",
+        help="Read the serial port and store samples in a separate process, so a busy GUI never delays acquisition."
+    )
     args = parser.parse_args()
 
     # Start the main Tkinter application
     root = tk.Tk()
     # Pass the 'simulate' flag to the application's constructor
-    app = DepassivationApp(root, simulate=args.simulate)
+    app = DepassivationApp(root, simulate=args.simulate, instrument=args.diagnostics,
+                           sim_speed=args.sim_speed, sim_loss=args.sim_loss, sim_unplug=args.sim_unplug,
+                           profile=args.profile, profile_seconds=args.profile_seconds, trace_memory=args.trace_memory,
+                           metrics_port=args.metrics_port, api_port=args.api_port,
+                           acquisition_process=args.acquisition_process)
     root.mainloop()
     
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+Streaming plateau detector for adaptive termination of depassivation cycles.
+
+The detector keeps a time window of the most recent DATA samples and fits a
+least-squares line through it with running sums, so each update is O(1)
+amortized. The cycle may stop early once, for a full window:
+  - every voltage is at or above the pass/fail threshold, and
+  - the fitted slope is within +/- max_slope_mv_s (the cell is flat).
+
+Recorded cycles or exported CSV captures can be replayed to tune the settings:
+
+    python plateau_detector.py --db depassivation_history.db --cycle 42 --window 20 --slope 1.0
+    python plateau_detector.py --csv cycle_42.csv --threshold 3.0
+"""
+import argparse
+import csv
+import os
+import sqlite3
+from collections import deque
+
+from data_handler import DB_FILE
+import sample_files
+
+DEFAULT_WINDOW_S = 20.0
+DEFAULT_MAX_SLOPE_MV_S = 1.0
+# A window needs at least this many samples before its slope is trusted
+MIN_WINDOW_SAMPLES = 5
+
+
+class PlateauDetector:
+    """Detects a flat voltage above `threshold` lasting `window_s` seconds."""
+    def __init__(self, threshold, window_s=DEFAULT_WINDOW_S, max_slope_mv_s=DEFAULT_MAX_SLOPE_MV_S):
+        self.threshold = threshold
+        self.window_s = window_s
+        self.max_slope = max_slope_mv_s / 1000.0
+        self.samples = deque()     # (t, v), t relative to the first sample
+        self.min_deque = deque()   # (t, v), voltages increasing
+        self.t0 = None
+        self.n = 0
+        self.sum_t = self.sum_v = self.sum_tt = self.sum_tv = 0.0
+        self.slope = None
+        self.triggered_at = None
+        self.reason = None
+
+    def _add(self, t, v):
+        self.samples.append((t, v))
+        self.n += 1
+        self.sum_t += t
+        self.sum_v += v
+        self.sum_tt += t * t
+        self.sum_tv += t * v
+
+    def _evict(self):
+        t, v = self.samples.popleft()
+        self.n -= 1
+        self.sum_t -= t
+        self.sum_v -= v
+        self.sum_tt -= t * t
+        self.sum_tv -= t * v
+
+    def update(self, t, v):
+        """
+        Feeds one sample (seconds, volts). Returns a human-readable reason the
+        first time the plateau condition holds, None otherwise.
+        """
+        if self.triggered_at is not None:
+            return None
+        if self.t0 is None:
+            self.t0 = t
+        t -= self.t0
+
+        self._add(t, v)
+        while self.min_deque and self.min_deque[-1][1] >= v:
+            self.min_deque.pop()
+        self.min_deque.append((t, v))
+        # Keep exactly one sample at or before the window start so the window spans window_s
+        while len(self.samples) > 1 and self.samples[1][0] <= t - self.window_s:
+            self._evict()
+        while self.min_deque[0][0] < self.samples[0][0]:
+            self.min_deque.popleft()
+
+        if self.n < 2:
+            return None
+        denominator = self.n * self.sum_tt - self.sum_t * self.sum_t
+        if denominator <= 0:
+            return None
+        self.slope = (self.n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+        span = t - self.samples[0][0]
+        if (span >= self.window_s and self.n >= MIN_WINDOW_SAMPLES
+                and self.min_deque[0][1] >= self.threshold
+                and abs(self.slope) <= self.max_slope):
+            self.triggered_at = t + self.t0
+            self.reason = (f"Voltage stable above {self.threshold:.3f} V for {span:.0f} s "
+                           f"(slope {self.slope * 1000:+.2f} mV/s, mean {self.sum_v / self.n:.3f} V)")
+            return self.reason
+        return None
+
+
+def replay(samples, threshold, window_s=DEFAULT_WINDOW_S, max_slope_mv_s=DEFAULT_MAX_SLOPE_MV_S):
+    """
+    Runs the detector over recorded (time_s, voltage) samples.
+    Returns (stop_time_s, reason), or (None, None) if the cycle would have run to completion.
+    """
+    detector = PlateauDetector(threshold, window_s, max_slope_mv_s)
+    for t, v in samples:
+        reason = detector.update(t, v)
+        if reason:
+            return t, reason
+    return None, None
+
+
+def _load_cycle(db_file, cycle_id):
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT pass_fail_voltage, duration FROM cycles WHERE id = ?", (cycle_id,)).fetchone()
+        timestamps, voltages, _ = sample_files.read_samples(conn, cycle_id)
+        samples = list(zip((timestamps / 1000.0).tolist(), voltages.tolist()))
+    finally:
+        conn.close()
+    threshold = row[0] if row else None
+    return samples, threshold
+
+
+def _load_csv(path):
+    """Reads a capture in the GUI's export format (Timestamp_s, Voltage_V, Current_mA)."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [(float(row[0]), float(row[1])) for row in reader if len(row) >= 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded cycles through the adaptive-termination detector.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--cycle", type=int, help="Cycle ID to replay from the database.")
+    source.add_argument("--csv", help="Exported cycle CSV to replay.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--threshold", type=float, help="Pass/fail voltage (default: the cycle's own).")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW_S, help="Plateau window in seconds.")
+    parser.add_argument("--slope", type=float, default=DEFAULT_MAX_SLOPE_MV_S, help="Maximum |slope| in mV/s.")
+    args = parser.parse_args()
+
+    if args.csv:
+        samples, threshold = _load_csv(args.csv), None
+    else:
+        if not os.path.exists(args.db):
+            print(f"ERROR: Database file '{args.db}' not found.")
+            return
+        samples, threshold = _load_cycle(args.db, args.cycle)
+    threshold = args.threshold if args.threshold is not None else threshold
+    if threshold is None:
+        print("ERROR: No pass/fail voltage known for this capture; use --threshold.")
+        return
+    if not samples:
+        print("ERROR: The capture has no samples.")
+        return
+
+    stop_t, reason = replay(samples, threshold, args.window, args.slope)
+    total = samples[-1][0] - samples[0][0]
+    if stop_t is None:
+        print(f"INFO: No plateau detected; the cycle runs its full {total:.1f} s.")
+    else:
+        elapsed = stop_t - samples[0][0]
+        print(f"INFO: Would stop at {elapsed:.1f} s of {total:.1f} s ({total - elapsed:.1f} s saved): {reason}")
+
+
+if __name__ == "__main__":
+    main()
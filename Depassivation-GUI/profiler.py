@@ -0,0 +1,261 @@
+"""
+Opt-in profiling for live sessions.
+
+Two CPU profilers can be run for a time window on the Tk thread, where serial
+dispatch, plotting and DB writes all happen:
+  cprofile  - deterministic (cProfile); exact call counts, noticeable overhead.
+              Writes <name>.prof (pstats/snakeviz) and a <name>.txt summary.
+  sampling  - a background thread records the Tk thread's stack every few ms;
+              overhead stays around 1%. Writes a <name>.txt summary and
+              <name>.collapsed stacks for flame graph tools.
+Memory tracing (tracemalloc) takes a snapshot at the end of every cycle and
+writes what grew since the previous one.
+
+Functions decorated with @tag("<subsystem>") are attributed to that subsystem in
+the reports; the decorator only registers the function, so it costs nothing at
+run time. Code inside a package listed in PACKAGE_TAGS counts the same way.
+"""
+import cProfile
+import functools
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+PROFILE_DIR = "profiles"
+TOP_N = 15
+SAMPLE_INTERVAL_S = 0.005
+MEMORY_FRAMES = 10
+PROFILER_MODES = ("sampling", "cprofile")
+
+# Third-party packages whose frames count towards a subsystem
+PACKAGE_TAGS = {
+    "matplotlib": "plot",
+}
+
+_TAGS = {}  # (filename, first line, name) -> subsystem
+
+
+def tag(subsystem):
+    """Attributes time spent in the decorated function, and below it, to `subsystem`."""
+    def register(func):
+        code = func.__code__
+        _TAGS[(code.co_filename, code.co_firstlineno, code.co_name)] = subsystem
+        subsystem_of.cache_clear()
+        return func
+    return register
+
+
+@functools.lru_cache(maxsize=None)
+def subsystem_of(filename, firstlineno, name):
+    subsystem = _TAGS.get((filename, firstlineno, name))
+    if subsystem is None:
+        parts = filename.replace("\\", "/").split("/")
+        subsystem = next((PACKAGE_TAGS[p] for p in parts if p in PACKAGE_TAGS), None)
+    return subsystem
+
+
+def _describe(key):
+    filename, lineno, name = key
+    return f"{os.path.basename(filename)}:{lineno}({name})"
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack at a fixed interval from a background thread."""
+    def __init__(self, thread_id, interval_s=SAMPLE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.samples = 0
+        self.self_counts = Counter()
+        self.total_counts = Counter()
+        self.subsystems = Counter()
+        self.stacks = Counter()
+        self._running = False
+        self._thread = None
+
+    def enable(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+
+    def _run(self):
+        while self._running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+            time.sleep(self.interval_s)
+
+    def _record(self, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        self.samples += 1
+        self.self_counts[stack[0]] += 1
+        self.total_counts.update(set(stack))
+        # The innermost tagged frame owns the sample
+        self.subsystems[next((s for s in (subsystem_of(*key) for key in stack) if s), "other")] += 1
+        self.stacks[";".join(_describe(key) for key in reversed(stack))] += 1
+
+    def report(self, top_n):
+        lines = [f"Samples: {self.samples} (every {self.interval_s * 1000:g} ms)", "", "By subsystem (innermost tagged frame):"]
+        for subsystem, count in self.subsystems.most_common():
+            lines.append(f"  {subsystem:<12} {100.0 * count / self.samples:6.1f}%")
+        for title, counts in (("Top functions by own time:", self.self_counts),
+                              ("Top functions including callees:", self.total_counts)):
+            lines += ["", title]
+            for key, count in counts.most_common(top_n):
+                lines.append(f"  {100.0 * count / self.samples:6.1f}%  {_describe(key)}")
+        return "\n".join(lines)
+
+    def save(self, base_path, top_n):
+        with open(base_path + ".collapsed", "w") as f:
+            for stack, count in self.stacks.items():
+                f.write(f"{stack} {count}\n")
+        return self.report(top_n)
+
+
+def _cprofile_report(profile, top_n):
+    stats = pstats.Stats(profile)
+    lines = ["By subsystem (inclusive; a subsystem includes what it calls):"]
+    totals = Counter()
+    for key, (_, _, _, cumulative, callers) in stats.stats.items():
+        subsystem = subsystem_of(*key)
+        if subsystem is None:
+            continue
+        if not callers:
+            # Called from a frame entered before profiling started
+            totals[subsystem] += cumulative
+            continue
+        # Only count entries into the subsystem, so nested calls are not counted twice
+        totals[subsystem] += sum(entry[3] for caller, entry in callers.items() if subsystem_of(*caller) != subsystem)
+    for subsystem, seconds in totals.most_common():
+        lines.append(f"  {subsystem:<12} {seconds:8.3f} s")
+    for sort_key, title in (("tottime", "Top functions by own time:"), ("cumulative", "Top functions including callees:")):
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats(sort_key).print_stats(top_n)
+        lines += ["", title, stream.getvalue().strip()]
+    return "\n".join(lines)
+
+
+class SessionProfiler:
+    """
+    Runs one CPU profiler at a time for a window of seconds, and optional per-cycle
+    memory diffs. Reports go to timestamped files under output_dir; the top-N
+    summary is printed to the console and the file names are logged.
+    """
+    def __init__(self, root, log, output_dir=PROFILE_DIR, top_n=TOP_N):
+        self.root = root
+        self.log = log
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.mode = None
+        self.started_at = None
+        self._profiler = None
+        self._stop_id = None
+        self._snapshot = None
+        self._snapshot_label = None
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    @property
+    def memory_tracing(self):
+        return tracemalloc.is_tracing()
+
+    def _path(self, prefix):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+
+    def start(self, mode, seconds=None):
+        """Starts profiling the Tk thread; stops by itself after `seconds` (None or 0 runs until stop())."""
+        if self.active:
+            return
+        if mode not in PROFILER_MODES:
+            raise ValueError(f"Unknown profiler mode: {mode}")
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = SamplingProfiler(threading.get_ident())
+        self.mode = mode
+        self.started_at = time.perf_counter()
+        self._profiler.enable()
+        if seconds:
+            self._stop_id = self.root.after(int(seconds * 1000), self.stop)
+        self.log(f"INFO: {mode} profiler started" + (f" for {seconds:g} s." if seconds else "."))
+
+    def stop(self):
+        """Stops the running profiler and writes its report. Returns the summary file path."""
+        if not self.active:
+            return None
+        if self._stop_id is not None:
+            self.root.after_cancel(self._stop_id)
+            self._stop_id = None
+        self._profiler.disable()
+        elapsed = time.perf_counter() - self.started_at
+        base_path = self._path(self.mode)
+        if self.mode == "cprofile":
+            self._profiler.dump_stats(base_path + ".prof")
+            summary = _cprofile_report(self._profiler, self.top_n)
+        else:
+            summary = self._profiler.save(base_path, self.top_n)
+        header = f"{self.mode} profile of the Tk thread, {elapsed:.1f} s window, {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        with open(base_path + ".txt", "w") as f:
+            f.write(header + "\n\n" + summary + "\n")
+        print(header)
+        print(summary)
+        self.log(f"INFO: Profile written to {base_path}.txt")
+        self.mode = None
+        self._profiler = None
+        return base_path + ".txt"
+
+    def start_memory(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_FRAMES)
+        self._snapshot = self._take_snapshot()
+        self._snapshot_label = "start"
+        self.log("INFO: Memory tracing started; growth is reported after each cycle.")
+
+    def stop_memory(self):
+        tracemalloc.stop()
+        self._snapshot = None
+        self.log("INFO: Memory tracing stopped.")
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+
+    def memory_checkpoint(self, label):
+        """Writes the allocations that grew since the previous checkpoint. No-op unless tracing."""
+        if not tracemalloc.is_tracing() or self._snapshot is None:
+            return None
+        snapshot = self._take_snapshot()
+        diff = [stat for stat in snapshot.compare_to(self._snapshot, "lineno") if stat.size_diff > 0]
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Memory growth from '{self._snapshot_label}' to '{label}'",
+                 f"Traced now {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB, "
+                 f"grown {sum(stat.size_diff for stat in diff) / 1e6:.2f} MB", ""]
+        lines += [str(stat) for stat in diff[:self.top_n]]
+        path = self._path("memory") + ".txt"
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print("\n".join(lines[:2] + lines[3:8]))
+        self.log(f"INFO: {lines[1]}; details in {path}")
+        self._snapshot = snapshot
+        self._snapshot_label = label
+        return path
@@ -0,0 +1,113 @@
+"""
+Multi-step and pulsed load profiles executed by the firmware.
+
+A profile in profiles.json may carry a "steps" list next to its duration/voltage:
+
+    "Pulsed 50%": {
+        "voltage": 3.2,
+        "steps": [
+            {"type": "pulse", "on_ms": 500, "off_ms": 500, "count": 60, "label": "Pulse 1 Hz"},
+            {"type": "on", "duration_ms": 60000, "label": "Continuous"},
+            {"type": "off", "duration_ms": 5000, "label": "Rest"}
+        ]
+    }
+
+Every step is reduced to (on_ms, off_ms, count): the load is connected for on_ms,
+then disconnected for off_ms, count times; "on" and "off" steps are one period.
+The device stores the profile once and times every edge itself:
+
+    PROFILE_BEGIN,<steps>,<id>                 -> starts a download
+    PROFILE_STEP,<index>,<on_ms>,<off_ms>,<count>
+    PROFILE_END                                -> PROFILE_OK,<id>,<total_ms> or PROFILE_ERROR,<reason>
+    PROFILE_QUERY                              -> PROFILE_LOADED,<id|NONE>
+    START_PROFILE                              -> runs it, reporting STEP,<time_ms>,<index> as each step begins
+"""
+import zlib
+
+# Must match MAX_PROFILE_STEPS in the firmware
+MAX_STEPS = 32
+STEP_TYPES = ("on", "off", "pulse")
+
+
+class ProfileStep:
+    """One step of a load profile, in the form the firmware executes."""
+    def __init__(self, on_ms, off_ms, count=1, label=None):
+        self.on_ms = int(on_ms)
+        self.off_ms = int(off_ms)
+        self.count = int(count)
+        self.label = label or self.describe()
+
+    @property
+    def period_ms(self):
+        return self.on_ms + self.off_ms
+
+    @property
+    def duration_ms(self):
+        return self.period_ms * self.count
+
+    def describe(self):
+        if self.off_ms == 0:
+            return f"Load on {self.duration_ms / 1000:g} s"
+        if self.on_ms == 0:
+            return f"Load off {self.duration_ms / 1000:g} s"
+        return f"Pulse {self.on_ms}/{self.off_ms} ms x{self.count}"
+
+
+def parse_steps(profile):
+    """
+    Returns the ProfileSteps of a profile dict, or an empty list for a plain
+    continuous profile. Raises ValueError when a step is malformed.
+    """
+    raw_steps = profile.get("steps") or []
+    if len(raw_steps) > MAX_STEPS:
+        raise ValueError(f"A profile can have at most {MAX_STEPS} steps ({len(raw_steps)} given).")
+    steps = []
+    for number, raw in enumerate(raw_steps, 1):
+        kind = raw.get("type")
+        try:
+            if kind == "pulse":
+                step = ProfileStep(raw["on_ms"], raw["off_ms"], raw.get("count", 1), raw.get("label"))
+            elif kind == "on":
+                step = ProfileStep(raw["duration_ms"], 0, 1, raw.get("label"))
+            elif kind == "off":
+                step = ProfileStep(0, raw["duration_ms"], 1, raw.get("label"))
+            else:
+                raise ValueError(f"Step {number}: type must be one of {', '.join(STEP_TYPES)}.")
+        except KeyError as e:
+            raise ValueError(f"Step {number} ({kind}) is missing {e.args[0]}.")
+        except TypeError:
+            raise ValueError(f"Step {number} ({kind}) has a non-numeric timing.")
+        if step.on_ms < 0 or step.off_ms < 0 or step.period_ms == 0 or step.count < 1:
+            raise ValueError(f"Step {number} ({kind}) needs positive timings and a count of at least 1.")
+        steps.append(step)
+    return steps
+
+
+def total_duration_ms(steps):
+    return sum(step.duration_ms for step in steps)
+
+
+def profile_id(steps):
+    """Short checksum of the executed timings; the device reports it to say which profile it holds."""
+    canonical = ";".join(f"{s.on_ms},{s.off_ms},{s.count}" for s in steps)
+    return f"{zlib.crc32(canonical.encode('ascii')):08X}"
+
+
+def encode_profile(steps):
+    """Returns the command lines that download `steps` to the device."""
+    lines = [f"PROFILE_BEGIN,{len(steps)},{profile_id(steps)}\n"]
+    lines += [f"PROFILE_STEP,{index},{s.on_ms},{s.off_ms},{s.count}\n" for index, s in enumerate(steps)]
+    lines.append("PROFILE_END\n")
+    return lines
+
+
+def load_state(steps, elapsed_ms):
+    """
+    Returns (step_index, load_on) at `elapsed_ms` into the profile, or (None, False)
+    once it has finished. Uses the same arithmetic as the firmware.
+    """
+    for index, step in enumerate(steps):
+        if elapsed_ms < step.duration_ms:
+            return index, (elapsed_ms % step.period_ms) < step.on_ms
+        elapsed_ms -= step.duration_ms
+    return None, False
@@ -0,0 +1,372 @@
+"""
+Local read API for live and historical data.
+
+Analysis scripts read through this service instead of opening the database
+themselves, so they never compete with the acquisition for SQLite locks. All
+queries go through one DataHandler behind one lock (the single DB access point),
+and responses are cached already encoded. The cache has a lock of its own, held
+only to look up and insert, so hits are not held up by a slow query:
+  - cycle samples of finished cycles, keyed by (cycle_id, retention_level), in
+    an LRU bounded by the number of cached samples; a cycle whose samples are
+    still in the ingestion journal (its final commit was deferred) is served
+    but not cached until they are in the database
+  - batteries, tests, cycle summaries and searches, for SUMMARY_TTL_S; the GUI
+    drops them at once when it changes the history (invalidate())
+
+Endpoints (JSON unless noted):
+  GET /api/batteries
+  GET /api/batteries/<id>/tests          tests of a battery with their cycles
+  GET /api/tests/<id>                    one test with its cycles
+  GET /api/cycles/<id>                   cycle summary and analytics
+  GET /api/cycles/<id>/data              {"t": [s], "v": [V], "i": [mA]}
+  GET /api/search?cycle_type=Check&result=FAIL&date_from=2024-01-01&after=<epoch>,<id>&limit=200
+  GET /api/stats                         cache statistics
+  GET /live                              WebSocket; JSON text frames for every sample,
+                                         cycle start/end and live-view reading (in-process only)
+
+In-process: "api_port" in config.json or `python main.py --api-port 8765`.
+Standalone (history only):
+
+    python read_api.py --port 8765 [--db depassivation_history.db]
+"""
+import argparse
+import base64
+import hashlib
+import json
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import data_handler
+from data_handler import DataHandler, SEARCHABLE_METRICS
+
+SUMMARY_TTL_S = 5.0
+SUMMARY_CACHE_ENTRIES = 1000
+CYCLE_CACHE_SAMPLES = 5000000
+SUBSCRIBER_QUEUE = 10000
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_PING_S = 15.0
+SEARCH_FILTERS = ("date_from", "date_to", "battery_id", "profile_name", "cycle_type", "result")
+
+
+class NotFound(Exception):
+    pass
+
+
+def _encode(payload):
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _rows(rows):
+    return [dict(row) for row in rows]
+
+
+class HistoryCache:
+    """
+    Serializes database reads through one DataHandler (db_lock) and caches the encoded
+    results (lock). samples_pending(cycle_id) tells whether samples of a cycle may still
+    be on their way into the database; it is called from the request threads.
+    """
+    def __init__(self, log=print, samples_pending=None):
+        self.log = log
+        self.samples_pending = samples_pending or (lambda cycle_id: False)
+        self.data_handler = DataHandler(self)
+        self.lock = threading.Lock()       # guards the caches and stats
+        self.db_lock = threading.Lock()    # one query at a time; never taken while holding lock
+        self.generation = 0                # bumped by invalidate(), so a build that started before is not cached
+        self.summaries = {}            # key -> (expires, bytes)
+        self.cycles = OrderedDict()    # (cycle_id, retention_level) -> (samples, bytes)
+        self.cycle_samples = 0
+        self.stats = {"hits": 0, "misses": 0, "queries": 0}
+
+    def log_message(self, message):
+        self.log(message)
+
+    def invalidate(self):
+        """Drops cached summaries; cycle samples stay valid, their key changes when retention rewrites them."""
+        with self.lock:
+            self.summaries.clear()
+            self.generation += 1
+
+    def _query(self, func, *args):
+        with self.db_lock:
+            self.stats["queries"] += 1
+            return func(*args)
+
+    def summary(self, key, build):
+        """Returns the cached bytes for `key`, or builds, encodes and caches them for SUMMARY_TTL_S."""
+        with self.lock:
+            cached = self.summaries.get(key)
+            if cached and cached[0] > time.monotonic():
+                self.stats["hits"] += 1
+                return cached[1]
+            self.stats["misses"] += 1
+            generation = self.generation
+        body = _encode(build())
+        with self.lock:
+            if generation == self.generation:
+                now = time.monotonic()
+                if len(self.summaries) >= SUMMARY_CACHE_ENTRIES:
+                    self.summaries = {k: v for k, v in self.summaries.items() if v[0] > now}
+                self.summaries[key] = (now + SUMMARY_TTL_S, body)
+        return body
+
+    def batteries(self):
+        return self.summary(("batteries",), lambda: _rows(self._query(self.data_handler.get_all_batteries)))
+
+    def _test_with_cycles(self, test):
+        test = dict(test)
+        test["cycles"] = _rows(self._query(self.data_handler.get_cycles_for_test, test["id"]))
+        return test
+
+    def battery_tests(self, battery_id):
+        def build():
+            return [self._test_with_cycles(t) for t in self._query(self.data_handler.get_tests_for_battery, battery_id)]
+        return self.summary(("battery_tests", battery_id), build)
+
+    def test(self, test_id):
+        def build():
+            test = self._query(self.data_handler.get_test_summary, test_id)
+            if test is None:
+                raise NotFound(f"Test {test_id} not found.")
+            return self._test_with_cycles(test)
+        return self.summary(("test", test_id), build)
+
+    def _cycle_row(self, cycle_id):
+        cycle = self._query(self.data_handler.get_cycle_summary, cycle_id)
+        if cycle is None:
+            raise NotFound(f"Cycle {cycle_id} not found.")
+        return dict(cycle)
+
+    def cycle(self, cycle_id):
+        return self.summary(("cycle", cycle_id), lambda: self._cycle_row(cycle_id))
+
+    def search(self, filters, after, limit):
+        key = ("search", json.dumps(filters, sort_keys=True), after, limit)
+        return self.summary(key, lambda: _rows(self._query(self.data_handler.search_cycles, filters, after, limit)))
+
+    def cycle_data(self, cycle_id):
+        cycle = self._cycle_row(cycle_id)
+        key = (cycle_id, cycle.get("retention_level", 0))
+        with self.lock:
+            cached = self.cycles.get(key)
+            if cached:
+                self.cycles.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached[1]
+            self.stats["misses"] += 1
+        # A cycle without a result is still being recorded, so its samples are not final. Checked
+        # before reading: samples stop counting as pending only once they are committed
+        final = cycle.get("result") is not None and not self.samples_pending(cycle_id)
+        data = self._query(self.data_handler.get_cycle_data, cycle_id)
+        body = _encode({"t": [row[0] for row in data], "v": [row[1] for row in data], "i": [row[2] for row in data]})
+        if final:
+            with self.lock:
+                # Another request may have loaded the same cycle meanwhile
+                if key not in self.cycles:
+                    self.cycles[key] = (len(data), body)
+                    self.cycle_samples += len(data)
+                    while self.cycle_samples > CYCLE_CACHE_SAMPLES and len(self.cycles) > 1:
+                        _, (samples, _) = self.cycles.popitem(last=False)
+                        self.cycle_samples -= samples
+        return body
+
+    def cache_stats(self):
+        with self.lock:
+            return dict(self.stats, summaries=len(self.summaries), cycles=len(self.cycles), cycle_samples=self.cycle_samples)
+
+
+class LiveFeed:
+    """Fans events out to WebSocket subscribers. publish() never blocks; slow subscribers lose events."""
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self):
+        subscriber = queue.Queue(SUBSCRIBER_QUEUE)
+        self.subscribers = self.subscribers + [subscriber]
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers = [s for s in self.subscribers if s is not subscriber]
+
+    def publish(self, event):
+        if not self.subscribers:
+            return
+        message = _encode(event)
+        for subscriber in self.subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                pass
+
+
+def _ws_frame(payload, opcode=0x1):
+    """One unmasked, unfragmented server frame (RFC 6455)."""
+    length = len(payload)
+    if length < 126:
+        header = bytes((0x80 | opcode, length))
+    elif length < 65536:
+        header = bytes((0x80 | opcode, 126)) + length.to_bytes(2, "big")
+    else:
+        header = bytes((0x80 | opcode, 127)) + length.to_bytes(8, "big")
+    return header + payload
+
+
+class _ApiRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # WebSocket upgrades require it
+    cache = None
+    feed = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, _encode({"error": message}))
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            if parts == ["live"]:
+                self._serve_live()
+                return
+            if parts[:1] != ["api"] or len(parts) < 2:
+                raise NotFound("Unknown endpoint.")
+            self._send(200, self._route(parts[1:], parse_qs(url.query)))
+        except NotFound as e:
+            self._error(404, str(e))
+        except ValueError as e:
+            self._error(400, str(e))
+        except sqlite3.Error as e:
+            self._error(503, f"Database error: {e}")
+
+    def _route(self, parts, query):
+        cache = self.cache
+        if parts == ["batteries"]:
+            return cache.batteries()
+        if len(parts) == 3 and parts[0] == "batteries" and parts[2] == "tests":
+            return cache.battery_tests(int(parts[1]))
+        if len(parts) == 2 and parts[0] == "tests":
+            return cache.test(int(parts[1]))
+        if len(parts) == 2 and parts[0] == "cycles":
+            return cache.cycle(int(parts[1]))
+        if len(parts) == 3 and parts[0] == "cycles" and parts[2] == "data":
+            return cache.cycle_data(int(parts[1]))
+        if parts == ["search"]:
+            return self._search(query)
+        if parts == ["stats"]:
+            return _encode(cache.cache_stats())
+        raise NotFound("Unknown endpoint.")
+
+    def _search(self, query):
+        value = lambda name: query.get(name, [None])[0]
+        filters = {name: value(name) for name in SEARCH_FILTERS if value(name)}
+        if "battery_id" in filters:
+            filters["battery_id"] = int(filters["battery_id"])
+        metrics = {}
+        for column in SEARCHABLE_METRICS:
+            low, high = value(f"{column}_min"), value(f"{column}_max")
+            if low is not None or high is not None:
+                metrics[column] = (float(low) if low is not None else None, float(high) if high is not None else None)
+        if metrics:
+            filters["metrics"] = metrics
+        after = value("after")
+        if after:
+            epoch, cycle_id = after.split(",")
+            after = (int(epoch), int(cycle_id))
+        return self.cache.search(filters, after, min(int(value("limit") or 200), 5000))
+
+    def _serve_live(self):
+        key = self.headers.get("Sec-WebSocket-Key")
+        if self.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self._error(426, "Connect with a WebSocket client.")
+            return
+        if self.feed is None:
+            self._error(404, "The live stream is only available while the GUI is running.")
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("ascii")).digest()).decode("ascii")
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+
+        subscriber = self.feed.subscribe()
+        try:
+            while True:
+                try:
+                    frame = _ws_frame(subscriber.get(timeout=WS_PING_S))
+                except queue.Empty:
+                    # Pings find clients that went away without closing
+                    frame = _ws_frame(b"", opcode=0x9)
+                self.wfile.write(frame)
+                self.wfile.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.feed.unsubscribe(subscriber)
+            self.close_connection = True
+
+
+class ReadApiServer:
+    """Runs the read API on localhost in daemon threads. `feed` is None when running standalone."""
+    def __init__(self, port, host="127.0.0.1", log=print, live=True, samples_pending=None):
+        self.cache = HistoryCache(log, samples_pending)
+        self.feed = LiveFeed() if live else None
+        handler = type("ApiRequestHandler", (_ApiRequestHandler,), {"cache": self.cache, "feed": self.feed})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def publish(self, event):
+        if self.feed is not None:
+            self.feed.publish(event)
+
+    def invalidate(self):
+        self.cache.invalidate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the test history over a local HTTP API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind; keep the default unless the network is trusted.")
+    parser.add_argument("--db", default=data_handler.DB_FILE, help="Path to the history database.")
+    args = parser.parse_args()
+
+    data_handler.DB_FILE = args.db
+    server = ReadApiServer(args.port, args.host, live=False)
+    print(f"INFO: Serving {args.db} at {server.address}/api (Ctrl+C to stop)")
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
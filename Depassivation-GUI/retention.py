@@ -0,0 +1,254 @@
+"""
+Retention and compaction of stored samples.
+
+The policy (the "retention" entry of config.json) decides how long samples are kept:
+  raw_days       - cycles younger than this keep every sample
+  downsample_ms  - older cycles keep one sample per bucket of this width (the lowest
+                   voltage in the bucket), plus their first and last sample
+  purge_days     - optional; cycles older than this keep no samples at all
+Cycle rows, their results and analytics are always kept; analytics still missing
+are computed from the raw samples before a cycle is compacted. retention_level
+records what was done to each cycle, so every cycle is processed once per level.
+Cycles stored in sample files (sample_files.py) move their kept samples into
+`readings` when compacted, and the file is deleted. Compacted tests are queued for
+the fleet report (fleet_report.py), whose cached last voltages may have changed.
+
+Work runs in short transactions of a few cycles, so an acquisition writing at the
+same time only ever waits for one chunk. Freed pages are returned to the file
+system with incremental vacuum after each chunk; databases created before
+auto_vacuum was enabled need a one-time conversion (--convert, a full VACUUM).
+
+    python retention.py [--raw-days 90] [--downsample-ms 1000] [--purge-days 730] [--dry-run] [--convert]
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from data_handler import DB_FILE, CYCLE_ANALYTICS_COLUMNS, RETENTION_COLUMNS, ensure_columns
+from cycle_analytics import ANALYTICS_VERSION, METRIC_NAMES, compute_cycle_metrics
+import fleet_report
+import sample_files
+
+RETENTION_RAW = 0
+RETENTION_DOWNSAMPLED = 1
+RETENTION_PURGED = 2
+
+DEFAULT_POLICY = {
+    "enabled": True,
+    "raw_days": 90,
+    "downsample_ms": 1000,
+    "purge_days": None,
+}
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# Keeps, per bucket of ? ms, the row with the lowest voltage, plus each cycle's first and last row
+DOWNSAMPLE_SQL = """
+    DELETE FROM readings
+    WHERE cycle_id IN ({ids}) AND id NOT IN (
+        SELECT id FROM (
+            SELECT id,
+                   ROW_NUMBER() OVER (PARTITION BY cycle_id, timestamp_ms / ? ORDER BY voltage, timestamp_ms) AS bucket_rank,
+                   ROW_NUMBER() OVER (PARTITION BY cycle_id ORDER BY timestamp_ms) AS first_rank,
+                   ROW_NUMBER() OVER (PARTITION BY cycle_id ORDER BY timestamp_ms DESC) AS last_rank
+            FROM readings WHERE cycle_id IN ({ids})
+        ) WHERE bucket_rank = 1 OR first_rank = 1 OR last_rank = 1
+    )
+"""
+
+
+def policy_from_config(config):
+    """Returns the retention policy from a loaded config.json dict, filled in with the defaults."""
+    policy = dict(DEFAULT_POLICY)
+    policy.update(config.get("retention") or {})
+    return policy
+
+
+def auto_vacuum_mode(conn):
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+
+def convert_to_incremental(conn):
+    """Switches an existing database to incremental auto-vacuum. Rewrites the whole file."""
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+def _incremental_vacuum(conn):
+    """Hands every free page back to the file system. Returns the number of pages freed."""
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # execute() would step the pragma only once, freeing a single page; executescript() runs it to completion
+    conn.executescript("PRAGMA incremental_vacuum;")
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def pending_cycles(conn, policy, now=None):
+    """Returns [(cycle_id, target_level)] for every cycle the policy has not been applied to, oldest first."""
+    now = time.time() if now is None else now
+    raw_cutoff = int(now - policy["raw_days"] * 86400)
+    purge_cutoff = int(now - policy["purge_days"] * 86400) if policy.get("purge_days") else -1
+    return conn.execute(
+        """SELECT id, target FROM (
+               SELECT id, timestamp_epoch, retention_level,
+                      CASE WHEN timestamp_epoch < ? THEN ? ELSE ? END AS target
+               FROM cycles WHERE timestamp_epoch < ?
+           ) WHERE retention_level < target
+           ORDER BY timestamp_epoch, id""",
+        (purge_cutoff, RETENTION_PURGED, RETENTION_DOWNSAMPLED, raw_cutoff)
+    ).fetchall()
+
+
+def _ensure_analytics(conn, cycle_ids):
+    """Computes analytics from the raw samples for cycles that do not have current ones yet."""
+    placeholders = ",".join("?" * len(cycle_ids))
+    todo = dict(conn.execute(
+        f"""SELECT id, pass_fail_voltage FROM cycles WHERE id IN ({placeholders})
+            AND (analytics_version IS NULL OR analytics_version < ?)""",
+        list(cycle_ids) + [ANALYTICS_VERSION]
+    ).fetchall())
+    assignments = ", ".join(f"{name} = ?" for name in METRIC_NAMES)
+    for cycle_id, threshold in todo.items():
+        timestamps, voltages, currents = sample_files.read_samples(conn, cycle_id)
+        metrics = compute_cycle_metrics(timestamps / 1000.0, voltages, currents, threshold)
+        conn.execute(f"UPDATE cycles SET {assignments}, analytics_version = ? WHERE id = ?",
+                     [metrics.get(name) for name in METRIC_NAMES] + [ANALYTICS_VERSION, cycle_id])
+
+
+def downsample_samples(timestamps, voltages, bucket_ms):
+    """Indexes of the samples DOWNSAMPLE_SQL keeps: the lowest voltage per bucket, plus the first and last sample."""
+    if len(timestamps) == 0:
+        return np.zeros(0, dtype=np.int64)
+    buckets = np.asarray(timestamps) // bucket_ms
+    order = np.lexsort((timestamps, voltages, buckets))
+    ranked = buckets[order]
+    lowest = order[np.r_[True, ranked[1:] != ranked[:-1]]]
+    return np.union1d(lowest, [int(np.argmin(timestamps)), int(np.argmax(timestamps))])
+
+
+def _inline_sample_files(conn, chunk, bucket_ms):
+    """Moves what the policy keeps of file-backed cycles into readings and unregisters their files."""
+    in_files = sample_files.file_backed(conn, [cycle_id for cycle_id, _ in chunk])
+    for cycle_id, target in chunk:
+        if cycle_id not in in_files or target != RETENTION_DOWNSAMPLED:
+            continue
+        timestamps, voltages, currents = sample_files.read_samples(conn, cycle_id)
+        keep = downsample_samples(timestamps, voltages, bucket_ms)
+        conn.executemany("INSERT INTO readings (cycle_id, timestamp_ms, voltage, current) VALUES (?, ?, ?, ?)",
+                         zip([cycle_id] * len(keep), timestamps[keep].tolist(), voltages[keep].tolist(), currents[keep].tolist()))
+    sample_files.drop(conn, in_files)
+    return len(in_files)
+
+
+def compact_chunk(conn, chunk, policy):
+    """Applies the policy to one chunk of (cycle_id, target_level) in a single transaction. Returns rows deleted."""
+    deleted = 0
+    bucket_ms = max(int(policy["downsample_ms"]), 1)
+    with conn:
+        _ensure_analytics(conn, [cycle_id for cycle_id, _ in chunk])
+        inlined = _inline_sample_files(conn, chunk, bucket_ms)
+        for level in (RETENTION_DOWNSAMPLED, RETENTION_PURGED):
+            ids = [cycle_id for cycle_id, target in chunk if target == level]
+            if not ids:
+                continue
+            placeholders = ",".join("?" * len(ids))
+            if level == RETENTION_PURGED:
+                cursor = conn.execute(f"DELETE FROM readings WHERE cycle_id IN ({placeholders})", ids)
+            else:
+                sql = DOWNSAMPLE_SQL.format(ids=placeholders)
+                cursor = conn.execute(sql, ids + [bucket_ms] + ids)
+            deleted += cursor.rowcount
+            conn.execute(f"UPDATE cycles SET retention_level = ? WHERE id IN ({placeholders})", [level] + ids)
+        fleet_report.mark_dirty(conn, [cycle_id for cycle_id, _ in chunk])
+    if inlined:
+        sample_files.remove_orphans(conn)
+    return deleted
+
+
+def apply_retention(db_file=DB_FILE, policy=None, chunk_size=20, pause_s=0.05,
+                    should_stop=None, busy=None, progress=None, dry_run=False):
+    """
+    Applies the retention policy to every pending cycle, chunk by chunk.
+    should_stop() ends the job between chunks; while busy() is true the job waits,
+    so it can step aside for a running acquisition. Returns a summary dict.
+    """
+    policy = policy or DEFAULT_POLICY
+    summary = {"cycles": 0, "downsampled": 0, "purged": 0, "rows_deleted": 0,
+               "pages_freed": 0, "incremental_vacuum": False}
+    conn = sqlite3.connect(db_file, timeout=30)
+    try:
+        conn.execute("PRAGMA foreign_keys = ON")
+        with conn:
+            ensure_columns(conn.cursor(), "cycles", CYCLE_ANALYTICS_COLUMNS)
+            ensure_columns(conn.cursor(), "cycles", RETENTION_COLUMNS)
+        summary["incremental_vacuum"] = auto_vacuum_mode(conn) == AUTO_VACUUM_INCREMENTAL
+        pending = pending_cycles(conn, policy)
+        summary["cycles"] = len(pending)
+        summary["downsampled"] = sum(1 for _, level in pending if level == RETENTION_DOWNSAMPLED)
+        summary["purged"] = len(pending) - summary["downsampled"]
+        if dry_run:
+            return summary
+
+        chunks = [pending[k:k + chunk_size] for k in range(0, len(pending), chunk_size)]
+        for done, chunk in enumerate(chunks, 1):
+            while busy and busy():
+                if should_stop and should_stop():
+                    return summary
+                time.sleep(1.0)
+            if should_stop and should_stop():
+                break
+            summary["rows_deleted"] += compact_chunk(conn, chunk, policy)
+            if summary["incremental_vacuum"]:
+                summary["pages_freed"] += _incremental_vacuum(conn)
+            if progress:
+                progress(done, len(chunks))
+            time.sleep(pause_s)
+    finally:
+        conn.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Downsample or purge old samples according to the retention policy.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--raw-days", type=float, default=DEFAULT_POLICY["raw_days"], help="Keep every sample for this many days.")
+    parser.add_argument("--downsample-ms", type=int, default=DEFAULT_POLICY["downsample_ms"], help="Bucket width for older cycles, in ms.")
+    parser.add_argument("--purge-days", type=float, default=None, help="Drop all samples of cycles older than this (metrics are kept).")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be compacted.")
+    parser.add_argument("--convert", action="store_true", help="Enable incremental auto-vacuum on an existing database (full VACUUM).")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+    if args.purge_days is not None and args.purge_days < args.raw_days:
+        print("ERROR: --purge-days must not be shorter than --raw-days.")
+        return
+
+    if args.convert:
+        conn = sqlite3.connect(args.db)
+        try:
+            if auto_vacuum_mode(conn) != AUTO_VACUUM_INCREMENTAL:
+                print("INFO: Converting the database to incremental auto-vacuum...")
+                convert_to_incremental(conn)
+        finally:
+            conn.close()
+
+    def report(done, total):
+        print(f"\rCompacting chunk {done}/{total}...", end="", flush=True)
+
+    policy = {"raw_days": args.raw_days, "downsample_ms": args.downsample_ms, "purge_days": args.purge_days}
+    summary = apply_retention(args.db, policy, progress=report, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"INFO: {summary['downsampled']} cycle(s) would be downsampled and {summary['purged']} purged.")
+        return
+    print(f"\nINFO: Downsampled {summary['downsampled']} and purged {summary['purged']} cycle(s), "
+          f"deleting {summary['rows_deleted']} sample(s); {summary['pages_freed']} page(s) freed.")
+    if not summary["incremental_vacuum"]:
+        print("INFO: Auto-vacuum is off for this database, so the file will not shrink; run once with --convert.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Memory-mapped sample files for long cycles.
+
+With "sample_storage": "files" in config.json, each new cycle stores its
+samples in its own fixed-record binary file instead of rows in `readings`:
+
+    <database>_samples/cycle_<id>.samples
+    a 16-byte header (magic, cycle id), then RECORD_DTYPE records in arrival order
+
+SQLite keeps only the metadata, in cycle_sample_files: the file name, the
+offset of the first record, how many records are committed, and the first and
+last timestamp and last voltage, so listings and the fleet report never open
+the file. read_samples() maps the file with numpy.memmap and returns views, so
+plotting, analytics and exports page in only what they touch; a time range is
+found by binary search on the timestamp column. Cycles without a file are read
+from `readings`, so callers do not need to know how a cycle was stored.
+
+Appends follow the ingestion journal: records are written and fsynced, then
+record_count is committed in the same transaction as the journal checkpoint.
+Bytes past record_count belong to an append that never committed; they are
+cut off before the next write, so replaying the journal is idempotent. Each
+append costs an fsync, which only pays off for the journal's batches (the
+GUI's or the acquisition process's): with "ingest_journal": false the GUI
+stores new cycles in `readings` instead.
+
+Deleting a test or battery, and retention, remove the cycle_sample_files rows
+with their cycles; remove_orphans() then deletes the files no row refers to.
+
+    python sample_files.py [--db depassivation_history.db] [--clean]
+"""
+import argparse
+import os
+import sqlite3
+import struct
+
+import numpy as np
+
+MAGIC = b"DPSMPL01"
+HEADER = struct.Struct("<8sq")
+RECORD_DTYPE = np.dtype([("timestamp_ms", "<i8"), ("voltage", "<f8"), ("current", "<f8")])
+FILE_PATTERN = "cycle_{}.samples"
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cycle_sample_files (
+        cycle_id INTEGER PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        data_offset INTEGER NOT NULL,
+        record_count INTEGER NOT NULL DEFAULT 0,
+        first_ms INTEGER,
+        last_ms INTEGER,
+        last_voltage REAL,
+        ordered INTEGER NOT NULL DEFAULT 1,
+        FOREIGN KEY (cycle_id) REFERENCES cycles (id) ON DELETE CASCADE
+    )
+"""
+
+
+def ensure_table(conn):
+    conn.execute(SCHEMA)
+
+
+def samples_dir(conn):
+    """Directory of the sample files of the database `conn` is connected to."""
+    db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.splitext(db_path)[0] + "_samples"
+
+
+def _file_rows(conn, cycle_ids):
+    """cycle_id -> (file_name, data_offset, record_count, last_ms, ordered) for the file-backed cycles among cycle_ids."""
+    ids = list(cycle_ids)
+    if not ids:
+        return {}
+    placeholders = ",".join("?" * len(ids))
+    try:
+        rows = conn.execute(f"""SELECT cycle_id, file_name, data_offset, record_count, last_ms, ordered
+                                FROM cycle_sample_files WHERE cycle_id IN ({placeholders})""", ids).fetchall()
+    except sqlite3.OperationalError:
+        return {}   # a database from before sample files existed
+    return {row[0]: row[1:] for row in rows}
+
+
+def file_backed(conn, cycle_ids):
+    """The subset of cycle_ids whose samples live in files."""
+    return set(_file_rows(conn, cycle_ids))
+
+
+def create(conn, cycle_id):
+    """Starts the sample file of a new cycle and registers it; committed with the caller's transaction."""
+    directory = samples_dir(conn)
+    os.makedirs(directory, exist_ok=True)
+    file_name = FILE_PATTERN.format(cycle_id)
+    with open(os.path.join(directory, file_name), "wb") as f:
+        f.write(HEADER.pack(MAGIC, cycle_id))
+        f.flush()
+        os.fsync(f.fileno())
+    conn.execute("INSERT OR REPLACE INTO cycle_sample_files (cycle_id, file_name, data_offset) VALUES (?, ?, ?)",
+                 (cycle_id, file_name, HEADER.size))
+
+
+def store(conn, records):
+    """
+    Appends the (cycle_id, timestamp_ms, voltage, current) records of file-backed
+    cycles to their files and updates their rows (uncommitted). Returns the
+    records of the other cycles, in order, for the readings table.
+    """
+    rows = _file_rows(conn, {record[0] for record in records})
+    if not rows:
+        return records
+    rest = []
+    batches = {}
+    for record in records:
+        if record[0] in rows:
+            batches.setdefault(record[0], []).append(record[1:])
+        else:
+            rest.append(record)
+    directory = samples_dir(conn)
+    for cycle_id, batch in batches.items():
+        _append(conn, directory, cycle_id, rows[cycle_id], np.array(batch, dtype=RECORD_DTYPE))
+    return rest
+
+
+def _append(conn, directory, cycle_id, row, data):
+    file_name, data_offset, count, last_ms, ordered = row
+    committed = data_offset + count * RECORD_DTYPE.itemsize
+    with open(os.path.join(directory, file_name), "r+b") as f:
+        # Drops what an append that never committed left behind
+        f.truncate(committed)
+        f.seek(committed)
+        f.write(data.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    timestamps = data["timestamp_ms"]
+    in_order = ordered and (last_ms is None or timestamps[0] >= last_ms) and bool(np.all(np.diff(timestamps) >= 0))
+    conn.execute("""UPDATE cycle_sample_files
+                    SET record_count = record_count + ?, first_ms = COALESCE(first_ms, ?), last_ms = ?, last_voltage = ?, ordered = ?
+                    WHERE cycle_id = ?""",
+                 (len(data), int(timestamps[0]), int(timestamps[-1]), float(data["voltage"][-1]), int(in_order), cycle_id))
+
+
+def read_samples(conn, cycle_id, start_ms=None, end_ms=None):
+    """
+    (timestamp_ms, voltage, current) arrays of a cycle in time order, limited to
+    start_ms <= t < end_ms if given. For file-backed cycles they are views of a
+    read-only memmap: nothing is read until it is used.
+    """
+    row = _file_rows(conn, [cycle_id]).get(cycle_id)
+    if row is None:
+        clauses, params = ["cycle_id = ?"], [cycle_id]
+        if start_ms is not None:
+            clauses.append("timestamp_ms >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            clauses.append("timestamp_ms < ?")
+            params.append(end_ms)
+        table = np.array(conn.execute(
+            f"SELECT timestamp_ms, voltage, current FROM readings WHERE {' AND '.join(clauses)} ORDER BY timestamp_ms ASC",
+            params).fetchall(), dtype=float).reshape(-1, 3)
+        return table[:, 0].astype(np.int64), table[:, 1], table[:, 2]
+
+    file_name, data_offset, count, _, ordered = row
+    path = os.path.join(samples_dir(conn), file_name)
+    # A truncated file (see verify) yields what it still holds
+    count = min(count, max(os.path.getsize(path) - data_offset, 0) // RECORD_DTYPE.itemsize) if os.path.exists(path) else 0
+    if count == 0:
+        empty = np.zeros(0, dtype=RECORD_DTYPE)
+        return empty["timestamp_ms"], empty["voltage"], empty["current"]
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=data_offset, shape=(count,))
+    if not ordered:
+        # Samples arrived out of order; rare enough that sorting a copy is fine
+        records = records[np.argsort(records["timestamp_ms"], kind="stable")]
+    timestamps = records["timestamp_ms"]
+    first = 0 if start_ms is None else int(np.searchsorted(timestamps, start_ms, side="left"))
+    last = count if end_ms is None else int(np.searchsorted(timestamps, end_ms, side="left"))
+    records = records[first:last]
+    return records["timestamp_ms"], records["voltage"], records["current"]
+
+
+def drop(conn, cycle_ids):
+    """Unregisters the files of cycle_ids (uncommitted); remove_orphans() deletes them after the commit."""
+    ids = list(cycle_ids)
+    if ids:
+        conn.execute(f"DELETE FROM cycle_sample_files WHERE cycle_id IN ({','.join('?' * len(ids))})", ids)
+
+
+def _file_cycle_id(path):
+    """The cycle id in a sample file's header, or None if it is not a sample file."""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, cycle_id = HEADER.unpack(header)
+    return cycle_id if magic == MAGIC else None
+
+
+def remove_orphans(conn):
+    """Deletes sample files no cycle_sample_files row refers to. Returns (removed, kept_in_use) file names."""
+    directory = samples_dir(conn)
+    if not os.path.isdir(directory):
+        return [], []
+    try:
+        registered = {name for (name,) in conn.execute("SELECT file_name FROM cycle_sample_files")}
+    except sqlite3.OperationalError:
+        registered = set()
+    removed, kept = [], []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        # Only files this module wrote are ever deleted
+        if name in registered or _file_cycle_id(path) is None:
+            continue
+        try:
+            os.remove(path)
+            removed.append(name)
+        except OSError:
+            kept.append(name)   # still mapped (Windows); the next cleanup removes it
+    return removed, kept
+
+
+def verify(conn):
+    """Checks every registered file against its row. Returns [(cycle_id, problem)]; empty when all is well."""
+    directory = samples_dir(conn)
+    problems = []
+    try:
+        rows = conn.execute("SELECT cycle_id, file_name, data_offset, record_count FROM cycle_sample_files").fetchall()
+    except sqlite3.OperationalError:
+        return problems
+    for cycle_id, file_name, data_offset, count in rows:
+        path = os.path.join(directory, file_name)
+        if not os.path.exists(path):
+            problems.append((cycle_id, f"{file_name} is missing"))
+            continue
+        if _file_cycle_id(path) != cycle_id:
+            problems.append((cycle_id, f"{file_name} does not hold the samples of cycle {cycle_id}"))
+            continue
+        size = os.path.getsize(path)
+        expected = data_offset + count * RECORD_DTYPE.itemsize
+        if size < expected:
+            problems.append((cycle_id, f"{file_name} is truncated: {(size - data_offset) // RECORD_DTYPE.itemsize} of {count} samples"))
+        elif size > expected:
+            # Harmless: an append that did not commit, cut off on the next write
+            problems.append((cycle_id, f"{file_name} has {size - expected} uncommitted trailing bytes"))
+    return problems
+
+
+def main():
+    from data_handler import DB_FILE
+    parser = argparse.ArgumentParser(description="Check the sample files against the database and remove orphaned ones.")
+    parser.add_argument("--db", default=DB_FILE, help="Path to the history database.")
+    parser.add_argument("--clean", action="store_true", help="Delete sample files that belong to no cycle.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"ERROR: Database file '{args.db}' not found.")
+        return
+    conn = sqlite3.connect(args.db)
+    try:
+        problems = verify(conn)
+        for cycle_id, problem in problems:
+            print(f"Cycle {cycle_id}: {problem}")
+        print(f"{len(problems)} problem(s) found in {samples_dir(conn)}.")
+        if args.clean:
+            removed, kept = remove_orphans(conn)
+            print(f"Removed {len(removed)} orphaned file(s)" + (f"; {len(kept)} in use were kept." if kept else "."))
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Queue of Baseline -> Depassivation -> Check sequences run back to back.
+
+The scheduler only decides what runs next and when; the app starts each cycle
+and reports its end via on_cycle_finished(), which is driven by PROCESS_END.
+Timing goes through an `after(ms, callback)` function (Tk's root.after in the
+app), so the same code drives the hardware and the simulator.
+"""
+import time
+from collections import deque
+
+SEQUENCE_STEPS = ("Baseline", "Depassivation", "Check")
+
+# Results that end a battery's sequence instead of moving on to its next step
+FAILED_RESULTS = ("ABORTED", "NO DATA")
+
+
+class SequenceJob:
+    """One battery's sequence: a list of (cycle_type, duration_s) steps."""
+    def __init__(self, battery_id, battery_name, steps):
+        self.battery_id = battery_id
+        self.battery_name = battery_name
+        self.steps = list(steps)
+        self.step_index = 0
+        self.test_id = None
+        self.status = "Queued"
+        self.results = []
+
+    @property
+    def current_step(self):
+        return self.steps[self.step_index] if self.step_index < len(self.steps) else None
+
+    def remaining_s(self):
+        return sum(duration for _, duration in self.steps[self.step_index:])
+
+
+class SequenceScheduler:
+    """
+    Runs queued SequenceJobs one cycle at a time.
+    start_cycle(job, cycle_type, duration_s) must start the cycle and return True,
+    or return False if it could not (the scheduler then pauses).
+    """
+    def __init__(self, after, after_cancel, start_cycle, log=print):
+        self.after = after
+        self.after_cancel = after_cancel
+        self.start_cycle = start_cycle
+        self.log = log
+        self.queue = deque()
+        self.finished = []
+        self.current = None
+        self.rest_between_cycles_s = 30.0
+        self.rest_between_batteries_s = 60.0
+        self.running = False
+        self.state = "Idle"        # Idle, Running, Resting, Paused
+        self._timer = None
+        self._cycle_started_at = None
+        self._planned_duration = None
+        self.reset_statistics()
+
+    def reset_statistics(self):
+        self.started_at = None
+        self.busy_s = 0.0          # wall time with a cycle running
+        self.cycles_completed = 0
+        self.overhead_s = 0.0      # actual minus planned cycle time, summed
+
+    # --- Queue management ---
+    def enqueue(self, battery_id, battery_name, steps):
+        job = SequenceJob(battery_id, battery_name, steps)
+        self.queue.append(job)
+        return job
+
+    def clear(self):
+        """Drops every queued job that has not started yet."""
+        self.queue.clear()
+
+    @property
+    def jobs(self):
+        """Current job (if any), then queued jobs, then finished ones."""
+        return ([self.current] if self.current else []) + list(self.queue) + self.finished
+
+    # --- Control ---
+    def start(self):
+        if self.running:
+            return
+        if self.current is None and not self.queue:
+            self.log("WARN: Scheduler queue is empty.")
+            return
+        self.running = True
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        self.log("INFO: Scheduler started.")
+        if self._cycle_started_at is None:
+            self._run_next()
+
+    def pause(self, reason=None):
+        """Stops chaining; a cycle already running finishes normally."""
+        if not self.running:
+            return
+        self.running = False
+        self.state = "Paused"
+        self._cancel_timer()
+        self.log(f"INFO: Scheduler paused{': ' + reason if reason else ''}.")
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self.after_cancel(self._timer)
+            self._timer = None
+
+    def _run_next(self):
+        self._timer = None
+        if not self.running:
+            return
+        if self.current is None or self.current.current_step is None:
+            if self.current is not None:
+                self._finish_job("Done")
+            if not self.queue:
+                self.running = False
+                self.state = "Idle"
+                self.log("INFO: Scheduler finished all queued sequences.")
+                return
+            self.current = self.queue.popleft()
+            self.current.status = "Running"
+
+        cycle_type, duration = self.current.current_step
+        if not self.start_cycle(self.current, cycle_type, duration):
+            self.pause(f"could not start {cycle_type} for {self.current.battery_name}")
+            return
+        self.state = "Running"
+        self.current.status = f"Running {cycle_type}"
+        self._cycle_started_at = time.monotonic()
+        self._planned_duration = duration
+
+    def _finish_job(self, status):
+        self.current.status = status
+        self.finished.append(self.current)
+        self.current = None
+
+    def on_cycle_finished(self, result):
+        """Called by the app when a cycle started by the scheduler has ended."""
+        if self._cycle_started_at is None or self.current is None:
+            return
+        elapsed = time.monotonic() - self._cycle_started_at
+        self.busy_s += elapsed
+        self.overhead_s += max(elapsed - self._planned_duration, 0.0)
+        self.cycles_completed += 1
+        self._cycle_started_at = None
+
+        job = self.current
+        job.results.append(result)
+        job.step_index += 1
+        if result in FAILED_RESULTS:
+            self.log(f"WARN: Sequence for {job.battery_name} stopped: {job.steps[job.step_index - 1][0]} cycle ended with {result}.")
+            job.step_index = len(job.steps)
+            self._finish_job(f"Stopped ({result})")
+
+        if not self.running:
+            return
+        more_steps = self.current is not None and self.current.current_step is not None
+        rest_s = self.rest_between_cycles_s if more_steps else self.rest_between_batteries_s
+        if not more_steps and not self.queue:
+            rest_s = 0.0
+        self.state = "Resting" if rest_s > 0 else "Running"
+        self._timer = self.after(int(rest_s * 1000), self._run_next)
+
+    # --- Statistics ---
+    def eta_s(self):
+        """Estimated seconds until the queue is done, including rests and observed per-cycle overhead."""
+        jobs = ([self.current] if self.current else []) + list(self.queue)
+        cycles_left = sum(len(job.steps) - job.step_index for job in jobs)
+        if cycles_left == 0:
+            return 0.0
+        overhead = self.overhead_s / self.cycles_completed if self.cycles_completed else 0.0
+        total = sum(job.remaining_s() for job in jobs) + cycles_left * overhead
+        # Rests between the remaining cycles of each job, then between jobs
+        total += sum(max(len(job.steps) - job.step_index - 1, 0) for job in jobs) * self.rest_between_cycles_s
+        total += max(len(jobs) - 1, 0) * self.rest_between_batteries_s
+        if self._cycle_started_at is not None:
+            total -= min(time.monotonic() - self._cycle_started_at, self._planned_duration)
+        return max(total, 0.0)
+
+    def utilization(self):
+        """Fraction of wall time since the scheduler started with a cycle running."""
+        if self.started_at is None:
+            return None
+        busy = self.busy_s
+        if self._cycle_started_at is not None:
+            busy += time.monotonic() - self._cycle_started_at
+        wall = time.monotonic() - self.started_at
+        return busy / wall if wall > 0 else None
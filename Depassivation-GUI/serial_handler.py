@@ -41,17 +41,26 @@ class SerialHandler:
     def read_from_serial(self):
         """
         Reads data from the serial port in a separate thread.
-        Handles potential decoding errors by ignoring invalid bytes.
+        Invalid bytes are decoded as U+FFFD so the line is counted as corrupt
+        (see stream_integrity) instead of being silently altered.
         """
         while self.is_running and self.serial_connection and self.serial_connection.is_open:
             try:
                 # Wait until there is data waiting in the serial buffer
                 if self.serial_connection.in_waiting > 0:
-                    # Use errors='ignore' to prevent crashes on invalid byte sequences
-                    line = self.serial_connection.readline().decode('utf-8', errors='ignore').strip()
+                    # errors='replace' never raises and leaves a mark where bytes were corrupt
+                    raw = self.serial_connection.readline()
+                    read_time = time.perf_counter()
+                    line = raw.decode('utf-8', errors='replace').strip()
                     if line:
+                        self.app.telemetry.lines_received += 1
                         # Schedule the data handling in the main GUI thread
-                        self.app.root.after(0, self.app.handle_serial_data, line)
+                        instrumentation = self.app.instrumentation
+                        if instrumentation.enabled:
+                            instrumentation.on_enqueue()
+                            self.app.root.after(0, self.app.handle_serial_data, line, read_time)
+                        else:
+                            self.app.root.after(0, self.app.handle_serial_data, line)
             except serial.SerialException:
                 # This can happen if the device is unplugged
                 self.app.log_message("ERROR: Ligação perdida. Por favor, reinicie a aplicação.")
@@ -59,6 +68,7 @@ class SerialHandler:
                 break
             except Exception as e:
                 # Catch any other unexpected errors
+                self.app.telemetry.read_errors += 1
                 self.app.log_message(f"ERROR: Erro inesperado na leitura serial: {e}")
 
             time.sleep(0.01) # Small delay to prevent high CPU usage
@@ -1,19 +1,158 @@
+import math
 import threading
 import time
 import random
 
+import numpy as np
+
+from pulse_profiles import MAX_STEPS, ProfileStep, load_state, total_duration_ms
+from stream_integrity import frame
+
 class SimulationHandler:
     """
     Simulates the ESP32 hardware for testing the GUI without a physical device.
     It runs in a separate thread and sends data back to the main app via a callback.
     """
-    def __init__(self, app):
+    PLATEAU_VOLTAGE = 3.35
+    OPEN_CIRCUIT_VOLTAGE = 3.65
+    LOAD_RESISTANCE_OHM = 22.0
+    # Each load connection cracks the passivation layer a little, so pulsed profiles clear it faster
+    PASSIVATION_LOSS_PER_PULSE = 0.01
+    # Burst capture: back-to-back INA219 reads take about 1.1 ms, and the voltage settles
+    # onto the dip with this time constant when the load closes
+    BURST_PERIOD_US = 1100
+    LOAD_SETTLE_TAU_S = 0.002
+    BURST_SAMPLES_PER_LINE = 8
+    # A simulated unplug lasts this long before the device is back
+    REPLUG_DELAY_S = 5.0
+
+    def __init__(self, app, speed=1.0, link_loss=0.0, unplug_after_s=None):
         self.app = app
+        self.speed = speed  # >1 runs simulated cycles faster than real time, for load tests
+        self.link_loss = link_loss  # share of sample lines dropped or corrupted on the way, to exercise loss tracking
+        self.unplug_after_s = unplug_after_s  # cycle time at which the link is lost (once), to exercise disconnects
+        self.connected = True
+        self.sequence = 0  # numbers samples like the firmware: from 0 per cycle and per live session
+        self.burst_window_ms = 0
+        self.passivation = random.uniform(0.6, 1.0)  # 1.0 = heavily passivated cell
+        self.rng = np.random.default_rng()
         self.is_running = False
         self.simulation_thread = None
+        self.live_mode = False
+        self.live_thread = None
+        self.mosfet_on = False
+        self.profile_steps = []        # profile stored on the "device"
+        self.profile_id = "NONE"
+        self.pending_steps = None      # download in progress: {index: ProfileStep}
+        self.pending_count = 0
+        self.pending_id = None
+
+    # --- Cell model, shared with benchmarks/generate_history.py ---
+    @staticmethod
+    def cell_dip(passivation):
+        """(dip in V, recovery time constant in s) of a cell; the deeper the passivation, the deeper and slower."""
+        return 0.9 * passivation, 5.0 + 30.0 * passivation
+
+    @classmethod
+    def loaded_response(cls, load_time_s, dip, recovery_tau_s, rng, plateau=None):
+        """
+        Voltage (V) and current (mA) with sensor noise after load_time_s seconds under load.
+        load_time_s may be an array, to sample a whole cycle at once; rng is a numpy Generator.
+        """
+        plateau = cls.PLATEAU_VOLTAGE if plateau is None else plateau
+        t = np.asarray(load_time_s, dtype=float)
+        voltage = plateau - dip * np.exp(-t / recovery_tau_s) + rng.uniform(-0.003, 0.003, t.shape)
+        current = voltage / cls.LOAD_RESISTANCE_OHM * 1000.0 + rng.uniform(-1.0, 1.0, t.shape)
+        return voltage, current
+
+    @classmethod
+    def depassivated(cls, passivation, load_time_s, pulses=0):
+        """Passivation left after a cycle: time under load and every reconnection remove part of the layer."""
+        return passivation * math.exp(-load_time_s / 60.0) * (1.0 - cls.PASSIVATION_LOSS_PER_PULSE) ** pulses
+
+    def get_ports(self):
+        return []
+
+    def is_connected(self):
+        """The simulated device is available except during a simulated unplug."""
+        return self.connected
 
-    def start(self, duration_sec, pass_fail_voltage):
-        """Starts the simulation in a new thread."""
+    def disconnect(self):
+        self.is_running = False
+        self.live_mode = False
+
+    def send(self, data):
+        """Interprets the same serial commands the ESP32 firmware accepts."""
+        if not self.connected:
+            return False
+        command = data.strip()
+        if command.startswith("PROFILE_"):
+            self._handle_profile_command(command)
+        elif command.upper() == "START_PROFILE":
+            if not self.profile_steps:
+                self._emit("PROCESS_END: No profile loaded.")
+            else:
+                self.start(None, None, steps=self.profile_steps)
+        elif command.startswith("START"):
+            try:
+                duration_sec = int(command.split(',')[1])
+            except (IndexError, ValueError):
+                self.app.log_message(f"ERROR: Simulation received malformed command: {command}")
+                return False
+            self.start(duration_sec, None)
+        elif command.upper() == "ABORT":
+            if self.is_running:
+                self.abort()
+        elif command.startswith("SET_MODE"):
+            mode = command.split(',', 1)[-1].upper()
+            if mode == "LIVE":
+                self._start_live()
+            elif mode == "IDLE":
+                self.live_mode = False
+                self.mosfet_on = False
+        elif command.startswith("BURST,"):
+            try:
+                self.burst_window_ms = max(0, int(command.split(',')[1]))
+            except ValueError:
+                self.app.log_message(f"ERROR: Simulation received malformed command: {command}")
+                return False
+        elif command.startswith("SET_MOSFET") and self.live_mode:
+            self.mosfet_on = command.split(',', 1)[-1] == "1"
+        return True
+
+    def _handle_profile_command(self, command):
+        """Profile download commands, validated like the firmware does."""
+        parts = command.split(',')
+        try:
+            if parts[0] == "PROFILE_QUERY":
+                self._emit(f"PROFILE_LOADED,{self.profile_id}")
+            elif parts[0] == "PROFILE_BEGIN":
+                count = int(parts[1])
+                if not 1 <= count <= MAX_STEPS:
+                    raise ValueError("Invalid step count")
+                self.pending_steps, self.pending_count, self.pending_id = {}, count, parts[2]
+            elif parts[0] == "PROFILE_STEP":
+                index, on_ms, off_ms, count = (int(p) for p in parts[1:5])
+                if (self.pending_steps is None or not 0 <= index < self.pending_count
+                        or on_ms < 0 or off_ms < 0 or on_ms + off_ms == 0 or count < 1):
+                    raise ValueError("Invalid step")
+                self.pending_steps[index] = ProfileStep(on_ms, off_ms, count)
+            elif parts[0] == "PROFILE_END":
+                if self.pending_steps is None:
+                    raise ValueError("No download in progress")
+                missing = [i for i in range(self.pending_count) if i not in self.pending_steps]
+                if missing:
+                    raise ValueError(f"Missing step {missing[0]}")
+                self.profile_steps = [self.pending_steps[i] for i in range(self.pending_count)]
+                self.profile_id = self.pending_id
+                self.pending_steps = None
+                self._emit(f"PROFILE_OK,{self.profile_id},{total_duration_ms(self.profile_steps)}")
+        except (IndexError, ValueError) as e:
+            self.pending_steps = None
+            self._emit(f"PROFILE_ERROR,{e}")
+
+    def start(self, duration_sec, pass_fail_voltage, steps=None):
+        """Starts the simulation in a new thread; `steps` runs a load profile instead of a fixed duration."""
         if self.is_running:
             return
 
@@ -21,48 +160,163 @@ class SimulationHandler:
         # The 'daemon=True' ensures the thread will close when the main app closes.
         self.simulation_thread = threading.Thread(
             target=self._run_simulation,
-            args=(duration_sec, pass_fail_voltage),
+            args=(duration_sec, pass_fail_voltage, steps),
             daemon=True
         )
         self.simulation_thread.start()
 
+    def _emit(self, line):
+        """Hands a line to the GUI thread exactly like SerialHandler.read_from_serial does."""
+        self.app.telemetry.lines_received += 1
+        instrumentation = self.app.instrumentation
+        if instrumentation.enabled:
+            instrumentation.on_enqueue()
+            self.app.root.after(0, self.app.handle_serial_data, line, time.perf_counter())
+        else:
+            self.app.root.after(0, self.app.handle_serial_data, line)
+
+    def _emit_sample(self, payload):
+        """Emits a DATA or LIVE_DATA line with the firmware's sequence number and checksum."""
+        line = frame(payload, self.sequence)
+        self.sequence += 1
+        if self.link_loss and random.random() < self.link_loss:
+            if random.random() < 0.5:
+                return
+            k = random.randrange(len(payload))
+            line = line[:k] + "#" + line[k + 1:]
+        self._emit(line)
+
+    def _emit_burst(self, window_ms, dip, recovery_tau_s):
+        """Uploads a burst of the load-connect transient the way the firmware does."""
+        samples = []
+        for k in range(min(window_ms * 1000 // self.BURST_PERIOD_US, 4000)):
+            t_us = k * self.BURST_PERIOD_US + random.randint(0, 40)
+            t = t_us / 1e6
+            loaded = self.PLATEAU_VOLTAGE - dip * math.exp(-t / recovery_tau_s)
+            voltage = self.OPEN_CIRCUIT_VOLTAGE - (self.OPEN_CIRCUIT_VOLTAGE - loaded) * (1.0 - math.exp(-t / self.LOAD_SETTLE_TAU_S))
+            voltage += random.uniform(-0.003, 0.003)
+            current = voltage / self.LOAD_RESISTANCE_OHM * 1000.0 + random.uniform(-1.0, 1.0)
+            samples.append(f"{t_us}:{voltage:.3f}:{current:.2f}")
+        self._emit(f"BURST_BEGIN,{len(samples)},0")
+        for chunk, first in enumerate(range(0, len(samples), self.BURST_SAMPLES_PER_LINE)):
+            self._emit(frame(f"BURST_DATA,{first}," + ",".join(samples[first:first + self.BURST_SAMPLES_PER_LINE]), chunk))
+        self._emit(f"BURST_END,{len(samples)}")
+
+    def _start_live(self):
+        if self.live_mode:
+            return
+        self.live_mode = True
+        self.sequence = 0
+        self.live_thread = threading.Thread(target=self._run_live, daemon=True)
+        self.live_thread.start()
+
+    def _run_live(self):
+        """Streams LIVE_DATA at 10 Hz, like the firmware's LIVE_VIEW state."""
+        open_circuit_voltage = self.OPEN_CIRCUIT_VOLTAGE
+        while self.live_mode:
+            if self.mosfet_on:
+                current = 300.0 + random.uniform(-5.0, 5.0)
+                voltage = open_circuit_voltage - current * 0.0012 + random.uniform(-0.005, 0.005)
+                resistance = (voltage * 1000) / current
+            else:
+                current = random.uniform(0.0, 0.05)
+                voltage = open_circuit_voltage + random.uniform(-0.002, 0.002)
+                resistance = 0.0
+            power = voltage * current
+            data_string = f"LIVE_DATA,{voltage:.3f},{current:.2f},{power:.2f},{resistance:.2f}"
+            self._emit_sample(data_string)
+            time.sleep(0.1)
+
+    def _unplug(self):
+        """Drops the link mid-cycle the way a pulled USB cable does: no PROCESS_END, then a disconnect."""
+        self.unplug_after_s = None
+        self.connected = False
+        self.is_running = False
+        self.live_mode = False
+        self.app.log_message("ERROR: Simulated device unplugged.")
+        self.app.root.after(0, self.app.handle_disconnect)
+        self.app.root.after(int(self.REPLUG_DELAY_S * 1000), self._replug)
+
+    def _replug(self):
+        """Runs in the GUI thread."""
+        self.connected = True
+        self.app.log_message("INFO: Simulated device reconnected.")
+        self.app.status_var.set("Simulation Mode: Ready.")
+        self.app.on_battery_selected(None)
+
     def abort(self):
         """Stops the currently running simulation."""
         self.is_running = False
         self.app.log_message("INFO: Simulation aborted by user.")
 
-    def _run_simulation(self, duration_sec, pass_fail_voltage):
+    def _run_simulation(self, duration_sec, pass_fail_voltage, steps=None):
         """The main logic of the simulation, executed in a thread."""
         self.app.log_message("INFO: Starting hardware simulation...")
         
         # Notify the GUI that the process has started
-        self.app.root.after(0, self.app.handle_serial_data, "PROCESS_START")
+        self._emit("PROCESS_START")
+        self.sequence = 0
 
         start_time = time.time()
         time_elapsed_ms = 0
-        
-        # Simulate initial battery state
-        voltage = 3.85
-        current = 150.0
-
-        while self.is_running and time_elapsed_ms < (duration_sec * 1000):
-            # Simulate a realistic voltage drop and some noise
-            voltage -= random.uniform(0.005, 0.02) # Voltage drops over time
-            current = 150.0 + random.uniform(-5.0, 5.0) # Current fluctuates slightly
-            
-            # Ensure voltage doesn't go below a realistic floor
-            if voltage < 2.5:
-                voltage = 2.5
-            
-            time_elapsed_ms = int((time.time() - start_time) * 1000)
+        if steps:
+            duration_ms = total_duration_ms(steps)
+            interval_s = 0.1  # The firmware's 10 Hz, so individual pulses show up in the data
+        else:
+            duration_ms = duration_sec * 1000
+            interval_s = 1.0
+
+        # Passivated cell model: the voltage dips when the load connects and recovers
+        # exponentially towards its plateau; the deeper the passivation, the slower.
+        # Only time under load drives the recovery.
+        dip, recovery_tau_s = self.cell_dip(self.passivation)
+        load_on = True
+        load_time_s = 0.0
+        last_t = 0.0
+        step_index = None
+        burst_ms = min(self.burst_window_ms, steps[0].on_ms) if steps else self.burst_window_ms
+        if burst_ms:
+            self._emit_burst(burst_ms, dip, recovery_tau_s)
+        pulses = 0
+
+        while self.is_running and time_elapsed_ms < duration_ms:
+            time_elapsed_ms = int((time.time() - start_time) * 1000 * self.speed)
+            t = time_elapsed_ms / 1000.0
+            if self.unplug_after_s is not None and t >= self.unplug_after_s:
+                self._unplug()
+                return
+            if load_on:
+                load_time_s += t - last_t
+            last_t = t
+
+            if steps:
+                index, load_now = load_state(steps, time_elapsed_ms)
+                if index is None:
+                    break
+                # Markers carry the scheduled step start, like the firmware's
+                while step_index != index:
+                    step_index = 0 if step_index is None else step_index + 1
+                    self._emit(f"STEP,{total_duration_ms(steps[:step_index])},{step_index}")
+                if load_now and not load_on:
+                    pulses += 1
+                    dip *= 1.0 - self.PASSIVATION_LOSS_PER_PULSE
+                load_on = load_now
+
+            if load_on:
+                voltage, current = (float(x) for x in self.loaded_response(load_time_s, dip, recovery_tau_s, self.rng))
+            else:
+                voltage = self.OPEN_CIRCUIT_VOLTAGE + random.uniform(-0.002, 0.002)
+                current = random.uniform(0.0, 0.05)
 
             # Format the data exactly like the ESP32 does
             data_string = f"DATA,{time_elapsed_ms},{voltage:.3f},{current:.1f}"
             
             # Use root.after() to safely send the data back to the main GUI thread
-            self.app.root.after(0, self.app.handle_serial_data, data_string)
+            self._emit_sample(data_string)
+
+            time.sleep(interval_s / self.speed)
 
-            time.sleep(1) # Wait 1 second between measurements, just like the firmware
+        self.passivation = self.depassivated(self.passivation, load_time_s, pulses)
 
         # Notify the GUI that the process has ended
         if self.is_running:
@@ -70,5 +324,6 @@ class SimulationHandler:
         else:
             end_message = "PROCESS_END: Simulation aborted by user."
             
-        self.app.root.after(0, self.app.handle_serial_data, end_message)
+        # Like the firmware, PROCESS_END carries the number of samples sent
+        self._emit(frame(end_message, self.sequence))
         self.is_running = False
@@ -0,0 +1,147 @@
+"""
+Integrity of the sample stream sent by the device.
+
+The firmware ends every DATA and LIVE_DATA line, and PROCESS_END, with a
+trailer holding a sequence number and a checksum:
+
+    DATA,1200,3.215,146.20,470.04,21.99|12*A155
+    PROCESS_END: Process completed successfully.|305*EE17
+
+Samples are numbered from 0 at PROCESS_START and again on entering LIVE_VIEW;
+on PROCESS_END the number is the count of samples sent. The checksum is the
+CRC-16/CCITT-FALSE of everything before the '*', in hex, and may be left out
+("|12"). Lines without a trailer (older firmware) pass through untracked.
+
+StreamMonitor follows one stream (a cycle or a live session) and counts
+samples missing from the sequence, duplicates, corrupt lines and the
+effective sample rate. Serial is in order, so a sequence number that went
+backwards is a duplicate, unless it is far behind, which means the device
+restarted its count.
+"""
+import binascii
+
+TRAILER_SEPARATOR = "|"
+CHECKSUM_SEPARATOR = "*"
+SEQUENCE_MODULO = 1 << 32
+DUPLICATE_WINDOW = 1024
+REPLACEMENT_CHAR = "\ufffd"   # decode() puts this where bytes were invalid
+
+
+def checksum(text):
+    return binascii.crc_hqx(text.encode("utf-8"), 0xFFFF)
+
+
+def frame(payload, sequence, with_checksum=True):
+    """Appends the trailer the firmware sends."""
+    line = f"{payload}{TRAILER_SEPARATOR}{sequence}"
+    return f"{line}{CHECKSUM_SEPARATOR}{checksum(line):04X}" if with_checksum else line
+
+
+def unframe(line):
+    """
+    Splits a received line into (payload, sequence, intact). sequence is None
+    without a trailer; intact is False when the checksum does not match or the
+    line had bytes that did not decode.
+    """
+    payload, separator, trailer = line.rpartition(TRAILER_SEPARATOR)
+    if not separator:
+        return line, None, REPLACEMENT_CHAR not in line
+    sequence_text, has_checksum, checksum_text = trailer.partition(CHECKSUM_SEPARATOR)
+    try:
+        sequence = int(sequence_text)
+        if has_checksum:
+            signed = line[:len(payload) + 1 + len(sequence_text)]
+            if int(checksum_text, 16) != checksum(signed):
+                return payload, None, False
+    except ValueError:
+        return payload, None, False
+    return payload, sequence, REPLACEMENT_CHAR not in line
+
+
+class StreamMonitor:
+    """Loss statistics for one stream; every method runs in the Tk thread."""
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.next_sequence = None   # None until a sequenced sample arrived
+        self.received = 0
+        self.missing = 0
+        self.duplicates = 0
+        self.corrupt = 0
+        self.restarts = 0
+        self.first_t = None
+        self.last_t = None
+
+    @property
+    def tracked(self):
+        return self.next_sequence is not None
+
+    def accept(self, sequence, t):
+        """
+        Accounts for a sample taken at `t` seconds. Returns how many samples were
+        missing right before it, or None for a duplicate, which should be dropped.
+        """
+        gap = 0
+        if sequence is not None:
+            expected = self.next_sequence if self.tracked else 0
+            ahead = (sequence - expected) % SEQUENCE_MODULO
+            if ahead >= SEQUENCE_MODULO // 2:
+                if SEQUENCE_MODULO - ahead <= DUPLICATE_WINDOW:
+                    self.duplicates += 1
+                    return None
+                self.restarts += 1
+            else:
+                gap = ahead
+            self.missing += gap
+            self.next_sequence = (sequence + 1) % SEQUENCE_MODULO
+        self.received += 1
+        if self.first_t is None:
+            self.first_t = t
+        self.last_t = t
+        return gap
+
+    def end(self, sent):
+        """Accounts for samples lost after the last one received, given the count the device reports sending. Returns them."""
+        if sent is None:
+            return 0
+        expected = self.next_sequence if self.tracked else 0
+        lost = (sent - expected) % SEQUENCE_MODULO
+        if lost >= SEQUENCE_MODULO // 2:
+            return 0
+        self.missing += lost
+        if not self.tracked:
+            self.next_sequence = expected
+        return lost
+
+    @property
+    def completeness(self):
+        """Share of the samples the device sent that were stored; None for untracked streams."""
+        if not self.tracked or self.received + self.missing == 0:
+            return None
+        return self.received / (self.received + self.missing)
+
+    @property
+    def sample_rate_hz(self):
+        if self.received < 2 or self.last_t <= self.first_t:
+            return None
+        return (self.received - 1) / (self.last_t - self.first_t)
+
+    def summary(self):
+        """The values stored with a cycle (STREAM_COLUMNS)."""
+        return {
+            "samples_received": self.received,
+            "samples_missing": self.missing if self.tracked else None,
+            "samples_duplicate": self.duplicates,
+            "frames_corrupt": self.corrupt,
+            "completeness": self.completeness,
+            "sample_rate_hz": self.sample_rate_hz,
+        }
+
+    def describe(self):
+        rate = self.sample_rate_hz
+        rate_text = f", {rate:.1f} Hz" if rate is not None else ""
+        if self.completeness is None:
+            return f"Link: {self.received} samples{rate_text}" + (f", {self.corrupt} corrupt" if self.corrupt else "")
+        return (f"Link: {100.0 * self.completeness:.1f}% ({self.missing} missing, {self.duplicates} dup, "
+                f"{self.corrupt} corrupt){rate_text}")
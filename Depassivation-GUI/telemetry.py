@@ -0,0 +1,149 @@
+"""
+Station telemetry in Prometheus text format.
+
+StationMetrics holds plain counters that the acquisition path bumps in place:
+each counter has a single writer (the serial reader thread, the ingestion
+journal's applier thread for database writes while the journal is open, or the
+Tk thread for everything else), so no locks are taken and a hot-path update
+costs one attribute increment. A scrape only reads them.
+
+MetricsServer serves /metrics from a stdlib http.server on localhost in a
+daemon thread. Enable it with "metrics_port" in config.json or
+`python main.py --metrics-port 9464`. Rates such as samples per second are
+left to the dashboard, e.g. rate(depassivation_samples_stored_total[1m]).
+"""
+import bisect
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRIC_PREFIX = "depassivation_"
+# Upper bounds (s) of the DB write latency histogram buckets
+DB_WRITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+STATES = ("idle", "cycle", "live", "disconnected")
+
+
+class StationMetrics:
+    """Counters for one station; see the module docstring for the threading rules."""
+    def __init__(self, station=None):
+        self.station = station or socket.gethostname()
+        # Serial reader thread
+        self.lines_received = 0
+        self.read_errors = 0
+        # Tk thread
+        self.lines_dispatched = 0
+        self.lines_malformed = 0
+        self.lines_corrupt = 0
+        self.samples_missing = 0
+        self.samples_duplicate = 0
+        self.samples_outside_cycle = 0
+        # Database writes: the journal applier thread while the journal is open, else the Tk thread
+        self.samples_stored = 0
+        self.db_write_errors = 0
+        self.db_write_counts = [0] * (len(DB_WRITE_BUCKETS) + 1)
+        self.db_write_sum = 0.0
+        self.cycles_completed = {}   # result -> count
+        self.cycle_type = None
+        # Returns (state, connected); set by the app
+        self.state_source = lambda: ("idle", False)
+
+    def record_db_write(self, seconds):
+        self.db_write_counts[bisect.bisect_left(DB_WRITE_BUCKETS, seconds)] += 1
+        self.db_write_sum += seconds
+
+    def cycle_finished(self, result):
+        self.cycles_completed[result] = self.cycles_completed.get(result, 0) + 1
+        self.cycle_type = None
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        label = f'station="{_escape(self.station)}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+            for suffix, extra, value in samples:
+                labels = label + (f",{extra}" if extra else "")
+                lines.append(f"{METRIC_PREFIX}{name}{suffix}{{{labels}}} {value}")
+
+        metric("lines_received_total", "counter", "Lines read from the device.", [("", "", self.lines_received)])
+        metric("lines_dropped_total", "counter", "Lines that were not stored, by reason.", [
+            ("", 'reason="read_error"', self.read_errors),
+            ("", 'reason="malformed"', self.lines_malformed),
+            ("", 'reason="corrupt"', self.lines_corrupt),
+            ("", 'reason="duplicate"', self.samples_duplicate),
+            ("", 'reason="outside_cycle"', self.samples_outside_cycle),
+        ])
+        metric("samples_missing_total", "counter", "Samples the device sent that never arrived, from gaps in the sequence numbers.",
+               [("", "", self.samples_missing)])
+        metric("queue_depth", "gauge", "Lines read but not yet handled by the GUI thread.",
+               [("", "", max(self.lines_received - self.lines_dispatched, 0))])
+        metric("samples_stored_total", "counter", "Samples committed to the database.", [("", "", self.samples_stored)])
+        metric("db_write_errors_total", "counter",
+               "Failed database writes; a journal batch is retried, a direct sample write is lost.",
+               [("", "", self.db_write_errors)])
+
+        counts = list(self.db_write_counts)
+        buckets, cumulative = [], 0
+        for bound, count in zip(DB_WRITE_BUCKETS + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            buckets.append(("_bucket", f'le="{le}"', cumulative))
+        metric("db_write_seconds", "histogram",
+               "Latency of one database write and commit: a single sample, or one ingestion journal batch.",
+               buckets + [("_sum", "", self.db_write_sum), ("_count", "", cumulative)])
+
+        metric("cycles_completed_total", "counter", "Finished cycles, by result.",
+               [("", f'result="{_escape(result)}"', count) for result, count in sorted(self.cycles_completed.items())])
+        state, connected = self.state_source()
+        metric("state", "gauge", "Current station state (1 for the active one).",
+               [("", f'state="{s}"', int(s == state)) for s in STATES])
+        metric("connected", "gauge", "Whether the device connection is open.", [("", "", int(connected))])
+        metric("cycle_running", "gauge", "Cycle type currently running (1), if any.",
+               [("", f'cycle_type="{_escape(self.cycle_type)}"', 1)] if self.cycle_type else [])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood the console
+
+
+class MetricsServer:
+    """Serves a StationMetrics at http://<host>:<port>/metrics from a daemon thread."""
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        handler = type("MetricsRequestHandler", (_MetricsRequestHandler,), {"metrics": metrics})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()